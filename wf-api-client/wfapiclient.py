@@ -15,17 +15,27 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import ssl
 import sys
+import json
+import math
+import time
+import random
+import socket
+import threading
 import os.path
 import inspect
 import argparse
 from io import open
 from datetime import datetime
-from collections import OrderedDict
+from functools import partial, wraps
+from contextlib import contextmanager
+from collections import OrderedDict, deque, namedtuple
 
 if sys.version_info < (3,):
-    #Import compatible xmlrpc library.
+    #Import compatible xmlrpc and http libraries.
     import xmlrpclib as _xmlrpc
+    import httplib as _http_client
     
     #Import python2-compatible collections Iterable.
     from collections import Iterable as _Iterable
@@ -38,9 +48,16 @@ if sys.version_info < (3,):
     #Define python2-compatible string comparators.
     text_type = unicode
     binary_type = str    
+    
+    #Define python2-compatible signature inspection.
+    _getargspec = inspect.getargspec
+    
+    #Define python2-compatible high-resolution timer.
+    _perf_counter = time.time
 else:
-    #Import python3-compatible xmlrpc library.
+    #Import python3-compatible xmlrpc and http libraries.
     import xmlrpc.client as _xmlrpc
+    import http.client as _http_client
     
     #Import python3-compatible collections Iterable.
     from collections.abc import Iterable as _Iterable
@@ -52,24 +69,108 @@ else:
     #Define python3-compatible string comparators.
     text_type = str
     binary_type = bytes
+    
+    #Define python3-compatible signature inspection.
+    _getargspec = inspect.getfullargspec
+    
+    #Define python3-compatible high-resolution timer.
+    _perf_counter = time.perf_counter
 #/python version checks
 
+try:
+    #Import thread pool, which python2 only has via the `futures` backport.
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from concurrent.futures import wait as wait_for_futures
+    from concurrent.futures import FIRST_COMPLETED
+except ImportError:
+    Future = ThreadPoolExecutor = wait_for_futures = FIRST_COMPLETED = None
+#/concurrent.futures check
+
 
 BLANK_STR = u("")
 COMMA_SEP = u(", ")
 SUCCESS = u("success")
 FAILURE = u("failure")
+RETRY = u("retry")
 
 API_URL = u("https://api.webfaction.com/")
 
+INVENTORY_TTL = 300 #Seconds a cached `list_*` inventory is trusted.
+MULTICALL_BATCH_SIZE = 50 #Calls sent per `system.multicall` request.
+MAX_WORKERS = 8 #Concurrent API calls made by `Runner.parallel()`.
+FLEET_WORKERS = 16 #Accounts driven at once by a `FleetRunner`.
+POOL_SIZE = 4 #Idle keep-alive connections a `ConnectionPool` keeps per host.
+REPORT_FLUSH_INTERVAL = 1.0 #Seconds a streamed report may sit unflushed.
+HISTOGRAM_MIN = 1e-5 #Seconds covered by the first latency histogram bucket.
+HISTOGRAM_GROWTH = 1.1 #Width ratio of consecutive latency histogram buckets.
+RETRY_ATTEMPTS = 3 #Attempts a retryable API call gets before it fails.
+RETRY_BASE = 0.5 #Seconds of backoff before the first retry, doubled per retry.
+RETRY_CAP = 30.0 #Most seconds of backoff before any retry.
+RETRY_HTTP_STATUSES = (429, 500, 502, 503, 504) #Transient HTTP errors.
+CONNECT_TIMEOUT = 10.0 #Seconds allowed to open a connection to the API.
+READ_TIMEOUT = 120.0 #Seconds allowed to wait on the API's response.
+
+HOOK_BEFORE = u("before") #Hook events, see `Runner.add_hook`.
+HOOK_AFTER = u("after")
+HOOK_FAULT = u("fault")
+
+SECRET_PARAMETERS = (u('password'),) #Arguments hooks see as `REDACTED`.
+REDACTED = u("********")
+
+INVENTORY_ADD = u("add") #Bookkeeping an `ApiMethod` applies on success.
+INVENTORY_REMOVE = u("remove")
+INVENTORY_UPDATE = u("update")
+
+PLAN_CREATE = u("create") #Outcomes of calls planned by `Runner.plan()`.
+PLAN_UPDATE = u("update")
+PLAN_DELETE = u("delete")
+PLAN_SKIP_EXISTS = u("skip-exists")
+PLAN_FAIL_MISSING = u("would-fail-missing")
+PLAN_UNCHECKED = u("unchecked")
+
+SKIPPED = u("skipped") #Status of a `TaskGraph` task whose dependency failed.
+
+DNS_RECORD_TYPES = (u('a_ip'), #Record types a DNS override holds; an MX 
+                    u('cname'), #record's value is its `(mx_name, mx_priority)`.
+                    u('mx_name'),
+                    u('spf_record'),
+                    u('aaaa_ip'))
+
+SESSION_EXPIRED = u("SessionExpired") #Fault text of a call with a stale session.
+SESSION_FILE = os.path.join(os.path.expanduser(u("~")),
+                            u(".wfapiclient-sessions")) #Default `SessionCache`.
+
+INVENTORY_KEYS = {u('list_mailboxes'): u('mailbox'),
+                  u('list_emails'): u('email_address'),
+                  u('list_domains'): u('domain'),
+                  u('list_websites'): u('name'),
+                  u('list_apps'): u('name'),
+                  u('list_dbs'): u('name'),
+                  u('list_db_users'): u('username'),
+                  u('list_users'): u('username')}
+
+RFC_2142_PREFIXES = (u('www'),
+                     u('admin'),
+                     u('webmaster'),
+                     u('postmaster'),
+                     u('hostmaster'),
+                     u('info'),
+                     u('sales'),
+                     u('marketing'),
+                     u('support'),
+                     u('abuse'))
+
 HTML_START = u("""
 <!DOCTYPE html>
 <html>
   <head>
     <title>WebFaction API Run Results</title>
-    <style>ul#results {border: 2px ridge maroon; background-color: #ffffcc; padding: 0.25em 1.5em; margin-left: 0;}
+    <style>ul#results, ul.results {border: 2px ridge maroon; background-color: #ffffcc; padding: 0.25em 1.5em; margin-left: 0;}
            li.success {color: #006400;}
            li.failure {color: #dc143c; text-decoration: line-through;}
+           li.retry {color: #ff8c00;}
+           table#metrics {border-collapse: collapse;}
+           table#metrics th, table#metrics td {border: 1px solid maroon; padding: 0.1em 0.5em; text-align: right;}
     </style>
   </head>
   <body>
@@ -77,39 +178,71 @@ HTML_START = u("""
     <ul id="results">
 """)
 
-HTML_END = u("""    
+HTML_RESULTS_END = u("""    
     </ul>
-  </body>
+""")
+
+HTML_DOCUMENT_END = u("""  </body>
 </html>
 """)
 
+HTML_END = HTML_RESULTS_END + HTML_DOCUMENT_END
+
+HTML_ACCOUNT_START = u("""    <h2>Account {0}</h2>
+    <ul class="results">
+""")
+
+HTML_METRICS_START = u("""    <h2>API Call Metrics</h2>
+    <table id="metrics">
+      <tr><th>API method</th><th>Calls</th><th>Error rate</th><th>p50 ms</th><th>p95 ms</th><th>p99 ms</th><th>Max ms</th><th>Retries</th><th>Bytes sent</th><th>Bytes received</th><th>Throttled s</th></tr>
+""")
 
+HTML_METRICS_END = u("""    </table>
+""")
 
-def get_frame_name(_frame):
-    return inspect.getframeinfo(_frame).function.upper()
-#/get_frame_name
 
 
-def get_arguments(_frame, inspect=inspect):
+def get_method_name(_api_call):
     """
-    Inspects the calling signature of the passed `function` and retrieves the 
-    corresponding `argument` for each parameter in its `parameters`.
+    Returns the remote method name behind a `ServerProxy` method object.
     """
-    _arguments = []
-    
-    _frame_information = inspect.getargvalues(_frame)
-    _parameters = _frame_information[0][1:]
-    _signature = _frame_information[3]
-    
-    for _parameter in _parameters:
-        _argument = _signature[_parameter]
-        if isinstance(_argument, text_type):
-            _arguments.append(u(_argument))
-        else:
-            _arguments.append(_argument)
-    
-    return _arguments
-#/get_arguments
+    return getattr(_api_call, u('_Method__name'), None) or _api_call.__name__
+#/get_method_name
+
+
+def describe_fault(fault):
+    """
+    Collapses an XML-RPC `Fault` or `ProtocolError`, or a connection error, 
+    into a loggable string.
+    """
+    if isinstance(fault, _xmlrpc.Fault):
+        return COMMA_SEP.join([u(text_type(fault.faultCode)),
+                               u(text_type(fault.faultString))])
+    if isinstance(fault, _xmlrpc.ProtocolError):
+        return COMMA_SEP.join([u(text_type(fault.url)),
+                               u(text_type(fault.errcode)),
+                               u(text_type(fault.errmsg))])
+    return COMMA_SEP.join([u(type(fault).__name__), u(text_type(fault))])
+#/describe_fault
+
+
+def resolve_future(future, result):
+    """
+    Sets the `result` of a `Future` handed out for a queued call, if any.
+    """
+    if future is not None:
+        future.set_result(result)
+#/resolve_future
+
+
+def session_expired(error):
+    """
+    Checks whether `error` is the fault the API raises for a call made with an 
+    expired or unknown session.
+    """
+    return (isinstance(error, _xmlrpc.Fault) and
+            SESSION_EXPIRED in text_type(error.faultString))
+#/session_expired
 
 
 def enquote(string):
@@ -182,22 +315,783 @@ def flatten_iterable(iterable,
 #/flatten_iterable
 
 
-def already_exists(candidate, returned_api_collection):
+def inventory_key(list_name):
+    """
+    Returns the field that identifies entries of the `list_name` inventory.
+    """
+    return INVENTORY_KEYS.get(list_name, u('id'))
+#/inventory_key
+
+
+class InventoryIndex(object):
+    """
+    Inventory returned by an API list call, indexed once on its identifying 
+    `key` field for O(1) existence and duplicate checks.  Lookups only ever 
+    match the identifying field.
+    """
+    
+    def __init__(self, entries=(), key=u('id')):
+        self._key = key
+        self._entries = OrderedDict()
+        for _entry in entries:
+            self.add(_entry)
+    #/__init__
+    
+    
+    @property
+    def key(self):
+        return self._key
+    
+    
+    def __contains__(self, value):
+        return value in self._entries
+    
+    
+    def __len__(self):
+        return sum(len(_entries) for _entries in self._entries.values())
+    
+    
+    def __iter__(self):
+        for _entries in list(self._entries.values()):
+            for _entry in _entries:
+                yield _entry
+    
+    
+    def get(self, value, default=None):
+        """
+        Returns the first entry identified by `value`, else `default`.
+        """
+        _entries = self._entries.get(value)
+        return _entries[0] if _entries else default
+    #/get
+    
+    
+    def count(self, value):
+        """
+        Returns the number of entries identified by `value`.
+        """
+        return len(self._entries.get(value, ()))
+    #/count
+    
+    
+    def duplicates(self):
+        """
+        Returns the identifying values shared by more than one entry.
+        """
+        return [_value for _value, _entries in self._entries.items()
+                if len(_entries) > 1]
+    #/duplicates
+    
+    
+    def describe(self, value, result=None):
+        """
+        Returns the API `result` if it is the entry identified by `value`, 
+        else a minimal entry holding just the identifying field.
+        """
+        if isinstance(result, dict) and result.get(self._key) == value:
+            return result
+        return {self._key: value}
+    #/describe
+    
+    
+    def add(self, entry):
+        """
+        Indexes one inventory `entry` under its identifying field.
+        """
+        self._entries.setdefault(entry.get(self._key), []).append(entry)
+    #/add
+    
+    
+    def remove(self, value):
+        """
+        Drops every entry identified by `value`.
+        """
+        self._entries.pop(value, None)
+    #/remove
+
+#/InventoryIndex
+
+
+class CallMetrics(object):
+    """
+    Aggregate timings of the calls made to one API method.  Durations are 
+    counted in a constant-memory histogram of buckets each `HISTOGRAM_GROWTH` 
+    times wider than the last, so percentiles are estimated to within that 
+    factor however many calls are made.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.throttled = 0.0
+        self._buckets = {}
+    #/__init__
+    
+    
+    def add(self,
+            seconds,
+            error=False,
+            request_bytes=0,
+            response_bytes=0,
+            retries=0,
+            throttled=0.0):
+        """
+        Counts one call that took `seconds`, after waiting `throttled` seconds 
+        for the rate limiter.
+        """
+        _bucket = int(math.log(max(seconds, HISTOGRAM_MIN) / HISTOGRAM_MIN,
+                               HISTOGRAM_GROWTH))
+        self._buckets[_bucket] = self._buckets.get(_bucket, 0) + 1
+        self.count += 1
+        self.errors += 1 if error else 0
+        self.retries += retries
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.throttled += throttled
+    #/add
+    
+    
+    def percentile(self, fraction):
+        """
+        Returns the estimated duration below which `fraction` of calls fell.
+        """
+        _rank = fraction * self.count
+        _seen = 0
+        for _bucket in sorted(self._buckets):
+            _seen += self._buckets[_bucket]
+            if _seen >= _rank:
+                return min(HISTOGRAM_MIN * HISTOGRAM_GROWTH ** (_bucket + 1),
+                           self.max)
+        return self.max
+    #/percentile
+    
+    
+    def summary(self):
+        """
+        Returns the call count, error rate, percentiles, payload totals and 
+        time spent throttled.
+        """
+        return {u('count'): self.count,
+                u('errors'): self.errors,
+                u('error_rate'): float(self.errors) / self.count if self.count else 0.0,
+                u('retries'): self.retries,
+                u('mean'): self.total / self.count if self.count else 0.0,
+                u('p50'): self.percentile(0.50),
+                u('p95'): self.percentile(0.95),
+                u('p99'): self.percentile(0.99),
+                u('max'): self.max,
+                u('request_bytes'): self.request_bytes,
+                u('response_bytes'): self.response_bytes,
+                u('throttled'): self.throttled}
+    #/summary
+
+#/CallMetrics
+
+
+#What a hook is told about one attempt at an API call.  `arguments` and 
+#`result` have their secrets redacted; `duration`, `result` and `error` are 
+#`None` until known, and `attempt` counts from 1.
+CallEvent = namedtuple(u('CallEvent'), [u('method'),
+                                        u('arguments'),
+                                        u('duration'),
+                                        u('result'),
+                                        u('error'),
+                                        u('attempt')])
+
+SECRET_ARGUMENTS = {} #Positions of secret arguments, by API method name.
+IDEMPOTENT_METHODS = set() #Mutating API methods that are safe to retry.
+
+#Parameters naming entities of another kind, with the inventory listing that 
+#kind.  `TaskGraph` infers dependencies from these alone.
+REFERENCE_PARAMETERS = {u('domain'): u('list_domains'),
+                        u('subdomains'): u('list_domains'),
+                        u('site_apps'): u('list_apps'),
+                        u('targets'): u('list_mailboxes'),
+                        u('database'): u('list_dbs')}
+
+#Errors raised when a request or its response is lost in transit.
+CONNECTION_ERRORS = (socket.error, _http_client.HTTPException)
+
+
+class ConnectTimeout(socket.timeout):
+    """
+    Raised when a connection to the API can't be opened in time.
+    """
+
+
+class ReadTimeout(socket.timeout):
+    """
+    Raised when the API doesn't answer a request in time.
+    """
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised for a call not sent because the run's deadline had passed.
+    """
+
+
+def redact_arguments(method_name, arguments):
+    """
+    Returns a copy of the API `arguments` of `method_name` with any secrets 
+    replaced by `REDACTED`.
+    """
+    _arguments = list(arguments)
+    for _position in SECRET_ARGUMENTS.get(method_name, ()):
+        if _position < len(_arguments):
+            _arguments[_position] = REDACTED
+    return _arguments
+#/redact_arguments
+
+
+def redact_result(result):
+    """
+    Returns a copy of an API `result` with the value of any secret field, 
+    such as the password `create_mailbox` generates, replaced by `REDACTED`.
+    """
+    if isinstance(result, dict):
+        return dict((_key, REDACTED if _key in SECRET_PARAMETERS
+                           else redact_result(_value))
+                    for _key, _value in result.items())
+    if isinstance(result, list):
+        return [redact_result(_item) for _item in result]
+    return result
+#/redact_result
+
+
+class RetryPolicy(object):
+    """
+    Which failed API calls are retried, and after how long.  A call is tried 
+    at most `max_attempts` times, waiting before each retry a random "full 
+    jitter" delay of up to `base` seconds doubled per retry, capped at `cap`.  
+    Only transient failures are retried: faults whose code is in 
+    `fault_codes`, protocol errors whose HTTP status is in `http_statuses`, 
+    and connection errors whose errno is in `socket_errors`, or any 
+    connection error if that is `None`.  `list_*` calls and methods declared 
+    `idempotent` are always eligible; other calls change state and are only 
+    retried if `mutating` is set.
+    """
+    
+    def __init__(self,
+                 max_attempts=RETRY_ATTEMPTS,
+                 base=RETRY_BASE,
+                 cap=RETRY_CAP,
+                 fault_codes=(),
+                 http_statuses=RETRY_HTTP_STATUSES,
+                 socket_errors=None,
+                 mutating=False):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.fault_codes = frozenset(fault_codes)
+        self.http_statuses = frozenset(http_statuses)
+        self.socket_errors = (None if socket_errors is None
+                              else frozenset(socket_errors))
+        self.mutating = mutating
+    #/__init__
+    
+    
+    def applies_to(self, method_name):
+        """
+        Checks whether calls to `method_name` may be retried at all.
+        """
+        return (self.mutating or
+                method_name.startswith(u('list_')) or
+                method_name in IDEMPOTENT_METHODS)
+    #/applies_to
+    
+    
+    def retryable(self, error):
+        """
+        Checks whether `error` is a transient failure worth retrying.
+        """
+        if isinstance(error, _xmlrpc.Fault):
+            return error.faultCode in self.fault_codes
+        if isinstance(error, _xmlrpc.ProtocolError):
+            return error.errcode in self.http_statuses
+        if isinstance(error, CONNECTION_ERRORS):
+            return (self.socket_errors is None or
+                    getattr(error, u('errno'), None) in self.socket_errors)
+        return False
+    #/retryable
+    
+    
+    def backoff(self, attempt):
+        """
+        Returns a random delay, in seconds, to wait after failed `attempt`.
+        """
+        return random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+    #/backoff
+
+#/RetryPolicy
+
+
+def format_metrics(metrics):
+    """
+    Renders the per-method `metrics` summaries as the report's HTML table.
+    """
+    _rows = [HTML_METRICS_START]
+    for _method, _summary in sorted(metrics.items()):
+        _cells = [_method,
+                  text_type(_summary[u('count')]),
+                  u("{0:.1%}").format(_summary[u('error_rate')])]
+        _cells += [u("{0:.1f}").format(_summary[_field] * 1000)
+                   for _field in (u('p50'), u('p95'), u('p99'), u('max'))]
+        _cells += [text_type(_summary[_field])
+                   for _field in (u('retries'), u('request_bytes'), u('response_bytes'))]
+        _cells.append(u("{0:.2f}").format(_summary[u('throttled')]))
+        _rows.append(u("      <tr><td>") + u("</td><td>").join(_cells) +
+                     u("</td></tr>\n"))
+    _rows.append(HTML_METRICS_END)
+    return BLANK_STR.join(_rows)
+#/format_metrics
+
+
+class ApiMethod(object):
     """
-    Checks for existence of one `candidate` set of key, value pairs within one 
-    and only one `_dictionary` within a `returned_api_collection` list of 
-    dictionaries returned by an API list call.
+    Call signature of one API method, compiled once from the resource method 
+    that declares it.  Holds the positional order and defaults of its 
+    parameters, the rules that shape them into API arguments, and the 
+    inventory guard and bookkeeping applied around the call, so that no frame 
+    inspection is needed per call.  A successful call also records its entity 
+    in each inventory it `adds` to, such as the default user `create_db` 
+    makes.  An `idempotent` method may be retried by the default 
+    `RetryPolicy`.
     """
-    _exists = []
     
-    for _dictionary in returned_api_collection:
-        _subgroup = set(flatten_iterable(candidate))
-        _group = set(flatten_iterable(_dictionary))
-        if _subgroup.issubset(_group):
-            _exists.append(True)
+    def __init__(self,
+                 function,
+                 inventory=None,
+                 exists=None,
+                 effect=None,
+                 invalidates=(),
+                 adds=(),
+                 message=BLANK_STR,
+                 join=None,
+                 unwrap=None,
+                 idempotent=False):
+        _signature = _getargspec(function)
+        self.name = function.__name__
+        self.caller = self.name.upper()
+        self.parameters = tuple(_signature[0][1:])
+        self.defaults = dict(zip(reversed(self.parameters),
+                                 reversed(_signature[3] or ())))
+        self.inventory = inventory
+        self.exists = exists
+        self.effect = effect
+        self.invalidates = tuple(invalidates)
+        self.adds = tuple(adds)
+        self.message = u(message)
+        self._join = None if join is None else self.parameters.index(join)
+        self._unwrap = None if unwrap is None else self.parameters.index(unwrap)
+        
+        _secrets = tuple(_position for _position, _parameter
+                         in enumerate(self.parameters)
+                         if _parameter in SECRET_PARAMETERS)
+        if _secrets:
+            SECRET_ARGUMENTS[self.name] = _secrets
+        if idempotent:
+            IDEMPOTENT_METHODS.add(self.name)
+    #/__init__
+    
+    
+    def marshal(self, args, kwargs):
+        """
+        Returns the positional API arguments of a call made with `args` and 
+        `kwargs`.  A `join` parameter's list is collapsed into one 
+        comma-separated string and an `unwrap` parameter's list is spread over 
+        the trailing arguments; a string passed to either is used as is, 
+        except that an empty string adds no trailing argument.
+        """
+        if len(args) > len(self.parameters):
+            raise TypeError(u("{}() takes at most {} arguments ({} given)").format(
+                                    self.name, len(self.parameters), len(args)))
+        
+        _arguments = list(args)
+        _remaining = self.parameters[len(args):]
+        _consumed = 0
+        for _parameter in _remaining:
+            if _parameter in kwargs:
+                _arguments.append(kwargs[_parameter])
+                _consumed += 1
+            elif _parameter in self.defaults:
+                _arguments.append(self.defaults[_parameter])
+            else:
+                raise TypeError(u("{}() missing argument '{}'").format(
+                                                        self.name, _parameter))
+        
+        if _consumed < len(kwargs):
+            for _parameter in kwargs:
+                if _parameter not in _remaining:
+                    raise TypeError(u("{}() got an unexpected keyword "
+                                      "argument '{}'").format(self.name,
+                                                              _parameter))
+        
+        if (self._join is not None and
+            not isinstance(_arguments[self._join], text_type)):
+            _arguments[self._join] = COMMA_SEP.join(_arguments[self._join])
+        
+        if self._unwrap is not None:
+            _values = _arguments.pop(self._unwrap)
+            if isinstance(_values, text_type): #An empty one adds nothing.
+                _values = [_values] if _values else []
+            _arguments.extend(_values)
+        
+        return _arguments
+    #/marshal
+    
+    
+    def admits(self, existing, arguments):
+        """
+        Checks the guard on the entity named by the first of the marshalled 
+        `arguments` against the `existing` inventory.
+        """
+        return (arguments[0] in existing) == self.exists
+    #/admits
     
-    return _exists.count(True) == 1
-#/already_exists
+    
+    def rejection(self, arguments):
+        """
+        Returns the failure logged when the guard rejects `arguments`.
+        """
+        return self.message.format(arguments[0])
+    #/rejection
+
+#/ApiMethod
+
+
+def api_method(**spec):
+    """
+    Declares the decorated resource method as a call to the API method of the 
+    same name.  Its signature and the `ApiMethod` options in `spec` are 
+    compiled once, at class creation; the method body is never run.
+    """
+    def _declare(function):
+        _api_method = ApiMethod(function, **spec)
+        
+        @wraps(function)
+        def _call(self, *args, **kwargs):
+            return self._runner.call_api_method(_api_method,
+                                                self,
+                                                _api_method.marshal(args,
+                                                                    kwargs))
+        
+        _call.api_method = _api_method
+        return _call
+    return _declare
+#/api_method
+
+
+def email_addresses(domains, prefixes=None):
+    """
+    Returns the address of each of `prefixes`, the RFC 2142 ones by default, 
+    at each of `domains`, one domain or a list of them.
+    """
+    if isinstance(domains, (text_type, binary_type)):
+        domains = [domains]
+    if prefixes is None:
+        prefixes = RFC_2142_PREFIXES
+    return [_prefix + u("@") + _domain
+            for _domain in domains
+            for _prefix in prefixes]
+#/email_addresses
+
+
+def dns_override_records(override):
+    """
+    Returns the `(domain, record type, value)` of each record in `override`, 
+    a mapping of `create_dns_override` arguments or a `list_dns_overrides` 
+    entry, which may hold several record types, or already such a triple.
+    """
+    if not isinstance(override, dict):
+        _domain, _type, _value = override
+        _value = (tuple(text_type(_part) for _part in _value)
+                  if _type == u('mx_name') else text_type(_value))
+        return [(_domain, _type, _value)]
+    
+    _records = []
+    for _type in DNS_RECORD_TYPES:
+        _value = override.get(_type)
+        if not _value:
+            continue
+        if _type == u('mx_name'):
+            _value = (text_type(_value),
+                      text_type(override.get(u('mx_priority')) or BLANK_STR))
+        else:
+            _value = text_type(_value)
+        _records.append((override[u('domain')], _type, _value))
+    return _records
+#/dns_override_records
+
+
+def dns_override_calls(dns, records, existing, domains=()):
+    """
+    Diffs the desired DNS override `records`, as `DNS.sync_dns_overrides` 
+    takes them, against the `existing` overrides on `(domain, record type, 
+    value)`.  Returns a `BulkCall` of `dns`'s `delete_dns_override` for each 
+    existing record of those domains, or of `domains`, that isn't desired, 
+    then a `BulkCall` of its `create_dns_override` for each desired record 
+    that doesn't exist and a skipped `BulkOutcome` for each other record, 
+    each paired with no dependencies, as `Runner.run_bulk_steps()` takes them.
+    """
+    def _key(_record):
+        _domain, _type, _value = _record
+        return u(" ").join((_domain, _type) + (_value if isinstance(_value, tuple)
+                                               else (_value,)))
+    
+    def _kwargs(_record):
+        _domain, _type, _value = _record
+        if _type == u('mx_name'):
+            return {u('domain'): _domain,
+                    u('mx_name'): _value[0],
+                    u('mx_priority'): _value[1]}
+        return {u('domain'): _domain, _type: _value}
+    
+    _wanted = []
+    for _override in records:
+        _wanted.extend(dns_override_records(_override))
+    _domains = set(domains) | set(_record[0] for _record in _wanted)
+    _have = []
+    for _override in existing:
+        _have.extend(_record for _record in dns_override_records(_override)
+                     if _record[0] in _domains)
+    
+    _removes = []
+    _desired = set(_wanted)
+    for _record in _have:
+        if _record not in _desired:
+            _removes.append(BulkCall(_key(_record), u('delete_dns_override'),
+                                     dns.delete_dns_override, (), _kwargs(_record)))
+    
+    _adds = []
+    _seen = set()
+    _present = set(_have)
+    for _record in _wanted:
+        if _record in _seen:
+            _add = BulkOutcome(_key(_record), u('create_dns_override'),
+                               SKIPPED, u("Repeats an earlier record."))
+        elif _record in _present:
+            _add = BulkOutcome(_key(_record), u('create_dns_override'),
+                               SKIPPED, u("Already exists."))
+        else:
+            _add = BulkCall(_key(_record), u('create_dns_override'),
+                            dns.create_dns_override, (), _kwargs(_record))
+        _adds.append((_add, ()))
+        _seen.add(_record)
+    return _removes, _adds
+#/dns_override_calls
+
+
+def db_manifest_calls(database, manifest, dbs, users):
+    """
+    Diffs a database `manifest`, as `Database.provision_dbs` takes it, against 
+    the `dbs` and `users` inventories.  Returns the records that create what 
+    is missing, then those that set up ownership, grants and addons, each 
+    paired with the `(action, key)` of the creating records it depends on.  
+    Records are `BulkCall`s of `database`'s methods, or skipped `BulkOutcome`s.
+    Ownership and grants are only set up for a new database or user, and 
+    addons only for a new database, as the inventories don't show them.
+    """
+    def _call(_method, _key, _entry):
+        return BulkCall(_key, _method.api_method.name, _method, (),
+                        dict((_name, _value) for _name, _value in _entry.items()
+                             if _name in _method.api_method.parameters))
+    
+    def _skip(_action, _key, _message):
+        return BulkOutcome(_key, _action, SKIPPED, _message)
+    
+    _first = []
+    _second = []
+    _manifest_dbs = OrderedDict()
+    for _db in manifest.get(u('dbs'), ()):
+        _name = _db[u('name')]
+        if _name in _manifest_dbs:
+            _first.append(_skip(u('create_db'), _name,
+                                u("Repeats an earlier record.")))
+        elif _name in dbs:
+            _first.append(_skip(u('create_db'), _name, u("Already exists.")))
+        else:
+            _first.append(_call(database.create_db, _name, _db))
+        _manifest_dbs.setdefault(_name, _db)
+    _new_dbs = set(_record.key for _record in _first
+                   if isinstance(_record, BulkCall))
+    
+    _new_users = {} #Dependencies of each new user's setup, by username.
+    _seen = set()
+    for _user in manifest.get(u('users'), ()):
+        _username = _user[u('username')]
+        if _username in _seen:
+            _first.append(_skip(u('create_db_user'), _username,
+                                u("Repeats an earlier record.")))
+        elif _username in users:
+            _first.append(_skip(u('create_db_user'), _username,
+                                u("Already exists.")))
+        elif _username in _new_dbs: #Its database's default user.
+            _new_users[_username] = [(u('create_db'), _username)]
+            if _user.get(u('password')):
+                _second.append((_call(database.change_db_user_password,
+                                      _username,
+                                      _user),
+                                _new_users[_username]))
+            else:
+                _first.append(_skip(u('create_db_user'), _username,
+                                    u("Created with its database.")))
+        else:
+            _first.append(_call(database.create_db_user, _username, _user))
+            _new_users[_username] = [(u('create_db_user'), _username)]
+        _seen.add(_username)
+    
+    for _name, _db in _manifest_dbs.items():
+        _db_type = _db.get(u('db_type'), u("postgresql"))
+        _depends_on = [(u('create_db'), _name)] if _name in _new_dbs else []
+        _grants = [(database.make_user_owner_of_db, _db[u('owner')])] \
+                  if _db.get(u('owner')) else []
+        _grants.extend((database.grant_db_permissions, _username)
+                       for _username in _db.get(u('grants'), ()))
+        for _method, _username in _grants:
+            _key = u("{0} {1}").format(_username, _name)
+            if _name in _new_dbs or _username in _new_users:
+                _second.append((_call(_method, _key, {u('username'): _username,
+                                                       u('database'): _name,
+                                                       u('db_type'): _db_type}),
+                                _depends_on + _new_users.get(_username, [])))
+            else:
+                _second.append((_skip(_method.api_method.name, _key,
+                                      u("Database and user already exist.")), []))
+        for _addon in _db.get(u('addons'), ()):
+            _key = u("{0} {1}").format(_name, _addon)
+            if _name in _new_dbs:
+                _second.append((_call(database.enable_addon, _key,
+                                      {u('database'): _name,
+                                       u('db_type'): _db_type,
+                                       u('addon'): _addon}),
+                                _depends_on))
+            else:
+                _second.append((_skip(u('enable_addon'), _key,
+                                      u("Database already exists.")), []))
+    return _first, _second
+#/db_manifest_calls
+
+
+def unblocked_records(records, report):
+    """
+    Returns each of `records`, a `BulkCall` or `BulkOutcome` paired with the 
+    `(action, key)` of the records it depends on, unless one of those failed 
+    in `report`, when a skipped `BulkOutcome` naming it takes its place.
+    """
+    _failed = set((_row.action, _row.key) for _row in report.failures())
+    _records = []
+    for _record, _depends_on in records:
+        _blockers = [_dependency for _dependency in _depends_on
+                     if _dependency in _failed]
+        if _blockers and isinstance(_record, BulkCall):
+            _record = BulkOutcome(_record.key, _record.action, SKIPPED,
+                                  u("Depends on {0}('{1}'), which failed.").format(
+                                                                *_blockers[0]))
+        _records.append(_record)
+    return _records
+#/unblocked_records
+
+
+def offset_progress(progress, offset, total):
+    """
+    Returns a `progress` callback for one step of a bulk run that reports 
+    its records as settled after the `offset` settled by earlier steps, out 
+    of the `total` of all steps, or `None` if there is no `progress`.
+    """
+    if progress is None:
+        return None
+    return lambda settled, size: progress(offset + settled, total)
+#/offset_progress
+
+
+def user_groups(groups):
+    """
+    Returns the set of shell user `groups`, a list or a comma-separated string.
+    """
+    if isinstance(groups, (text_type, binary_type)):
+        groups = groups.split(u(','))
+    return set(text_type(_group).strip() for _group in groups or ()
+               if text_type(_group).strip())
+#/user_groups
+
+
+def shell_user_calls(shell_user, roster, users, prune=False, keep=()):
+    """
+    Diffs a `roster` of shell users, as `ShellUser.sync_users` takes it, 
+    against the `users` inventory.  Returns the records that create missing 
+    users, change existing users' passwords and, if `prune`, delete users 
+    missing from the roster other than those in `keep`, then those that set 
+    new users' passwords, each paired with the `(action, key)` of the create 
+    it depends on.  A user whose shell or groups differ is skipped, as the 
+    API can't change them short of deleting the user.
+    """
+    _first = []
+    _second = []
+    _seen = set()
+    for _user in roster:
+        if not isinstance(_user, dict):
+            _user = dict(zip((u('username'), u('shell'), u('groups'),
+                              u('password')), _user))
+        _username = _user[u('username')]
+        _password = _user.get(u('password'))
+        _change = BulkCall(_username, u('change_user_password'),
+                           shell_user.change_user_password, (),
+                           {u('username'): _username, u('password'): _password})
+        _existing = users.get(_username)
+        
+        if _username in _seen:
+            _first.append(BulkOutcome(_username, u('create_user'), SKIPPED,
+                                      u("Repeats an earlier record.")))
+        elif _existing is None:
+            _first.append(BulkCall(_username, u('create_user'),
+                                   shell_user.create_user, (),
+                                   {u('username'): _username,
+                                    u('shell'): _user.get(u('shell'), BLANK_STR),
+                                    u('groups'): sorted(user_groups(
+                                                    _user.get(u('groups'))))}))
+            if _password:
+                _second.append((_change, [(u('create_user'), _username)]))
+        else:
+            _drift = []
+            if (_user.get(u('shell')) and
+                _user[u('shell')] != _existing.get(u('shell'))):
+                _drift.append(u("shell {0}").format(_existing.get(u('shell'))))
+            if (u('groups') in _user and
+                user_groups(_user[u('groups')]) !=
+                    user_groups(_existing.get(u('groups')))):
+                _drift.append(u("groups {0}").format(u(', ').join(
+                              sorted(user_groups(_existing.get(u('groups'))))) or
+                              u("none")))
+            if _drift:
+                _first.append(BulkOutcome(_username, u('create_user'), SKIPPED,
+                                          u("Exists with {0}, which the API "
+                                            "can't change.").format(
+                                                    u('; ').join(_drift))))
+            if _password:
+                _first.append(_change)
+            elif not _drift:
+                _first.append(BulkOutcome(_username, u('create_user'), SKIPPED,
+                                          u("Already exists.")))
+        _seen.add(_username)
+    
+    if prune:
+        for _existing in users:
+            _username = _existing[u('username')]
+            if _username not in _seen and _username not in keep:
+                _first.append(BulkCall(_username, u('delete_user'),
+                                       shell_user.delete_user, (),
+                                       {u('username'): _username}))
+    return _first, _second
+#/shell_user_calls
+
 
 
 class Mailbox(object):
@@ -209,10 +1103,14 @@ class Mailbox(object):
     
     
     def list_mailboxes(self):
-        return self._server.list_mailboxes(self._session_id)
+        return self._runner.list_api_call(self._server.list_mailboxes)
     #/list_mailboxes
     
     
+    @api_method(inventory=u('list_mailboxes'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                message="Can't create Mailbox '{}' that already exists.")
     def create_mailbox(self,
                        mailbox=BLANK_STR,
                        enable_spam_protection=True,
@@ -220,42 +1118,67 @@ class Mailbox(object):
                        spam_redirect_folder=BLANK_STR,
                        use_manual_procmailrc=False,
                        manual_procmailrc=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create Mailbox '{}' that already exists."
-        _existing_mailboxes = self.list_mailboxes()
-        _mailbox = {u('mailbox'): mailbox}
-        
-        if not already_exists(_mailbox, _existing_mailboxes):
-            self._runner.try_api_call(_caller,
-                                      self._server.create_mailbox,
-                                      _arguments)
-        else: #_mailbox already in _existing_mailboxes
-            self._runner.log(_caller, FAILURE, u(_msg).format(mailbox))
+        """
+        Creates a mailbox.
+        """
     #/create_mailbox
     
     
+    def create_mailbox_records(self,
+                               records,
+                               concurrency=None,
+                               batch_size=None,
+                               progress=None):
+        """
+        Creates the mailboxes described by `records`, each a mailbox name or a 
+        mapping or sequence of `create_mailbox` arguments, that don't exist 
+        yet, checking all of them against one `list_mailboxes` inventory.  
+        Writes are batched, or sent from `concurrency` threads.  Returns a 
+        `BulkReport` of the outcome for each mailbox.
+        """
+        return self._runner.bulk(self.create_mailbox,
+                                 records,
+                                 concurrency,
+                                 batch_size,
+                                 progress)
+    #/create_mailbox_records
+    
+    
+    @api_method(inventory=u('list_mailboxes'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' Mailbox.")
     def delete_mailbox(self,
                        mailbox=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' Mailbox."
-        _existing_mailboxes = self.list_mailboxes()
-        _mailbox = {u('mailbox'): mailbox}
-        
-        if already_exists(_mailbox, _existing_mailboxes):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_mailbox,
-                                      _arguments)
-        else: #_mailbox not already in _existing_mailboxes
-            self._runner.log(_caller, FAILURE, u(_msg).format(mailbox))
+        """
+        Deletes a mailbox.
+        """
     #/delete_mailbox
     
     
+    def delete_mailbox_records(self,
+                               records,
+                               concurrency=None,
+                               batch_size=None,
+                               progress=None):
+        """
+        Deletes the mailboxes in `records` that exist, checking all of them 
+        against one `list_mailboxes` inventory.  Returns a `BulkReport`, as 
+        `create_mailbox_records` does.
+        """
+        return self._runner.bulk(self.delete_mailbox,
+                                 records,
+                                 concurrency,
+                                 batch_size,
+                                 progress)
+    #/delete_mailbox_records
+    
+    
+    @api_method(inventory=u('list_mailboxes'),
+                exists=True,
+                effect=INVENTORY_UPDATE,
+                message="Can't update non-existent '{}' Mailbox.",
+                idempotent=True)
     def update_mailbox(self,
                        mailbox=BLANK_STR,
                        enable_spam_protection=True,
@@ -263,41 +1186,60 @@ class Mailbox(object):
                        spam_redirect_folder=BLANK_STR,
                        use_manual_procmailrc=False,
                        manual_procmailrc=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't update non-existent '{}' Mailbox."
-        _existing_mailboxes = self.list_mailboxes()
-        _mailbox = {u('mailbox'): mailbox}
-        
-        if already_exists(_mailbox, _existing_mailboxes):
-            self._runner.try_api_call(_caller,
-                                      self._server.update_mailbox,
-                                      _arguments)
-        else: #_mailbox not already in _existing_mailboxes
-            self._runner.log(_caller, FAILURE, u(_msg).format(mailbox))
+        """
+        Updates a mailbox's spam settings.
+        """
     #/update_mailbox
     
     
+    def update_mailbox_records(self,
+                               records,
+                               concurrency=None,
+                               batch_size=None,
+                               progress=None):
+        """
+        Updates the spam settings of the mailboxes described by `records`, 
+        each a mapping or sequence of `update_mailbox` arguments, that exist.  
+        Returns a `BulkReport`, as `create_mailbox_records` does.
+        """
+        return self._runner.bulk(self.update_mailbox,
+                                 records,
+                                 concurrency,
+                                 batch_size,
+                                 progress)
+    #/update_mailbox_records
+    
+    
+    @api_method(inventory=u('list_mailboxes'),
+                exists=True,
+                message="Can't change password for non-existent '{}' mailbox.",
+                idempotent=True)
     def change_mailbox_password(self,
                                 mailbox=BLANK_STR,
                                 password=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't change password for non-existent '{}' mailbox."
-        _existing_mailboxes = self.list_mailboxes()
-        _mailbox = {u('mailbox'): mailbox}
-        
-        if already_exists(_mailbox, _existing_mailboxes):
-            self._runner.try_api_call(_caller,
-                                      self._server.change_mailbox_password,
-                                      _arguments)
-        else: #_mailbox not already in _existing_mailboxes
-            self._runner.log(_caller, FAILURE, u(_msg).format(mailbox))
+        """
+        Changes a mailbox's password.
+        """
     #/change_mailbox_password
+    
+    
+    def change_mailbox_password_records(self,
+                                        records,
+                                        concurrency=None,
+                                        batch_size=None,
+                                        progress=None):
+        """
+        Changes the password of each existing mailbox in `records`, each a 
+        `(mailbox, password)` pair or a mapping, to rotate passwords at scale.  
+        Passwords are redacted from hooks and the report.  Returns a 
+        `BulkReport`, as `create_mailbox_records` does.
+        """
+        return self._runner.bulk(self.change_mailbox_password,
+                                 records,
+                                 concurrency,
+                                 batch_size,
+                                 progress)
+    #/change_mailbox_password_records
 
 #/Mailbox
 
@@ -312,10 +1254,15 @@ class Email(object):
     
     
     def list_emails(self):
-        return self._server.list_emails(self._session_id)
+        return self._runner.list_api_call(self._server.list_emails)
     #/list_emails
     
     
+    @api_method(inventory=u('list_emails'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                message="Can't create mail address '{}' that already exists.",
+                join=u('targets'))
     def create_email(self,
                      email_address=BLANK_STR,
                      targets=[],
@@ -325,98 +1272,108 @@ class Email(object):
                      autoresponder_from=BLANK_STR,
                      script_machine=BLANK_STR,
                      script_path=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create mail address '{}' that already exists."
-        _existing_email_addresses = self.list_emails()
-        _email_address = {u('email_address'): email_address}
-        
-        if not already_exists(_email_address, _existing_email_addresses):
-            _arguments[1] = u(", ").join(_arguments[1])
-            self._runner.try_api_call(_caller,
-                                      self._server.create_email,
-                                      _arguments)
-        else: #_email_address already in _existing_email_addresses
-            self._runner.log(_caller, FAILURE, u(_msg).format(email_address))
+        """
+        Creates an email address delivering to `targets`.
+        """
     #/create_email
     
     
     def create_emails(self,
                       domain=BLANK_STR,
                       prefixes=None,
-                      targets=BLANK_STR):
-        
-        self._prefixes = []
-        _std_prefixes = [u('www'),
-                         u('admin'),
-                         u('webmaster'),
-                         u('postmaster'),
-                         u('hostmaster'),
-                         u('info'),
-                         u('sales'),
-                         u('marketing'),
-                         u('support'),
-                         u('abuse')]
-        
-        if prefixes is None:
-            self._prefixes = _std_prefixes
-        else:
-            self._prefixes = prefixes
-        
-        for _prefix in self._prefixes:
-            _email_address = _prefix + u("@") + domain
-            self.create_email(_email_address, targets)
+                      targets=BLANK_STR,
+                      concurrency=None,
+                      batch_size=None,
+                      progress=None):
+        """
+        Creates each of `prefixes`, the RFC 2142 ones by default, at `domain`,
+        or at each of a list of domains, delivering to `targets`.  Returns a 
+        `BulkReport`, as `create_email_records` does.
+        """
+        return self.create_email_records([(_address, targets)
+                                          for _address
+                                          in email_addresses(domain, prefixes)],
+                                         concurrency,
+                                         batch_size,
+                                         progress)
     #/create_emails
     
     
+    def create_email_records(self,
+                             records,
+                             concurrency=None,
+                             batch_size=None,
+                             progress=None):
+        """
+        Creates the email addresses described by `records`, each a mapping or 
+        sequence of `create_email` arguments, that don't exist yet, checking 
+        all of them against one `list_emails` inventory.  Writes are batched, 
+        or sent from `concurrency` threads.  Returns a `BulkReport` of the 
+        outcome for each address.
+        """
+        return self._runner.bulk(self.create_email,
+                                 records,
+                                 concurrency,
+                                 batch_size,
+                                 progress)
+    #/create_email_records
+    
+    
+    @api_method(inventory=u('list_emails'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' email address.")
     def delete_email(self,
                      email_address=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' email address."
-        _existing_email_addresses = self.list_emails()
-        _email_address = {u('email_address'): email_address}
-        
-        if already_exists(_email_address, _existing_email_addresses):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_email,
-                                      _arguments)
-        else: #_email_address not already in _existing_email_addresses
-            self._runner.log(_caller, FAILURE, u(_msg).format(email_address))
+        """
+        Deletes an email address.
+        """
     #/delete_email
     
     
     def delete_emails(self,
                       domain=BLANK_STR,
-                      prefixes=None):
-        
-        self._prefixes = []
-        _std_prefixes = [u('www'),
-                         u('admin'),
-                         u('webmaster'),
-                         u('postmaster'),
-                         u('hostmaster'),
-                         u('info'),
-                         u('sales'),
-                         u('marketing'),
-                         u('support'),
-                         u('abuse')]
-        
-        if prefixes is None:
-            self._prefixes = _std_prefixes
-        else:
-            self._prefixes = prefixes
-        
-        for _prefix in self._prefixes:
-            _email_address = _prefix + u("@") + domain
-            self.delete_email(_email_address)
+                      prefixes=None,
+                      concurrency=None,
+                      batch_size=None,
+                      progress=None):
+        """
+        Deletes each of `prefixes`, the RFC 2142 ones by default, at `domain`,
+        or at each of a list of domains.  Returns a `BulkReport`, as 
+        `delete_email_records` does.
+        """
+        return self.delete_email_records(email_addresses(domain, prefixes),
+                                         concurrency,
+                                         batch_size,
+                                         progress)
     #/delete_emails
     
     
+    def delete_email_records(self,
+                             records,
+                             concurrency=None,
+                             batch_size=None,
+                             progress=None):
+        """
+        Deletes the email addresses in `records` that exist, checking all of 
+        them against one `list_emails` inventory.  Writes are batched, or sent 
+        from `concurrency` threads.  Returns a `BulkReport` of the outcome for 
+        each address.
+        """
+        return self._runner.bulk(self.delete_email,
+                                 records,
+                                 concurrency,
+                                 batch_size,
+                                 progress)
+    #/delete_email_records
+    
+    
+    @api_method(inventory=u('list_emails'),
+                exists=True,
+                effect=INVENTORY_UPDATE,
+                message="Can't update non-existent '{}' email address.",
+                join=u('targets'),
+                idempotent=True)
     def update_email(self,
                      email_address=BLANK_STR,
                      targets=[],
@@ -426,21 +1383,9 @@ class Email(object):
                      autoresponder_from=BLANK_STR,
                      script_machine=BLANK_STR,
                      script_path=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _arguments[1] = u(", ").join(_arguments[1])
-        _msg = "Can't update non-existent '{}' email address."
-        _existing_email_addresses = self.list_emails()
-        _email_address = {u('email_address'): email_address}
-        
-        if already_exists(_email_address, _existing_email_addresses):
-            self._runner.try_api_call(_caller,
-                                      self._server.update_email,
-                                      _arguments)
-        else: #_email_address not already in _existing_email_addresses
-            self._runner.log(_caller, FAILURE, u(_msg).format(email_address))
+        """
+        Updates an email address's targets and autoresponder.
+        """
     #/update_email
 
 #/Email
@@ -456,41 +1401,29 @@ class Domain(object):
     
     
     def list_domains(self):
-        return self._server.list_domains(self._session_id)
+        return self._runner.list_api_call(self._server.list_domains)
     #/list_domains
     
     
+    @api_method(invalidates=[u('list_domains')],
+                unwrap=u('subdomain'))
     def create_domain(self,
                       domain=BLANK_STR,
                       subdomain=[]):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _subdomains = _arguments.pop(-1)
-        
-        for _subdomain in _subdomains:
-            _arguments.append(_subdomain)
-        self._runner.try_api_call(_caller,
-                                  self._server.create_domain,
-                                  _arguments)
+        """
+        Creates a domain, or adds `subdomain`s to an existing one.
+        """
     #/create_domain
     
     
+    @api_method(invalidates=[u('list_domains')],
+                unwrap=u('subdomain'))
     def delete_domain(self,
                       domain=BLANK_STR,
                       subdomain=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _subdomains = _arguments.pop(-1)
-        
-        for _subdomain in _subdomains:
-            _arguments.append(_subdomain)
-        self._runner.try_api_call(_caller,
-                                  self._server.delete_domain,
-                                  _arguments)
+        """
+        Deletes a domain, or only its `subdomain`s.
+        """
     #/delete_domain
 
 #/Domain
@@ -506,79 +1439,59 @@ class Website(object):
     
     
     def list_websites(self):
-        return self._server.list_websites(self._session_id)
+        return self._runner.list_api_call(self._server.list_websites)
     #/list_websites
     
     
     def list_bandwidth_usage(self):
-        return self._server.list_bandwidth_usage(self._session_id)
+        return self._runner.list_api_call(self._server.list_bandwidth_usage)
     #/list_bandwidth_usage
     
     
+    @api_method(inventory=u('list_websites'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                message="Can't create website '{}' that already exists.")
     def create_website(self,
                        website_name=BLANK_STR,
                        ip=BLANK_STR,
                        https=False,
                        subdomains=[],
                        site_apps=[]):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create website '{}' that already exists."
-        _existing_websites = self.list_websites()
-        _website_name = {u('website_name'): website_name}
-        
-        if not already_exists(_website_name, _existing_websites):
-            self._runner.try_api_call(_caller,
-                                      self._server.create_website,
-                                      _arguments)
-        else: #_website_name already in _existing_websites
-            self._runner.log(_caller, FAILURE, u(_msg).format(website_name))
+        """
+        Creates a website.
+        """
     #/create_website
     
     
+    @api_method(inventory=u('list_websites'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' website.")
     def delete_website(self,
                        website_name=BLANK_STR,
                        ip=BLANK_STR,
                        https=False):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' website."
-        _existing_websites = self.list_websites()
-        _website_name = {u('website_name'): website_name}
-        
-        if already_exists(_website_name, _existing_websites):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_website,
-                                      _arguments)
-        else: #_website_name not already in _existing_websites
-            self._runner.log(_caller, FAILURE, u(_msg).format(website_name))
+        """
+        Deletes a website.
+        """
     #/delete_website
     
     
+    @api_method(inventory=u('list_websites'),
+                exists=True,
+                effect=INVENTORY_UPDATE,
+                message="Can't update non-existent '{}' website.",
+                idempotent=True)
     def update_website(self,
                        website_name=BLANK_STR,
                        ip=BLANK_STR,
                        https=False,
                        subdomains=[],
                        site_apps=[]):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't update non-existent '{}' website."
-        _existing_websites = self.list_websites()
-        _website_name = {u('website_name'): website_name}
-        
-        if already_exists(_website_name, _existing_websites):
-            self._runner.try_api_call(_caller,
-                                      self._server.update_website,
-                                      _arguments)
-        else: #_website_name not already in _existing_websites
-            self._runner.log(_caller, FAILURE, u(_msg).format(website_name))
+        """
+        Updates a website.
+        """
     #/update_website
 
 #/Website
@@ -594,54 +1507,40 @@ class Application(object):
     
     
     def list_apps(self):
-        return self._server.list_apps(self._session_id)
+        return self._runner.list_api_call(self._server.list_apps)
     #/list_apps
     
     
     def list_app_types(self):
-        return self._server.list_app_types(self._session_id)
+        return self._runner.list_api_call(self._server.list_app_types)
     #/list_app_types
     
     
+    @api_method(inventory=u('list_apps'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                message="Can't create application '{}' that already exists.")
     def create_app(self,
                    name=BLANK_STR,
                    type=BLANK_STR,
                    autostart=False,
                    extra_info=BLANK_STR,
                    open_port=False):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create application '{}' that already exists."
-        _existing_apps = self.list_apps()
-        _app_name = {u('name'): name}
-        
-        if not already_exists(_app_name, _existing_apps):
-            self._runner.try_api_call(_caller,
-                                      self._server.create_app,
-                                      _arguments)
-        else: #_app_name already in _existing_apps
-            self._runner.log(_caller, FAILURE, u(_msg).format(name))
+        """
+        Creates an application.
+        """
     #/create_app
     
     
+    @api_method(inventory=u('list_apps'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' application.")
     def delete_app(self,
                    name=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' application."
-        _existing_apps = self.list_apps()
-        _app_name = {u('name'): name}
-        
-        if already_exists(_app_name, _existing_apps):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_app,
-                                      _arguments)
-        else: #_app_name not already in _existing_apps
-            self._runner.log(_caller, FAILURE, u(_msg).format(name))
+        """
+        Deletes an application.
+        """
     #/delete_app
 
 #/Application
@@ -656,29 +1555,21 @@ class Cron(object):
     #/__init__
     
     
+    @api_method()
     def create_cronjob(self,
                         line=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.create_cronjob,
-                                  _arguments)
+        """
+        Adds a line to the crontab.
+        """
     #/create_cronjob
     
     
+    @api_method()
     def delete_cronjob(self,
                         line=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.delete_cronjob,
-                                  _arguments)
+        """
+        Removes a line from the crontab.
+        """
     #/delete_cronjob
 
 #/Cron
@@ -694,10 +1585,11 @@ class DNS(object):
     
     
     def list_dns_overrides(self):
-        return self._server.list_dns_overrides(self._session_id)
+        return self._runner.list_api_call(self._server.list_dns_overrides)
     #/list_dns_overrides
     
     
+    @api_method(invalidates=[u('list_dns_overrides')])
     def create_dns_override(self,
                             domain=BLANK_STR,
                             a_ip=BLANK_STR,
@@ -706,17 +1598,13 @@ class DNS(object):
                             mx_priority=BLANK_STR,
                             spf_record=BLANK_STR,
                             aaaa_ip=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.create_dns_override,
-                                  _arguments)
+        """
+        Creates DNS override records for a domain.
+        """
     #/create_dns_override
     
     
+    @api_method(invalidates=[u('list_dns_overrides')])
     def delete_dns_override(self,
                             domain=BLANK_STR,
                             a_ip=BLANK_STR,
@@ -725,16 +1613,40 @@ class DNS(object):
                             mx_priority=BLANK_STR,
                             spf_record=BLANK_STR,
                             aaaa_ip=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.delete_dns_override,
-                                  _arguments)
+        """
+        Deletes DNS override records from a domain.
+        """
     #/delete_dns_override
     
+    
+    def sync_dns_overrides(self,
+                           records,
+                           domains=(),
+                           concurrency=None,
+                           batch_size=None,
+                           progress=None):
+        """
+        Makes the DNS overrides of the domains in `records`, and of any other 
+        `domains` given, match `records`: each a mapping of 
+        `create_dns_override` arguments or a `(domain, record type, value)` 
+        triple, an MX record's value being its `(mx_name, mx_priority)` pair.  
+        `list_dns_overrides` is fetched once, and only the records to remove 
+        and then, once those are settled, the records to add are sent, 
+        batched, or from `concurrency` threads.  Returns a `BulkReport`, with 
+        records already in place skipped.
+        """
+        try:
+            _existing = self._runner.inventory(self.list_dns_overrides)
+        except DeadlineExceeded: #Every call fails unsent.
+            _existing = ()
+        _removes, _adds = dns_override_calls(self, records, _existing, domains)
+        return self._runner.run_bulk_steps(_removes,
+                                           _adds,
+                                           concurrency,
+                                           batch_size,
+                                           progress)
+    #/sync_dns_overrides
+    
 #/DNS
 
 
@@ -748,201 +1660,167 @@ class Database(object):
     
     
     def list_dbs(self):
-        return self._server.list_dbs(self._session_id)
+        return self._runner.list_api_call(self._server.list_dbs)
     #/list_dbs
     
     
     def list_db_users(self):
-        return self._server.list_db_users(self._session_id)
+        return self._runner.list_api_call(self._server.list_db_users)
     #/list_db_users
     
     
+    #A default database user of the same name is created along with the 
+    #database.
+    @api_method(inventory=u('list_dbs'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                adds=[u('list_db_users')],
+                message="Can't create database '{}' that already exists.")
     def create_db(self,
                   name=BLANK_STR,
                   db_type=u("postgresql"),
                   password=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create database '{}' that already exists."
-        _existing_databases = self.list_dbs()
-        _db_name = {u('name'): name}
-        
-        if not already_exists(_db_name, _existing_databases):
-            self._runner.try_api_call(_caller,
-                                      self._server.create_db,
-                                      _arguments)
-        else: #_db_name already in _existing_databases
-            self._runner.log(_caller, FAILURE, u(_msg).format(name))
+        """
+        Creates a database.
+        """
     #/create_db
     
     
+    @api_method(inventory=u('list_dbs'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' database.")
     def delete_db(self,
                   name=BLANK_STR,
                   db_type=u("postgresql")):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' database."
-        _existing_databases = self.list_dbs()
-        _db_name = {u('name'): name}
-        
-        if already_exists(_db_name, _existing_databases):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_db,
-                                      _arguments)
-        else: #_db_name not already in _existing_databases
-            self._runner.log(_caller, FAILURE, u(_msg).format(name))
+        """
+        Deletes a database.
+        """
     #/delete_db
     
     
+    @api_method(inventory=u('list_db_users'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                message="Can't create database user '{}' that already exists.")
     def create_db_user(self,
                        username=BLANK_STR,
                        password=BLANK_STR,
                        db_type=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create database user '{}' that already exists."
-        _existing_database_users = self.list_db_users()
-        _db_user = {u('username'): username}
-        
-        if not already_exists(_db_user, _existing_database_users):
-            self._runner.try_api_call(_caller,
-                                      self._server.create_db_user,
-                                      _arguments)
-        else: #_db_user already in _existing_database_users
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Creates a database user.
+        """
     #/create_db_user
     
     
+    @api_method(inventory=u('list_db_users'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' database user.")
     def delete_db_user(self,
                        username=BLANK_STR,
                        db_type=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' database user."
-        _existing_database_users = self.list_db_users()
-        _db_user = {u('username'): username}
-        
-        if already_exists(_db_user, _existing_database_users):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_db_user,
-                                      _arguments)
-        else: #_db_user already in _existing_database_users
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Deletes a database user.
+        """
     #/delete_db_user
     
     
+    @api_method(inventory=u('list_db_users'),
+                exists=True,
+                message="Can't change password for non-existent '{}' database user.",
+                idempotent=True)
     def change_db_user_password(self,
                                 username=BLANK_STR,
                                 password=BLANK_STR,
                                 db_type=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't change password for non-existent '{}' database user."
-        _existing_database_users = self.list_db_users()
-        _db_user = {u('username'): username}
-        
-        if already_exists(_db_user, _existing_database_users):
-            self._runner.try_api_call(_caller,
-                                      self._server.change_db_user_password,
-                                      _arguments)
-        else: #_db_user not already in _existing_database_users
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Changes a database user's password.
+        """
     #/change_db_user_password
     
     
+    @api_method(inventory=u('list_db_users'),
+                exists=True,
+                message="Can't make non-existent '{}' database user owner of a database.")
     def make_user_owner_of_db(self,
                               username=BLANK_STR,
                               database=BLANK_STR,
                               db_type=u("postgresql")):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't change password for non-existent '{}' database user."
-        _existing_database_users = self.list_db_users()
-        _db_user = {u('username'): username}
-        
-        if already_exists(_db_user, _existing_database_users):
-            self._runner.try_api_call(_caller,
-                                      self._server.make_user_owner_of_db,
-                                      _arguments)
-        else: #_db_user not already in _existing_database_users
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Makes a database user the owner of a database.
+        """
     #/make_user_owner_of_db
     
     
+    @api_method(inventory=u('list_db_users'),
+                exists=True,
+                message="Can't grant permission for non-existent '{}' database user.")
     def grant_db_permissions(self,
                              username=BLANK_STR,
                              database=BLANK_STR,
                              db_type=u("postgresql")):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't grant permission for non-existent '{}' database user."
-        _existing_database_users = self.list_db_users()
-        _db_user = {u('username'): username}
-        
-        if already_exists(_db_user, _existing_database_users):
-            self._runner.try_api_call(_caller,
-                                      self._server.grant_db_permissions,
-                                      _arguments)
-        else: #_db_user not already in _existing_database_users
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Grants a database user full access to a database.
+        """
     #/grant_db_permissions
     
     
+    @api_method(inventory=u('list_db_users'),
+                exists=True,
+                message="Can't revoke permission for non-existent '{}' database user.")
     def revoke_db_permissions(self,
                               username=BLANK_STR,
                               database=BLANK_STR,
                               db_type=u("postgresql")):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't revoke permission for non-existent '{}' database user."
-        _existing_database_users = self.list_db_users()
-        _db_user = {u('username'): username}
-        
-        if already_exists(_db_user, _existing_database_users):
-            self._runner.try_api_call(_caller,
-                                      self._server.revoke_db_permissions,
-                                      _arguments)
-        else: #_db_user not already in _existing_database_users
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Revokes a database user's access to a database.
+        """
     #/revoke_db_permissions
     
     
+    @api_method(inventory=u('list_dbs'),
+                exists=True,
+                message="Can't enable addon for non-existent '{}' database.")
     def enable_addon(self,
                      database=BLANK_STR,
                      db_type=u("postgresql"),
                      addon=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't enable addon for non-existent '{}' database."
-        _existing_databases = self.list_dbs()
-        _database = {u('database'): database}
-        
-        if already_exists(_database, _existing_databases):
-            self._runner.try_api_call(_caller,
-                                      self._server.enable_addon,
-                                      _arguments)
-        else: #_database not already in _existing_databases
-            self._runner.log(_caller, FAILURE, u(_msg).format(database))
+        """
+        Enables a database addon, such as PostGIS.
+        """
     #/enable_addon
     
+    
+    def provision_dbs(self,
+                      manifest,
+                      concurrency=None,
+                      batch_size=None,
+                      progress=None):
+        """
+        Sets up what is missing of the databases and database users in 
+        `manifest`, a mapping whose `dbs` are mappings of `create_db` 
+        arguments with an optional `owner`, `grants` of usernames, and 
+        `addons`, and whose `users` are mappings of `create_db_user` 
+        arguments.  `list_dbs` and `list_db_users` are fetched once.  The 
+        missing databases and users are created first, then ownership, grants 
+        and addons are set up, skipping any whose database or user failed, 
+        each step batched, or from `concurrency` threads.  Returns one 
+        `BulkReport` of both steps.
+        """
+        try:
+            _dbs = self._runner.inventory(self.list_dbs)
+            _users = self._runner.inventory(self.list_db_users)
+        except DeadlineExceeded: #Every call fails unsent.
+            _dbs = _users = ()
+        _first, _second = db_manifest_calls(self, manifest, _dbs, _users)
+        return self._runner.run_bulk_steps(_first,
+                                           _second,
+                                           concurrency,
+                                           batch_size,
+                                           progress)
+    #/provision_dbs
+    
 #/Database
 
 
@@ -955,32 +1833,24 @@ class File(object):
     #/__init__
     
     
+    @api_method()
     def replace_in_file(self,
                         filename=BLANK_STR,
                         changes=[]):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.replace_in_file,
-                                  _arguments)
+        """
+        Replaces each `(old, new)` pair of `changes` in a file.
+        """
     #/replace_in_file
     
     
+    @api_method()
     def write_file(self,
                    filename=BLANK_STR,
                    str=BLANK_STR,
                    mode=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.write_file,
-                                  _arguments)
+        """
+        Writes `str` to a file.
+        """
     #/write_file
 
 #/File
@@ -996,68 +1866,79 @@ class ShellUser(object):
     
     
     def list_users(self):
-        return self._server.list_users(self._session_id)
+        return self._runner.list_api_call(self._server.list_users)
     #/list_users
     
     
+    @api_method(inventory=u('list_users'),
+                exists=False,
+                effect=INVENTORY_ADD,
+                message="Can't create already existing '{}' shell user.")
     def create_user(self,
                     username=BLANK_STR,
                     shell=BLANK_STR,
                     groups=[]):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't create already existing '{}' shell user."
-        _existing_shellusers = self.list_users()
-        _shell_user = {u('username'): username}
-        
-        if not already_exists(_shell_user, _existing_shellusers):
-            self._runner.try_api_call(_caller,
-                                      self._server.create_user,
-                                      _arguments)
-        else: #_shell_user already in _existing_shellusers
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Creates a shell user.
+        """
     #/create_user
     
     
+    @api_method(inventory=u('list_users'),
+                exists=True,
+                effect=INVENTORY_REMOVE,
+                message="Can't delete non-existent '{}' shell user.")
     def delete_user(self,
                     username=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't delete non-existent '{}' shell user."
-        _existing_shellusers = self.list_users()
-        _shell_user = {u('username'): username}
-        
-        if already_exists(_shell_user, _existing_shellusers):
-            self._runner.try_api_call(_caller,
-                                      self._server.delete_user,
-                                      _arguments)
-        else: #_shell_user not already in _existing_shellusers
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Deletes a shell user.
+        """
     #/delete_user
     
     
+    @api_method(inventory=u('list_users'),
+                exists=True,
+                message="Can't change password for non-existent '{}' shell user.",
+                idempotent=True)
     def change_user_password(self,
                              username=BLANK_STR,
                              password=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        _msg = "Can't change password for non-existent '{}' shell user."
-        _existing_shellusers = self.list_users()
-        _shell_user = {u('username'): username}
-        
-        if already_exists(_shell_user, _existing_shellusers):
-            self._runner.try_api_call(_caller,
-                                      self._server.change_user_password,
-                                      _arguments)
-        else: #_shell_user not already in _existing_shellusers
-            self._runner.log(_caller, FAILURE, u(_msg).format(username))
+        """
+        Changes a shell user's password.
+        """
     #/change_user_password
+    
+    
+    def sync_users(self,
+                   roster,
+                   prune=False,
+                   concurrency=None,
+                   batch_size=None,
+                   progress=None):
+        """
+        Syncs the shell users in `roster`, each a mapping or sequence of 
+        `username`, `shell`, `groups` and `password`, against one `list_users`
+        snapshot, which is kept current as users are created and deleted.  
+        Missing users are created and then given their password, existing 
+        users' passwords are changed, and, if `prune`, users missing from the 
+        roster are deleted, though never the account's own.  Calls are 
+        batched, or sent from `concurrency` threads.  Returns a `BulkReport`.
+        """
+        try:
+            _users = self._runner.inventory(self.list_users)
+        except DeadlineExceeded: #Every call fails unsent.
+            _users = InventoryIndex(key=u('username'))
+        _first, _second = shell_user_calls(self,
+                                           roster,
+                                           _users,
+                                           prune,
+                                           [self._runner.account[u('username')]])
+        return self._runner.run_bulk_steps(_first,
+                                           _second,
+                                           concurrency,
+                                           batch_size,
+                                           progress)
+    #/sync_users
 
 #/ShellUser
 
@@ -1072,12 +1953,12 @@ class Server(object):
     
     
     def list_ips(self):
-        return self._server.list_ips(self._session_id)
+        return self._runner.list_api_call(self._server.list_ips)
     #/list_ips
     
     
     def list_machines(self):
-        return self._server.list_machines(self._session_id)
+        return self._runner.list_api_call(self._server.list_machines)
     #/list_machines
 
 #/Server
@@ -1092,182 +1973,2564 @@ class System(object):
     #/__init__
     
     
+    @api_method()
     def system(self,
                cmd=BLANK_STR):
-        
-        _current_frame = inspect.currentframe()
-        _caller = get_frame_name(_current_frame)
-        _arguments = get_arguments(_current_frame)
-        
-        self._runner.try_api_call(_caller,
-                                  self._server.system,
-                                  _arguments)
+        """
+        Runs a shell command on the server.
+        """
     #/system
 
 #/System
 
-class Runner(object):
+class ConnectionPool(object):
     """
-    Class that logs an execution result for each server call and reports the 
-    full session results in HTML format.
+    Thread-safe pool of keep-alive HTTP(S) connections, kept per host, that 
+    can be shared by every `Runner` talking to the same API.  Tracks reuse 
+    hits, new connections, stale reconnects, and time spent connecting.
     """
     
-    def __init__(self):
-        self._run_results = OrderedDict()
-        self._run_results[SUCCESS] = []
-        self._run_results[FAILURE] = []
-        self._server = None
-        self._session_id = BLANK_STR
-        self._account = None
+    def __init__(self, max_per_host=POOL_SIZE, ssl_context=None):
+        self._max_per_host = max_per_host
+        self._ssl_context = ssl_context or ssl.create_default_context()
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.new_connections = 0
+        self.reconnects = 0
+        self.handshake_time = 0.0
     #/__init__
     
     
-    @property
-    def server(self):
-        return self._server
+    def acquire(self, _host, _https=True, _timeout=None):
+        """
+        Returns an idle connection to `_host`, or a newly opened one, along 
+        with whether it was reused.  A new connection must be opened within 
+        `_timeout` seconds.
+        """
+        with self._lock:
+            _idle = self._idle.get((_host, _https))
+            if _idle:
+                self.hits += 1
+                return _idle.pop(), True
+        
+        if _https:
+            _connection = _http_client.HTTPSConnection(
+                                                _host,
+                                                timeout=_timeout,
+                                                context=self._ssl_context)
+        else:
+            _connection = _http_client.HTTPConnection(_host, timeout=_timeout)
+        
+        _started = _perf_counter()
+        _connection.connect()
+        with self._lock:
+            self.new_connections += 1
+            self.handshake_time += _perf_counter() - _started
+        return _connection, False
+    #/acquire
     
-    @property
-    def session_id(self):
-        return self._session_id
     
-    @property
-    def account(self):
-        return self._account
+    def release(self, _host, _https, _connection):
+        """
+        Returns a healthy connection to the pool, closing it if the pool for 
+        `_host` is already full.
+        """
+        with self._lock:
+            _idle = self._idle.setdefault((_host, _https), [])
+            if len(_idle) < self._max_per_host:
+                _idle.append(_connection)
+                return
+        _connection.close()
+    #/release
     
     
-    def login_to_server(self, _username, _password):
+    def discard(self, _connection, _stale=False):
         """
-        Logs in to server using `_username` and `_password` and sets session 
-        variables.
+        Closes a connection that can't be reused, counting it as a reconnect 
+        if it was a `_stale` keep-alive connection.
         """
-        
-        self._server = _xmlrpc.ServerProxy(API_URL)
-        self._session_id, self._account = self._server.login(_username,
-                                                              _password)
-        
-        print(u(" Logged in to server '{0}' as user '{1}'.").format(
-                                                    self._account['web_server'],
-                                                    self._account['username']))
-    #/login_to_server
+        _connection.close()
+        if _stale:
+            with self._lock:
+                self.reconnects += 1
+    #/discard
     
     
-    def log(self, _caller, _key, _result, datetime=datetime):
+    def stats(self):
         """
-        Logs individual execution result for a server call.
+        Returns the pool statistics as a dictionary.
         """
-        _result = [text_type(datetime.now()) + u(" | ") + u(_caller) + u(" | ")] + [_result]
-        self._run_results[_key].append(_result)
-    #/log
+        with self._lock:
+            return {u('hits'): self.hits,
+                    u('new_connections'): self.new_connections,
+                    u('reconnects'): self.reconnects,
+                    u('handshake_time'): self.handshake_time,
+                    u('idle'): sum(len(_idle) for _idle in self._idle.values())}
+    #/stats
     
     
-    def try_api_call(self, _caller, _api_call, _args):
+    def close(self):
         """
-        Calls passed API signature with passed arguments and logs results.
+        Closes every idle connection.
         """
-        
-        try:
-            _result = _api_call(self._session_id, *_args)
-        except TypeError as error:
-            self.log(_caller, FAILURE, _error)
-        except _xmlrpc.Fault as fault:
-            _fault = COMMA_SEP.join([u(text_type(fault.faultCode)),
-                                      u(text_type(fault.faultString))])
-            self.log(_caller, FAILURE, _fault)
-        except _xmlrpc.ProtocolError as error:
-            _error = COMMA_SEP.join([u(text_type(error.url)),
-                                      u(text_type(error.errcode)),
-                                      u(text_type(error.errmsg))])
-            self.log(_caller, FAILURE, _error)
-        else: #try succeeded
-            self.log(_caller, SUCCESS, _result)
-    #/try_api_call
+        with self._lock:
+            _idle, self._idle = self._idle, {}
+        for _connections in _idle.values():
+            for _connection in _connections:
+                _connection.close()
+    #/close
+
+#/ConnectionPool
+
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.  A 
+    token may be reserved before it has been refilled, the bucket going into 
+    debt, so that waiting callers are served in the order they reserved.  
+    Time is read from `clock`, by default a high-resolution timer.
+    """
     
+    def __init__(self, rate, capacity, clock=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock or _perf_counter
+        self._tokens = self.capacity
+        self._stamp = self._clock()
+    #/__init__
     
-    def process_results(self):
+    
+    def reserve(self):
         """
-        Processes a dictionary of execution result lists into string 
-        representations wrapped in the HTML needed to create <li> nodes.
+        Takes one token and returns the seconds until it is available.  Not 
+        thread-safe on its own; callers hold a lock.
         """
-        _html = "      "
-        for result_type, results_list in self._run_results.items():
-            for result_list in results_list:
-                _li = BLANK_STR
-                for result in result_list:
-                    _list = []
-                    _string = BLANK_STR
-                    if isinstance(result, dict) or isinstance(result, list):
-                        _list = list(flatten_iterable(result))
-                        _string = concatenate_list_to_string(_list)
-                    elif (isinstance(result, text_type) and result != BLANK_STR):
-                        _string = result
-                    else:
-                        _string = enquote(u("API returns empty result for this type of call."))
-                    
-                    _li += _string
-                _html += u("<li class='") + result_type + u("'>") + _li + u("</li>")
-        return _html
-    #/process_results
+        _now = self._clock()
+        self._tokens = min(self.capacity,
+                           self._tokens + (_now - self._stamp) * self.rate)
+        self._stamp = _now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+    #/reserve
+
+#/TokenBucket
+
+
+
+class RateLimiter(object):
+    """
+    Thread-safe client-side limit on the rate of API requests, that can be 
+    shared by every `Runner` sending them.  At most `rate` requests a second 
+    are sent in all, in bursts of up to `burst`, and, if `account_rate` is set, 
+    at most `account_rate` a second for each account, in bursts of up to 
+    `account_burst`.  Requests over the limit wait for a token rather than 
+    fail.  Tracks how many requests were throttled and for how long.  The 
+    buckets read the time from `clock`, if given.
+    """
+    
+    def __init__(self,
+                 rate=None,
+                 burst=None,
+                 account_rate=None,
+                 account_burst=None,
+                 clock=None):
+        self._clock = clock
+        self._global = (None if rate is None else
+                        TokenBucket(rate, burst or max(1.0, rate), clock))
+        self._account_rate = account_rate
+        self._account_burst = account_burst or max(1.0, account_rate or 0.0)
+        self._accounts = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled_calls = 0
+        self.throttled_time = 0.0
+        self._account_stats = {}
+    #/__init__
     
     
-    def report(self):
+    def reserve(self, _account=None):
         """
-        Constructs an HTML report of execution results.
+        Reserves a token for one request made for `_account` and returns the 
+        seconds to wait before sending it, without waiting.
         """
-        global HTML_START, HTML_END
-        
-        html_report = self.process_results()
-        return HTML_START + html_report + HTML_END
-    #/report
+        with self._lock:
+            _delay = self._global.reserve() if self._global is not None else 0.0
+            if self._account_rate is not None:
+                _bucket = self._accounts.get(_account)
+                if _bucket is None:
+                    _bucket = self._accounts[_account] = TokenBucket(
+                                                        self._account_rate,
+                                                        self._account_burst,
+                                                        self._clock)
+                _delay = max(_delay, _bucket.reserve())
+            
+            _stats = self._account_stats.setdefault(_account, [0, 0, 0.0])
+            _stats[0] += 1
+            self.calls += 1
+            if _delay:
+                _stats[1] += 1
+                _stats[2] += _delay
+                self.throttled_calls += 1
+                self.throttled_time += _delay
+        return _delay
+    #/reserve
+    
+    
+    def acquire(self, _account=None):
+        """
+        Waits for a token for one request made for `_account` and returns the 
+        seconds waited.
+        """
+        _delay = self.reserve(_account)
+        if _delay:
+            time.sleep(_delay)
+        return _delay
+    #/acquire
     
     
-    def read_script_from_file(self, _script_file):
-        try:
-            with open(_script_file, u('r')) as _script_source:
-                _script_code = compile(_script_source.read(),
-                                       _script_file,
-                                       u('exec'))
-                exec(_script_code)
-        except (OSError, IOError) as e:
-            print(u("Error opening script file."))
-    #/read_script_from_file
+    def stats(self):
+        """
+        Returns the limiter statistics as a dictionary, with a breakdown by 
+        account.
+        """
+        with self._lock:
+            return {u('calls'): self.calls,
+                    u('throttled_calls'): self.throttled_calls,
+                    u('throttled_time'): self.throttled_time,
+                    u('accounts'): dict(
+                        (_account, {u('calls'): _stats[0],
+                                    u('throttled_calls'): _stats[1],
+                                    u('throttled_time'): _stats[2]})
+                        for _account, _stats in self._account_stats.items())}
+    #/stats
+
+#/RateLimiter
+
+
+
+class PooledTransport(_xmlrpc.Transport):
+    """
+    XML-RPC transport that borrows its connection for each request from a 
+    `ConnectionPool`, transparently reconnecting once if a reused keep-alive 
+    connection has gone stale.  An `observer` is told the request and 
+    response sizes, in bytes, of each exchange.  `timeouts`, if given, is 
+    asked for the connect and read timeouts, in seconds, of each request; 
+    running out of either raises `ConnectTimeout` or `ReadTimeout`.
+    """
     
+    def __init__(self, pool=None, https=True, observer=None, timeouts=None):
+        _xmlrpc.Transport.__init__(self)
+        self._pool = pool if pool is not None else ConnectionPool()
+        self._https = https
+        self._observer = observer
+        self._timeouts = timeouts
+    #/__init__
     
-    def write_report_to_file(self, _report_file):
-        try:
-            with open(_report_file, u('a')) as _report_target:
-                _report_target.write(self.report())
-        except (OSError, IOError) as e:
-            print(u("Error writing report file."))
-    #/write_report_to_file
     
-#/Runner
+    def request(self, host, handler, request_body, verbose=False):
+        _host, _extra_headers = self.get_host_info(host)[:2]
+        self.verbose = verbose
+        _connect_timeout, _read_timeout = (self._timeouts() if self._timeouts
+                                           else (None, None))
+        
+        while True:
+            try:
+                _connection, _reused = self._pool.acquire(_host,
+                                                          self._https,
+                                                          _connect_timeout)
+            except socket.timeout:
+                raise ConnectTimeout(u("Connecting to {0} timed out.").format(
+                                                                        _host))
+            try:
+                _connection.timeout = _read_timeout
+                if _connection.sock is not None: #Else reopened on request.
+                    _connection.sock.settimeout(_read_timeout)
+                return self._pooled_request(_host,
+                                            handler,
+                                            request_body,
+                                            _extra_headers or [],
+                                            _connection)
+            except socket.timeout:
+                self._pool.discard(_connection)
+                raise ReadTimeout(u("No response from {0} in time.").format(
+                                                                        _host))
+            except (socket.error, _http_client.HTTPException):
+                self._pool.discard(_connection, _reused)
+                if not _reused: #A fresh connection failed, so give up.
+                    raise
+            except BaseException:
+                self._pool.discard(_connection)
+                raise
+    #/request
+    
+    
+    def _pooled_request(self,
+                        _host,
+                        _handler,
+                        _request_body,
+                        _extra_headers,
+                        _connection):
+        """
+        Posts one request on `_connection` and returns the parsed response, 
+        handing the connection back to the pool, once the response has been 
+        read in full, unless the server closes it.  A `Fault` in the response 
+        is raised only after that, as it leaves the connection healthy.
+        """
+        _connection.putrequest(u('POST'), _handler, skip_accept_encoding=True)
+        for _header, _value in _extra_headers:
+            _connection.putheader(_header, _value)
+        _connection.putheader(u('User-Agent'), self.user_agent)
+        _connection.putheader(u('Content-Type'), u('text/xml'))
+        _connection.putheader(u('Content-Length'), text_type(len(_request_body)))
+        _connection.endheaders(_request_body)
+        
+        _response = _connection.getresponse()
+        _body = _response.read()
+        if self._observer is not None: #Sized as read, for unsized responses.
+            self._observer(len(_request_body), len(_body))
+        
+        if _response.will_close:
+            self._pool.discard(_connection)
+        else:
+            self._pool.release(_host, self._https, _connection)
+        
+        if _response.status != 200:
+            raise _xmlrpc.ProtocolError(_host + _handler,
+                                        _response.status,
+                                        _response.reason,
+                                        _response.msg)
+        if self.verbose:
+            print(u("body:"), repr(_body))
+        _parser, _unmarshaller = self.getparser()
+        _parser.feed(_body)
+        _parser.close()
+        return _unmarshaller.close()
+    #/_pooled_request
 
+#/PooledTransport
 
-def main():
+
+
+def format_result(result_type, result_list):
     """
-    Parses arguments and handles file IO if specified.
+    Renders one logged result as the HTML `<li>` node of the run report.
     """
+    _parts = []
+    for result in result_list:
+        if isinstance(result, dict) or isinstance(result, list):
+            _list = list(flatten_iterable(result))
+            _parts.append(concatenate_list_to_string(_list))
+        elif (isinstance(result, text_type) and result != BLANK_STR):
+            _parts.append(result)
+        else:
+            _parts.append(enquote(u("API returns empty result for this type of call.")))
     
-    parser = argparse.ArgumentParser(description=u("A robust client to the WebFaction server API."))
+    return (u("<li class='") + result_type + u("'>") +
+            BLANK_STR.join(_parts) + u("</li>"))
+#/format_result
+
+
+
+class ReportWriter(object):
+    """
+    Streaming HTML report sink.  Writes the report header when opened, one 
+    `<li>` node per result as it is logged, and the footer on `close()`.  
+    Writes are buffered and flushed at least every `flush_interval` seconds, 
+    so an interrupted run still leaves a readable partial report.
+    """
     
-    parser.add_argument(u("username"), help=u("The WebFaction server control panel username."))
-    parser.add_argument(u("password"), help=u("The WebFaction server control panel password."))
-    parser.add_argument(u("--scriptfile"), help=u("File of scripted commands to execute."))
-    parser.add_argument(u("--reportfile"), help=u("File into which to write run results."))
+    def __init__(self, target, flush_interval=REPORT_FLUSH_INTERVAL):
+        if hasattr(target, u('write')): #File-like object.
+            self._file = target
+            self._owns_file = False
+        else: #File path; appended to, as with `write_report_to_file`.
+            self._file = open(target, u('a'))
+            self._owns_file = True
+        self._flush_interval = flush_interval
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._file.write(HTML_START + u("      "))
+    #/__init__
     
-    args = parser.parse_args()
     
-    runner = Runner()
+    def __enter__(self):
+        return self
+    
     
-    runner.login_to_server(args.username, args.password)
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    
+    def write(self, result_type, result_list):
+        """
+        Appends the `<li>` node of one logged result to the report.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._file.write(format_result(result_type, result_list))
+            if time.time() - self._flushed >= self._flush_interval:
+                self._flush()
+    #/write
+    
+    
+    def flush(self):
+        """
+        Pushes buffered report nodes to the target.
+        """
+        with self._lock:
+            if not self._closed:
+                self._flush()
+    #/flush
     
-    if args.scriptfile:
-        _script_file = os.path.normpath(args.scriptfile)
-        runner.read_script_from_file(_script_file)
+    
+    def _flush(self):
+        self._file.flush()
+        self._flushed = time.time()
+    #/_flush
+    
+    
+    def close(self, summary=BLANK_STR):
+        """
+        Writes the report footer, preceded by any HTML `summary`, and closes a 
+        target opened by path.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._file.write(HTML_RESULTS_END + summary + HTML_DOCUMENT_END)
+            self._flush()
+            if self._owns_file:
+                self._file.close()
+    #/close
+
+#/ReportWriter
+
+
+#One call planned by `Runner.plan()`: its expected `outcome`, the API 
+#`method`, its `arguments` with secrets redacted, and why it would be skipped 
+#or fail, if it would.
+PlannedCall = namedtuple(u('PlannedCall'), [u('outcome'),
+                                            u('method'),
+                                            u('arguments'),
+                                            u('message')])
+
+
+class Plan(object):
+    """
+    Calls planned by `Runner.plan()`, in the order they were made, each with 
+    its expected outcome.
+    """
+    
+    def __init__(self):
+        self.calls = []
+    #/__init__
+    
+    
+    def add(self, outcome, method_name, arguments, message=BLANK_STR):
+        """
+        Records one planned call to `method_name` with API `arguments`.
+        """
+        self.calls.append(PlannedCall(outcome,
+                                      method_name,
+                                      redact_arguments(method_name, arguments),
+                                      message))
+    #/add
+    
+    
+    def counts(self):
+        """
+        Returns the number of planned calls with each outcome.
+        """
+        _counts = OrderedDict()
+        for _call in self.calls:
+            _counts[_call.outcome] = _counts.get(_call.outcome, 0) + 1
+        return _counts
+    #/counts
+    
+    
+    def changes(self):
+        """
+        Returns the planned calls that would be sent.
+        """
+        return [_call for _call in self.calls
+                if _call.outcome not in (PLAN_SKIP_EXISTS, PLAN_FAIL_MISSING)]
+    #/changes
+    
+    
+    def write(self, target):
+        """
+        Writes the plan as JSON to `target`, a path or file-like object.
+        """
+        _document = text_type(json.dumps(
+                        {u('counts'): self.counts(),
+                         u('calls'): [dict(zip(PlannedCall._fields, _call))
+                                      for _call in self.calls]},
+                        indent=2))
+        if hasattr(target, u('write')):
+            target.write(_document)
+        else:
+            with open(target, u('w')) as _plan_file:
+                _plan_file.write(_document)
+    #/write
+
+#/Plan
+
+
+
+class Task(object):
+    """
+    One call in a `TaskGraph`: the resource class method `call`, made with 
+    `args` and `kwargs` once every task it `depends_on` has succeeded.  Its 
+    `status` is `None` until it has run, then `SUCCESS`, `FAILURE`, or 
+    `SKIPPED`, and `result` holds what the call returned.
+    """
+    
+    def __init__(self, call, args, kwargs, depends_on=()):
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.depends_on = list(depends_on)
+        self.status = None
+        self.result = None
+    #/__init__
+    
+    
+    @property
+    def api_method(self):
+        return getattr(self.call, u('api_method'), None)
+    
+    
+    @property
+    def kind(self):
+        """
+        The inventory listing the task's entity, if any.
+        """
+        _api_method = self.api_method
+        if _api_method is None:
+            return None
+        return _api_method.inventory or next(iter(_api_method.invalidates),
+                                             None)
+    
+    
+    @property
+    def name(self):
+        _subject = self.args[0] if self.args else BLANK_STR
+        return u("{0}('{1}')").format(self.call.__name__, _subject)
+    
+    
+    def blocker(self):
+        """
+        Returns the first dependency that failed or was skipped, if any.
+        """
+        for _task in self.depends_on:
+            if _task.status in (FAILURE, SKIPPED):
+                return _task
+        return None
+    #/blocker
+    
+    
+    def ready(self):
+        """
+        Checks whether every dependency has succeeded.
+        """
+        return all(_task.status == SUCCESS for _task in self.depends_on)
+    #/ready
+
+#/Task
+
+
+
+def referenced_names(argument, domains=False):
+    """
+    Yields the names in a marshalled API `argument`, splitting joined lists, 
+    and, for `domains`, each parent domain of a dotted name, such as 
+    `example.com` for `www.example.com`.
+    """
+    if isinstance(argument, (list, tuple)):
+        for _item in argument:
+            for _name in referenced_names(_item, domains):
+                yield _name
+    elif isinstance(argument, (text_type, binary_type)) and argument:
+        for _name in argument.split(u(',')):
+            _labels = _name.strip().split(u('.'))
+            if not domains:
+                yield _name.strip()
+                continue
+            for _index in range(max(len(_labels) - 1, 1)):
+                yield u('.').join(_labels[_index:])
+#/referenced_names
+
+
+
+class TaskGraph(object):
+    """
+    Calls submitted to `Runner.graph()`, each a `Task` depending on the tasks 
+    passed as its `after` argument and on the earlier tasks whose entity it 
+    names.  A task's entity is its first argument, of the kind its inventory 
+    lists, and only the parameters in `REFERENCE_PARAMETERS` name entities of 
+    other kinds, so `create_website` with subdomain `www.example.com` and app 
+    `shop` follows `create_domain` of `example.com` and `create_app` of 
+    `shop`, but not `create_db` of `shop`.  Calls on one entity run in the 
+    order they were added.
+    """
+    
+    def __init__(self):
+        self.tasks = []
+        self._subjects = {}
+    #/__init__
+    
+    
+    def add(self, call, *args, **kwargs):
+        """
+        Adds a task making `call`, a resource class method, with `args` and 
+        `kwargs`, once the tasks in the keyword argument `after` and those 
+        inferred from its arguments have succeeded.  Returns the `Task`.
+        """
+        _depends_on = list(kwargs.pop(u('after'), ()))
+        _task = Task(call, args, kwargs)
+        
+        if _task.api_method is not None:
+            _arguments = _task.api_method.marshal(args, kwargs)
+            _references = []
+            if _arguments:
+                _references.append((_task.kind, _arguments[:1]))
+            for _parameter, _argument in zip(_task.api_method.parameters,
+                                             _arguments):
+                if _parameter in REFERENCE_PARAMETERS:
+                    _references.append((REFERENCE_PARAMETERS[_parameter],
+                                        _argument))
+            
+            for _kind, _argument in _references:
+                for _name in referenced_names(_argument,
+                                              _kind == u('list_domains')):
+                    _earlier = self._subjects.get((_kind, _name))
+                    if _earlier is not None and _earlier not in _depends_on:
+                        _depends_on.append(_earlier)
+            if _arguments and isinstance(_arguments[0],
+                                         (text_type, binary_type)):
+                self._subjects[(_task.kind, _arguments[0])] = _task
+        
+        _task.depends_on = _depends_on
+        self.tasks.append(_task)
+        return _task
+    #/add
+
+#/TaskGraph
+
+
+
+#One call made by `Runner.run_bulk()` for the record identified by `key`: 
+#the resource class method `call` with `args` and `kwargs`, taking `action`.
+BulkCall = namedtuple(u('BulkCall'), [u('key'),
+                                      u('action'),
+                                      u('call'),
+                                      u('args'),
+                                      u('kwargs')])
+
+#Outcome of one record of a bulk operation: `SUCCESS`, `FAILURE`, or 
+#`SKIPPED` for a record the inventory showed needs no call, with a message.
+BulkOutcome = namedtuple(u('BulkOutcome'), [u('key'),
+                                            u('action'),
+                                            u('outcome'),
+                                            u('message')])
+
+
+
+class BulkReport(object):
+    """
+    Outcomes of a bulk operation, one `BulkOutcome` per record, in the order 
+    the records were given.
+    """
+    
+    def __init__(self, size=0):
+        self.rows = [None] * size
+    #/__init__
+    
+    
+    def settle(self, index, outcome):
+        """
+        Records the `BulkOutcome` of the record at `index`.
+        """
+        self.rows[index] = outcome
+    #/settle
+    
+    
+    def counts(self):
+        """
+        Returns the number of records with each outcome.
+        """
+        _counts = OrderedDict()
+        for _row in self.rows:
+            if _row is not None:
+                _counts[_row.outcome] = _counts.get(_row.outcome, 0) + 1
+        return _counts
+    #/counts
+    
+    
+    def failures(self):
+        """
+        Returns the outcomes of the records that failed.
+        """
+        return [_row for _row in self.rows
+                if _row is not None and _row.outcome == FAILURE]
+    #/failures
+    
+    
+    def format(self):
+        """
+        Renders the outcomes as a plain-text table.
+        """
+        _rows = [BulkOutcome._fields] + [_row for _row in self.rows
+                                         if _row is not None]
+        _widths = [max(len(text_type(_row[_column])) for _row in _rows)
+                   for _column in range(len(BulkOutcome._fields))]
+        return u("\n").join(u("  ").join(text_type(_cell).ljust(_width)
+                                         for _cell, _width
+                                         in zip(_row, _widths)).rstrip()
+                            for _row in _rows)
+    #/format
+    
+    
+    def write(self, target):
+        """
+        Writes the outcomes as JSON to `target`, a path or file-like object.
+        """
+        _document = text_type(json.dumps(
+                        {u('counts'): self.counts(),
+                         u('records'): [dict(zip(BulkOutcome._fields, _row))
+                                        for _row in self.rows
+                                        if _row is not None]},
+                        indent=2))
+        if hasattr(target, u('write')):
+            target.write(_document)
+        else:
+            with open(target, u('w')) as _report_file:
+                _report_file.write(_document)
+    #/write
+
+#/BulkReport
+
+
+
+class SessionCache(object):
+    """
+    Sessions of logged-in accounts, by username, kept in a JSON file at 
+    `path` that only its owner may read or write, so later runs can skip 
+    `login`.  A session is only reused on the API endpoint that opened it, 
+    and a file others can read is ignored rather than trusted.
+    """
+    
+    def __init__(self, path=SESSION_FILE):
+        self._path = path
+        self._lock = threading.Lock()
+    #/__init__
+    
+    
+    @property
+    def path(self):
+        return self._path
+    
+    
+    def _load(self):
+        try:
+            if os.name == u('posix') and os.stat(self._path).st_mode & 0o077:
+                return {}
+            with open(self._path, u('r')) as _session_source:
+                return json.load(_session_source)
+        except (OSError, IOError, ValueError):
+            return {}
+    #/_load
+    
+    
+    def _save(self, _sessions):
+        _descriptor = os.open(self._path,
+                              os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                              0o600)
+        with open(_descriptor, u('w')) as _session_target:
+            if os.name == u('posix'):
+                os.fchmod(_descriptor, 0o600)
+            _session_target.write(text_type(json.dumps(_sessions)))
+    #/_save
+    
+    
+    def get(self, username, api_url):
+        """
+        Returns the cached `(session_id, account)` of `username` on `api_url`,
+        if any.
+        """
+        with self._lock:
+            _session = self._load().get(username)
+        if not _session or _session.get(u('api_url')) != api_url:
+            return None
+        return _session[u('session_id')], _session[u('account')]
+    #/get
+    
+    
+    def store(self, username, api_url, session_id, account):
+        """
+        Caches the session of `username` on `api_url`.
+        """
+        with self._lock:
+            _sessions = self._load()
+            _sessions[username] = {u('api_url'): api_url,
+                                   u('session_id'): session_id,
+                                   u('account'): account}
+            self._save(_sessions)
+    #/store
+    
+    
+    def discard(self, username):
+        """
+        Forgets the session of `username`.
+        """
+        with self._lock:
+            _sessions = self._load()
+            if _sessions.pop(username, None) is not None:
+                self._save(_sessions)
+    #/discard
+
+#/SessionCache
+
+
+
+class Runner(object):
+    """
+    Class that logs an execution result for each server call and reports the 
+    full session results in HTML format.
+    """
+    
+    def __init__(self,
+                 inventory_ttl=INVENTORY_TTL,
+                 batch_size=MULTICALL_BATCH_SIZE,
+                 max_workers=MAX_WORKERS,
+                 pool=None,
+                 api_url=None,
+                 retry_policy=None,
+                 rate_limiter=None,
+                 connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT,
+                 session_cache=None):
+        self._run_results = OrderedDict()
+        self._run_results[SUCCESS] = []
+        self._run_results[FAILURE] = []
+        self._run_results[RETRY] = []
+        self._server = None
+        self._session_id = BLANK_STR
+        self._account = None
+        self._inventory_ttl = inventory_ttl
+        self._inventories = {}
+        self._fetches = {}
+        self._inventory_epoch = 0
+        self._inventory_versions = {}
+        self._batch_size = batch_size
+        self._batch = None
+        self._multicall_supported = True
+        self._max_workers = max_workers
+        self._executor = None
+        self._pending = deque()
+        self._in_order = True
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._api_url = api_url or API_URL
+        self._pool = pool if pool is not None else ConnectionPool()
+        self._report_writer = None
+        self._keep_results = True
+        self._metrics = {}
+        self._hooks = {HOOK_BEFORE: [], HOOK_AFTER: [], HOOK_FAULT: []}
+        self._retry_policy = (retry_policy if retry_policy is not None
+                              else RetryPolicy())
+        self._rate_limiter = rate_limiter
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._deadline = None
+        self._plan = None
+        self._session_cache = session_cache
+        self._credentials = None
+    #/__init__
+    
+    
+    @property
+    def server(self):
+        return self._server
+    
+    @property
+    def session_id(self):
+        return self._session_id
+    
+    @property
+    def account(self):
+        return self._account
+    
+    @property
+    def pool(self):
+        return self._pool
+    
+    @property
+    def api_url(self):
+        return self._api_url
+    
+    @property
+    def retry_policy(self):
+        return self._retry_policy
+    
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter
+    
+    
+    @property
+    def session_cache(self):
+        return self._session_cache
+    
+    
+    def login_to_server(self, _username, _password):
+        """
+        Logs in to server using `_username` and `_password` and sets session 
+        variables.  With a session cache, a cached session of `_username` is 
+        resumed instead, and a new one is cached.  Either way, the runner logs 
+        in again should the server report the session expired.
+        """
+        
+        self._server = self._make_server()
+        self._credentials = (_username, _password)
+        _resumed = self._resume_session(_username)
+        if not _resumed:
+            self._throttle(_username)
+            self._session_id, self._account = self._server.login(_username,
+                                                                  _password)
+            self._store_session()
+        self._announce_login(_resumed)
+    #/login_to_server
+    
+    
+    def _announce_login(self, _resumed):
+        """
+        Starts the new session with fresh inventories and says whose it is.
+        """
+        self.invalidate_inventory()
+        
+        print(u(" {0} server '{1}' as user '{2}'.").format(
+                        u("Resumed session on") if _resumed else u("Logged in to"),
+                        self._account['web_server'],
+                        self._account['username']))
+    #/_announce_login
+    
+    
+    def _resume_session(self, _username):
+        """
+        Takes up the cached session of `_username` on the runner's endpoint, 
+        returning whether there was one.
+        """
+        if self._session_cache is None:
+            return False
+        _session = self._session_cache.get(_username, self._api_url)
+        if _session is None:
+            return False
+        self._session_id, self._account = _session
+        return True
+    #/_resume_session
+    
+    
+    def _store_session(self):
+        """
+        Caches the runner's current session, if it has a session cache.
+        """
+        if self._session_cache is not None:
+            self._session_cache.store(self._credentials[0],
+                                      self._api_url,
+                                      self._session_id,
+                                      self._account)
+    #/_store_session
+    
+    
+    def _renew_session(self, _stale_session_id):
+        """
+        Logs in again after a call made with `_stale_session_id` found it 
+        expired, unless another thread already has.  Returns whether the 
+        session was renewed, so the call can be sent again.
+        """
+        if self._credentials is None:
+            return False
+        with self._lock:
+            if self._session_id == _stale_session_id:
+                self._throttle(self._credentials[0])
+                try:
+                    self._session_id, self._account = \
+                            self._make_server().login(*self._credentials)
+                except Exception as error:
+                    self.log(u("LOGIN_TO_SERVER"), FAILURE, describe_fault(error))
+                    return False
+                self._store_session()
+        return True
+    #/_renew_session
+    
+    
+    def log(self, _caller, _key, _result, datetime=datetime, _duration=None):
+        """
+        Logs individual execution result for a server call, along with its 
+        `_duration` in seconds if it was timed.  Secrets in the result are 
+        redacted, so they never reach the report.
+        """
+        _prefix = text_type(datetime.now()) + u(" | ") + u(_caller) + u(" | ")
+        if _duration is not None:
+            _prefix += u("{0:.1f} ms | ").format(_duration * 1000)
+        _result = [_prefix] + [redact_result(_result)]
+        with self._lock:
+            if self._report_writer is not None:
+                self._report_writer.write(_key, _result)
+            if self._keep_results:
+                self._run_results[_key].append(_result)
+    #/log
+    
+    
+    def try_api_call(self, _caller, _api_call, _args, _on_success=None):
+        """
+        Calls passed API signature with passed arguments and logs results.
+        A successful result is also handed to `_on_success`, if supplied, and 
+        returned.  Inside a `batch()` block the call is queued for 
+        `system.multicall`, and inside a `parallel()` block it is sent from a 
+        worker thread; either way a `Future` of the result is returned 
+        instead.  Inside a `plan()` block it is only planned, unchecked.
+        """
+        
+        if self._plan is not None:
+            self._plan.add(PLAN_UNCHECKED, get_method_name(_api_call), _args)
+            return None
+        
+        if self._batch is not None:
+            _future = Future() if Future is not None else None
+            self._batch[1].append((_caller, _api_call, _args, _on_success, _future))
+            if len(self._batch[1]) >= self._batch[0]:
+                self.flush_batch()
+            return _future
+        
+        if self._executor is not None:
+            return self._submit(_caller, _api_call, _args, _on_success)
+        
+        _key, _result, _duration = self._call(_api_call, _args)
+        return self._record(_caller, _key, _result, _on_success, _duration)
+    #/try_api_call
+    
+    
+    def list_api_call(self, _api_call):
+        """
+        Calls passed `list_*` API signature and returns its result, timing it 
+        and running hooks like any other call.  Faults are raised rather than 
+        logged.
+        """
+        _error, _result, _duration = self._invoke(_api_call, ())
+        if _error is not None:
+            raise _error
+        return _result
+    #/list_api_call
+    
+    
+    def call_api_method(self, _api_method, _resource, _arguments):
+        """
+        Makes the call declared by `_api_method` on `_resource` with the 
+        marshalled `_arguments`.  A guarded call is first checked against the 
+        cached inventory; a successful one then updates the cached inventories.
+        """
+        if self._refuse_expired(_api_method):
+            return None
+        
+        _existing = (None if _api_method.inventory is None else
+                     self.inventory(getattr(_resource, _api_method.inventory)))
+        if self._plan is not None:
+            return self._plan_call(_api_method, _existing, _arguments)
+        if self._refuse_guarded(_api_method, _existing, _arguments):
+            return None
+        
+        return self.try_api_call(_api_method.caller,
+                                 getattr(_resource._server, _api_method.name),
+                                 _arguments,
+                                 self._inventory_effect(_api_method, _arguments))
+    #/call_api_method
+    
+    
+    def _refuse_expired(self, _api_method):
+        """
+        Logs a call to `_api_method` as failed, unsent, if the deadline has 
+        passed, and returns whether it has.
+        """
+        if not self._expired():
+            return False
+        self.log(_api_method.caller,
+                 FAILURE,
+                 describe_fault(self._deadline_exceeded()))
+        return True
+    #/_refuse_expired
+    
+    
+    def _refuse_guarded(self, _api_method, _existing, _arguments):
+        """
+        Logs a call to `_api_method` with the marshalled `_arguments` as 
+        failed if its guard turns it back against the `_existing` inventory, 
+        and returns whether it did.
+        """
+        if _existing is None or _api_method.admits(_existing, _arguments):
+            return False
+        self.log(_api_method.caller, FAILURE, _api_method.rejection(_arguments))
+        return True
+    #/_refuse_guarded
+    
+    
+    def _inventory_effect(self, _api_method, _arguments):
+        """
+        Returns the `_on_success` callback applying a successful call's effect 
+        on the cached inventories, or `None` if it has none.
+        """
+        if (_api_method.effect is None and not _api_method.invalidates and
+            not _api_method.adds):
+            return None
+        return partial(self.apply_inventory_effect, _api_method, _arguments[0])
+    #/_inventory_effect
+    
+    
+    @contextmanager
+    def plan(self):
+        """
+        Plans, rather than makes, the calls made within the block, and yields 
+        the `Plan`.  Each inventory is fetched once and treated as a snapshot: 
+        a guarded call is checked against it and planned as a create, update 
+        or delete, or as skipped because its entity exists or failing because 
+        it is missing.  Planned creates and deletes are applied to the 
+        snapshot, so later calls are checked against earlier ones.  Calls with 
+        no guard are planned unchecked.  Nothing is sent but `list_*` calls, 
+        and the snapshot is discarded on exit.
+        """
+        if self._plan is not None: #Already planning.
+            yield self._plan
+            return
+        
+        self._plan = Plan()
+        _inventory_ttl, self._inventory_ttl = self._inventory_ttl, None
+        try:
+            yield self._plan
+        finally:
+            self._plan = None
+            self._inventory_ttl = _inventory_ttl
+            self.invalidate_inventory()
+    #/plan
+    
+    
+    def _plan_call(self, _api_method, _existing, _arguments):
+        """
+        Plans the call declared by `_api_method` with the marshalled 
+        `_arguments`, checking its guard against the `_existing` inventory 
+        snapshot, if it has one.
+        """
+        _message = BLANK_STR
+        if _existing is None:
+            _outcome = PLAN_UNCHECKED
+        elif not _api_method.admits(_existing, _arguments):
+            _outcome = PLAN_FAIL_MISSING if _api_method.exists else PLAN_SKIP_EXISTS
+            _message = _api_method.rejection(_arguments)
+        elif _api_method.effect == INVENTORY_ADD:
+            _outcome = PLAN_CREATE
+            self.add_to_inventory(_api_method.inventory, _arguments[0])
+            for _list_name in _api_method.adds:
+                self.add_to_inventory(_list_name, _arguments[0])
+        elif _api_method.effect == INVENTORY_REMOVE:
+            _outcome = PLAN_DELETE
+            self.remove_from_inventory(_api_method.inventory, _arguments[0])
+        else:
+            _outcome = PLAN_UPDATE if _api_method.exists else PLAN_CREATE
+        
+        self._plan.add(_outcome, _api_method.name, _arguments, _message)
+        return None
+    #/_plan_call
+    
+    
+    def _call(self, _api_call, _args, _attempt=1):
+        """
+        Makes one API call and returns its `log()` key, result, and duration.
+        """
+        _error, _result, _duration = self._invoke(_api_call, _args, _attempt)
+        return self._outcome(_error, _result) + (_duration,)
+    #/_call
+    
+    
+    def _outcome(self, _error, _result):
+        """
+        Returns the `log()` key and result of a call that raised `_error`, or 
+        returned `_result`.  An error that is not an API, transport or 
+        argument error is raised.
+        """
+        if _error is None:
+            return SUCCESS, _result
+        elif isinstance(_error, TypeError):
+            return FAILURE, text_type(_error)
+        elif isinstance(_error, (_xmlrpc.Fault,
+                                 _xmlrpc.ProtocolError,
+                                 DeadlineExceeded) + CONNECTION_ERRORS):
+            return FAILURE, describe_fault(_error)
+        raise _error
+    #/_outcome
+    
+    
+    def _invoke(self, _api_call, _args, _attempt=1):
+        """
+        Makes one API call, timing it, adding it to the metrics, and running 
+        the registered hooks, once the rate limiter, if any, lets it through.  
+        A transient failure is retried as the retry policy allows, sleeping 
+        only the calling thread.  Once the run's deadline has passed the call 
+        fails with `DeadlineExceeded` without being sent.  Every call made on 
+        behalf of a resource class passes through here.  A call finding its 
+        session expired is sent again, once, after logging in again.  Returns 
+        the error raised by the last attempt, or `None`, with its result and 
+        duration.
+        """
+        _method_name = get_method_name(_api_call)
+        _renewed = False
+        while True:
+            _throttled = self._throttle()
+            _error = self._begin_attempt(_method_name, _args, _attempt)
+            if _error is not None:
+                return _error, None, None
+            
+            _result = None
+            _session_id = self._session_id
+            _start = _perf_counter()
+            try:
+                _result = _api_call(_session_id, *_args)
+            except Exception as error:
+                _error = error
+            _duration = _perf_counter() - _start
+            self._end_attempt(_method_name, _args, _attempt, _error, _result,
+                              _duration, _throttled)
+            
+            if (session_expired(_error) and not _renewed and
+                self._renew_session(_session_id)):
+                _renewed = True #Sent again at once, with the new session.
+                continue
+            
+            _delay = self._retry_delay(_method_name, _error, _attempt, _duration)
+            if _delay is None:
+                return _error, _result, _duration
+            time.sleep(_delay)
+            _attempt += 1
+    #/_invoke
+    
+    
+    def _begin_attempt(self, _method_name, _args, _attempt):
+        """
+        Runs the `HOOK_BEFORE` hooks for an `_attempt` at a call about to be 
+        sent.  Once the deadline has passed, runs the `HOOK_FAULT` hooks 
+        instead and returns the `DeadlineExceeded` error to fail it with.
+        """
+        if self._expired():
+            _error = self._deadline_exceeded()
+            if self._hooks[HOOK_FAULT]:
+                self._run_hooks(HOOK_FAULT, _method_name, _args, None,
+                                None, _error, _attempt)
+            return _error
+        
+        if self._hooks[HOOK_BEFORE]:
+            self._run_hooks(HOOK_BEFORE, _method_name, _args, _attempt=_attempt)
+        return None
+    #/_begin_attempt
+    
+    
+    def _end_attempt(self,
+                     _method_name,
+                     _args,
+                     _attempt,
+                     _error,
+                     _result,
+                     _duration,
+                     _throttled):
+        """
+        Adds a sent `_attempt` at a call to the metrics, with the exchange the 
+        transport noted for it, and runs the hooks for its outcome.
+        """
+        self._measure(_method_name,
+                      SUCCESS if _error is None else FAILURE,
+                      _duration,
+                      _retry=_attempt > 1,
+                      _throttled=_throttled)
+        if _error is None:
+            if self._hooks[HOOK_AFTER]:
+                self._run_hooks(HOOK_AFTER, _method_name, _args, _duration,
+                                _result, _attempt=_attempt)
+        elif self._hooks[HOOK_FAULT]:
+            self._run_hooks(HOOK_FAULT, _method_name, _args, _duration,
+                            None, _error, _attempt)
+    #/_end_attempt
+    
+    
+    def _throttle(self, _account=None):
+        """
+        Waits until the rate limiter, if any, admits one more request for 
+        `_account`, by default the logged-in one, and returns the seconds 
+        waited.
+        """
+        if self._rate_limiter is None:
+            return 0.0
+        return self._rate_limiter.acquire(self._limited_account(_account))
+    #/_throttle
+    
+    
+    def _limited_account(self, _account=None):
+        """
+        Returns the account the rate limiter charges a request to: `_account`,
+        by default the logged-in one.
+        """
+        if _account is None and self._account is not None:
+            _account = self._account[u('username')]
+        return _account
+    #/_limited_account
+    
+    
+    @contextmanager
+    def deadline(self, seconds):
+        """
+        Bounds the API calls made within the block to `seconds` in all.  Each 
+        request's connect and read timeouts are cut to the time remaining; 
+        once it runs out, calls still to be sent, including those queued by 
+        `parallel()` and `batch()`, fail with `DeadlineExceeded` instead.  A 
+        nested block can only shorten the deadline, and `None` leaves it as it 
+        is.
+        """
+        _outer = self._deadline
+        if seconds is not None:
+            _deadline = _perf_counter() + seconds
+            self._deadline = (_deadline if _outer is None
+                              else min(_outer, _deadline))
+        try:
+            yield self
+        finally:
+            self._deadline = _outer
+    #/deadline
+    
+    
+    def remaining(self):
+        """
+        Returns the seconds left before the deadline, or `None` if there is 
+        none.
+        """
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - _perf_counter())
+    #/remaining
+    
+    
+    def _expired(self):
+        """
+        Checks whether the deadline has passed.
+        """
+        return self._deadline is not None and _perf_counter() >= self._deadline
+    #/_expired
+    
+    
+    def _deadline_exceeded(self):
+        return DeadlineExceeded(u("Deadline passed; call not sent."))
+    
+    
+    def _timeouts(self):
+        """
+        Returns the connect and read timeouts for a request sent now, cut to 
+        the time left before the deadline.
+        """
+        _remaining = self.remaining()
+        if _remaining is None:
+            return self._connect_timeout, self._read_timeout
+        return tuple(_remaining if _timeout is None else min(_timeout, _remaining)
+                     for _timeout in (self._connect_timeout, self._read_timeout))
+    #/_timeouts
+    
+    
+    def _retry_delay(self, _method_name, _error, _attempt, _duration=None):
+        """
+        Returns the seconds to wait before retrying a call to `_method_name` 
+        whose `_attempt` failed with `_error`, logging the failed attempt, or 
+        `None` if the call is not to be retried.
+        """
+        _policy = self._retry_policy
+        if (_error is None or
+            _attempt >= _policy.max_attempts or
+            not _policy.applies_to(_method_name) or
+            not _policy.retryable(_error)):
+            return None
+        
+        _delay = _policy.backoff(_attempt)
+        if (self._deadline is not None and
+            _perf_counter() + _delay >= self._deadline):
+            return None
+        self.log(_method_name.upper(),
+                 RETRY,
+                 u("Attempt {0} of {1} failed, retrying in {2:.2f} s: {3}").format(
+                                                    _attempt,
+                                                    _policy.max_attempts,
+                                                    _delay,
+                                                    describe_fault(_error)),
+                 _duration=_duration)
+        return _delay
+    #/_retry_delay
+    
+    
+    def add_hook(self, event, callback):
+        """
+        Registers `callback` to be called with a `CallEvent` for every API 
+        call: before it is sent (`HOOK_BEFORE`), after it succeeds 
+        (`HOOK_AFTER`), or after it faults (`HOOK_FAULT`).  Hooks run on the 
+        thread making the call; an exception in one is printed and ignored.
+        """
+        with self._lock:
+            self._hooks[event] = self._hooks[event] + [callback]
+    #/add_hook
+    
+    
+    def remove_hook(self, event, callback):
+        """
+        Unregisters a `callback` added by `add_hook`.
+        """
+        with self._lock:
+            self._hooks[event] = [_hook for _hook in self._hooks[event]
+                                  if _hook != callback]
+    #/remove_hook
+    
+    
+    def _run_hooks(self,
+                   _event,
+                   _method_name,
+                   _args,
+                   _duration=None,
+                   _result=None,
+                   _error=None,
+                   _attempt=1):
+        """
+        Hands a `CallEvent` describing one call attempt to each `_event` hook.
+        """
+        _call_event = CallEvent(_method_name,
+                                redact_arguments(_method_name, _args),
+                                _duration,
+                                redact_result(_result),
+                                _error,
+                                _attempt)
+        for _hook in self._hooks[_event]:
+            try:
+                _hook(_call_event)
+            except Exception as error:
+                print(u("Error in '{0}' hook {1!r}: {2}").format(_event,
+                                                                _hook,
+                                                                error))
+    #/_run_hooks
+    
+    
+    def _note_exchange(self, _request_bytes, _response_bytes):
+        """
+        Transport observer holding the payload sizes of the calling thread's 
+        latest exchange until `_take_exchange` collects them.
+        """
+        self._local.exchange = (_request_bytes, _response_bytes)
+    #/_note_exchange
+    
+    
+    def _take_exchange(self):
+        """
+        Returns and clears the payload sizes of the calling thread's latest 
+        exchange.
+        """
+        _exchange = getattr(self._local, u('exchange'), (0, 0))
+        self._local.exchange = (0, 0)
+        return _exchange
+    #/_take_exchange
+    
+    
+    def _measure(self,
+                 _method_name,
+                 _key,
+                 _duration,
+                 _exchange=None,
+                 _retry=False,
+                 _throttled=0.0):
+        """
+        Adds one call to the metrics of `_method_name`, with the payload sizes 
+        of the `_exchange` that carried it, by default the latest one, and the 
+        seconds it was `_throttled`, counting it as a retry if it was one.
+        """
+        if _exchange is None:
+            _exchange = self._take_exchange()
+        
+        with self._lock:
+            _metrics = self._metrics.get(_method_name)
+            if _metrics is None:
+                _metrics = self._metrics[_method_name] = CallMetrics()
+            _metrics.add(_duration,
+                         _key != SUCCESS,
+                         _exchange[0],
+                         _exchange[1],
+                         1 if _retry else 0,
+                         _throttled)
+    #/_measure
+    
+    
+    def metrics(self):
+        """
+        Returns a summary of the calls made to each API method: count, error 
+        rate, retries, duration percentiles in seconds, bytes sent and 
+        received, and seconds spent waiting for the rate limiter.
+        """
+        with self._lock:
+            return dict((_method, _metrics.summary())
+                        for _method, _metrics in self._metrics.items())
+    #/metrics
+    
+    
+    def _record(self, _caller, _key, _result, _on_success=None, _duration=None):
+        """
+        Logs one call result, handing a success to `_on_success`.  Returns the 
+        result of a successful call and `None` for a failed one.
+        """
+        self.log(_caller, _key, _result, _duration=_duration)
+        if _key != SUCCESS:
+            return None
+        if _on_success is not None:
+            with self._lock:
+                _on_success(_result)
+        return _result
+    #/_record
+    
+    
+    @contextmanager
+    def parallel(self, max_workers=None):
+        """
+        Sends every `try_api_call` made within the block from a bounded pool 
+        of `max_workers` threads, each with its own `ServerProxy`.  Results are
+        logged in submission order; the block waits for all of them on exit.
+        """
+        if ThreadPoolExecutor is None:
+            raise RuntimeError(u("Parallel execution requires "
+                                 "`concurrent.futures` (`futures` on python2)."))
+        
+        if self._executor is not None: #Already parallel.
+            yield self
+            return
+        
+        self._executor = ThreadPoolExecutor(max_workers or self._max_workers)
+        try:
+            yield self
+        finally:
+            _executor, self._executor = self._executor, None
+            _executor.shutdown(wait=True)
+            self._drain()
+    #/parallel
+    
+    
+    @contextmanager
+    def graph(self, max_workers=None):
+        """
+        Yields a `TaskGraph` to add calls to, and on exit runs them from a 
+        pool of `max_workers` threads, each as soon as the tasks it depends on 
+        have succeeded.  A task whose dependency failed is skipped and logged 
+        as a failure naming it.  Results are logged as calls finish rather 
+        than in the order they were added.
+        """
+        _graph = TaskGraph()
+        yield _graph
+        self.run_graph(_graph, max_workers)
+    #/graph
+    
+    
+    def run_graph(self, _graph, max_workers=None):
+        """
+        Runs the tasks of `_graph` that have not run yet.
+        """
+        if self._batch is not None:
+            raise RuntimeError(u("A task graph can't run inside `batch()`."))
+        
+        _waiting = [_task for _task in _graph.tasks if _task.status is None]
+        _running = {}
+        _in_order, self._in_order = self._in_order, False
+        try:
+            with self.parallel(max_workers):
+                while _waiting or _running:
+                    for _task in list(_waiting):
+                        _blocker = _task.blocker()
+                        if _blocker is not None:
+                            _waiting.remove(_task)
+                            self._skip_task(_task, _blocker)
+                        elif _task.ready():
+                            _waiting.remove(_task)
+                            _result = _task.call(*_task.args, **_task.kwargs)
+                            if isinstance(_result, Future):
+                                _running[_result] = _task
+                            else:
+                                self._finish_task(_task, _result)
+                    
+                    if _running:
+                        _done, _ = wait_for_futures(list(_running),
+                                                    return_when=FIRST_COMPLETED)
+                        for _future in _done:
+                            self._finish_task(_running.pop(_future),
+                                              None if _future.exception()
+                                              else _future.result())
+                    elif _waiting and not any(_task.ready() or _task.blocker()
+                                              for _task in _waiting):
+                        raise ValueError(u("Tasks depend on tasks outside "
+                                           "their graph."))
+        finally:
+            self._in_order = _in_order
+    #/run_graph
+    
+    
+    def bulk(self,
+             call,
+             records,
+             concurrency=None,
+             batch_size=None,
+             progress=None):
+        """
+        Makes `call`, a guarded resource class method such as 
+        `Email.create_email`, for each of `records`, as `run_bulk()` does.  
+        Its inventory is fetched once, and records its guard would turn back, 
+        or that repeat an earlier record's entity, are skipped without a call.
+        Returns a `BulkReport`.
+        """
+        _existing = (None if self._expired() else #Every call fails unsent.
+                     self.inventory(getattr(call.__self__,
+                                            call.api_method.inventory)))
+        return self.run_bulk(self._bulk_records(call, records, _existing),
+                             concurrency,
+                             batch_size,
+                             progress)
+    #/bulk
+    
+    
+    def _bulk_records(self, call, records, existing):
+        """
+        Returns a `BulkCall` of `call` for each of `records`, a mapping or a 
+        sequence of its arguments, or only the entity's name, that its guard 
+        admits against the `existing` inventory, if any, and a skipped 
+        `BulkOutcome` for each other record.
+        """
+        _api_method = call.api_method
+        if _api_method.inventory is None:
+            raise ValueError(u("{0}() has no inventory to check records "
+                               "against.").format(_api_method.name))
+        
+        _seen = set()
+        _records = []
+        for _record in records:
+            if isinstance(_record, (text_type, binary_type)):
+                _record = [_record]
+            _kwargs = (dict(_record) if isinstance(_record, dict) else
+                       dict(zip(_api_method.parameters, _record)))
+            _key = _kwargs[_api_method.parameters[0]]
+            if _key in _seen:
+                _records.append(BulkOutcome(_key, _api_method.name, SKIPPED,
+                                            u("Repeats an earlier record.")))
+            elif existing is not None and (_key in existing) != _api_method.exists:
+                _records.append(BulkOutcome(_key, _api_method.name, SKIPPED,
+                                            u("Does not exist.") if _api_method.exists
+                                            else u("Already exists.")))
+            else:
+                _records.append(BulkCall(_key, _api_method.name, call, (),
+                                         _kwargs))
+            _seen.add(_key)
+        return _records
+    #/_bulk_records
+    
+    
+    def _bulk_outcome(self, _record, _result, _faults):
+        """
+        Returns the `BulkOutcome` of the `BulkCall` `_record`, whose call 
+        returned `_result`, `None` for a failure, taking the reason for a 
+        failure from the `_faults` noted by `run_bulk()`'s fault hook.
+        """
+        if _result is not None or self._plan is not None:
+            return BulkOutcome(_record.key, _record.action, SUCCESS, BLANK_STR)
+        
+        _api_method = _record.call.api_method
+        _arguments = _api_method.marshal(_record.args, _record.kwargs)
+        _message = _faults.get((_api_method.name,
+                                repr(redact_arguments(_api_method.name,
+                                                      _arguments))))
+        if _message is None: #Not sent.
+            if self._expired():
+                _message = describe_fault(self._deadline_exceeded())
+            elif _api_method.inventory is not None: #Turned back by its guard.
+                _message = _api_method.rejection(_arguments)
+            else:
+                _message = u("Failed; see the run report.")
+        return BulkOutcome(_record.key, _record.action, FAILURE, _message)
+    #/_bulk_outcome
+    
+    
+    @contextmanager
+    def _bulk_run(self, _records, progress=None):
+        """
+        Yields the `BulkReport` of `_records` and a function settling the 
+        record at an index: a `BulkOutcome` as it is, a `BulkCall` by the 
+        result its call returned.  Faults are noted, for the report to give 
+        their reasons, and the inventories are kept as one snapshot while the 
+        block runs.  `progress` is called as `run_bulk()` describes.
+        """
+        _report = BulkReport(len(_records))
+        _faults = {}
+        _settled = [0]
+        
+        def _settle(_index, _result=None):
+            _outcome = _records[_index]
+            if not isinstance(_outcome, BulkOutcome):
+                _outcome = self._bulk_outcome(_outcome, _result, _faults)
+            with self._lock:
+                _report.settle(_index, _outcome)
+                _settled[0] += 1
+                if progress is not None:
+                    progress(_settled[0], len(_records))
+        
+        def _note_fault(_event):
+            _faults[(_event.method, repr(_event.arguments))] = \
+                                                    describe_fault(_event.error)
+        
+        _inventory_ttl, self._inventory_ttl = self._inventory_ttl, None
+        self.add_hook(HOOK_FAULT, _note_fault)
+        try:
+            yield _report, _settle
+        finally:
+            self.remove_hook(HOOK_FAULT, _note_fault)
+            self._inventory_ttl = _inventory_ttl
+    #/_bulk_run
+    
+    
+    def run_bulk(self,
+                 _records,
+                 concurrency=None,
+                 batch_size=None,
+                 progress=None):
+        """
+        Makes the `BulkCall`s among `_records`, whose other entries are 
+        already-settled `BulkOutcome`s, and returns a `BulkReport` of all of 
+        them.  Calls are sent from `concurrency` threads if given, else in 
+        `system.multicall` batches of `batch_size`, with the inventories 
+        fetched so far used as the one snapshot their guards check.  
+        `progress`, if given, is called with the number of records settled and
+        the total as each settles.
+        """
+        _futures = []
+        
+        def _make_calls(_settle):
+            def _finish_future(_index, _future):
+                _settle(_index, None if _future.exception() else _future.result())
+            
+            for _index, _record in enumerate(_records):
+                if isinstance(_record, BulkOutcome):
+                    _settle(_index)
+                    continue
+                _result = _record.call(*_record.args, **_record.kwargs)
+                if Future is not None and isinstance(_result, Future):
+                    _futures.append(_result)
+                    _result.add_done_callback(partial(_finish_future, _index))
+                else:
+                    _settle(_index, _result)
+        
+        with self._bulk_run(_records, progress) as (_report, _settle):
+            if concurrency:
+                with self.parallel(concurrency):
+                    _make_calls(_settle)
+            elif Future is not None:
+                with self.batch(batch_size):
+                    _make_calls(_settle)
+            else: #Batched results can't be told apart without futures.
+                _make_calls(_settle)
+            #Calls joining an enclosing `batch()` or `parallel()` block.
+            self.flush_batch()
+            if _futures:
+                wait_for_futures(_futures)
+        return _report
+    #/run_bulk
+    
+    
+    def run_bulk_steps(self,
+                       _records,
+                       _dependents,
+                       concurrency=None,
+                       batch_size=None,
+                       progress=None):
+        """
+        Makes `_records` as `run_bulk()` does, then `_dependents`, each paired 
+        with the `(action, key)` of the records it depends on, skipping those 
+        with a dependency that failed.  Returns one `BulkReport` of both 
+        steps, whose records `progress` counts together.
+        """
+        _total = len(_records) + len(_dependents)
+        _report = self.run_bulk(_records,
+                                concurrency,
+                                batch_size,
+                                offset_progress(progress, 0, _total))
+        _report.rows.extend(self.run_bulk(unblocked_records(_dependents, _report),
+                                          concurrency,
+                                          batch_size,
+                                          offset_progress(progress,
+                                                          len(_records),
+                                                          _total)).rows)
+        return _report
+    #/run_bulk_steps
+    
+    
+    def _finish_task(self, _task, _result):
+        """
+        Records the outcome of a task's call, which returns `None` on failure.  
+        Planned calls always succeed.
+        """
+        _task.result = _result
+        _task.status = (SUCCESS if _result is not None or self._plan is not None
+                        else FAILURE)
+    #/_finish_task
+    
+    
+    def _skip_task(self, _task, _blocker):
+        """
+        Logs a task not run because its dependency `_blocker` did not succeed.
+        """
+        _task.status = SKIPPED
+        _caller = (_task.api_method.caller if _task.api_method is not None
+                   else _task.call.__name__.upper())
+        self.log(_caller,
+                 FAILURE,
+                 u("Skipped {0}: it depends on {1}, which {2}.").format(
+                        _task.name,
+                        _blocker.name,
+                        u("failed") if _blocker.status == FAILURE
+                        else u("was skipped")))
+    #/_skip_task
+    
+    
+    def wait(self, futures=None, timeout=None):
+        """
+        Waits for the passed `futures`, or for every outstanding parallel call,
+        and returns the `(done, not_done)` sets of futures.
+        """
+        if futures is None:
+            with self._lock:
+                futures = [_pending[-1] for _pending in self._pending]
+        return wait_for_futures(futures, timeout)
+    #/wait
+    
+    
+    def _make_server(self):
+        """
+        Returns a `ServerProxy` whose connections come from the runner's pool.
+        """
+        _transport = PooledTransport(self._pool,
+                                     self._api_url.startswith(u('https')),
+                                     self._note_exchange,
+                                     self._timeouts)
+        return _xmlrpc.ServerProxy(self._api_url, transport=_transport)
+    #/_make_server
+    
+    
+    def _thread_server(self):
+        """
+        Returns a `ServerProxy` private to the calling thread, as proxies are 
+        not thread-safe.
+        """
+        _proxy = getattr(self._local, u('proxy'), None)
+        if _proxy is None or _proxy[0] != self._api_url:
+            _proxy = (self._api_url, self._make_server())
+            self._local.proxy = _proxy
+        return _proxy[1]
+    #/_thread_server
+    
+    
+    def _submit(self, _caller, _api_call, _args, _on_success):
+        """
+        Queues one API call on the worker pool and returns a `Future` that 
+        resolves to its result once it has been logged.
+        """
+        _api_name = get_method_name(_api_call)
+        _future = Future()
+        _work = self._executor.submit(
+                        lambda: self._call(getattr(self._thread_server(),
+                                                   _api_name), _args))
+        with self._lock:
+            self._pending.append((_work, _caller, _on_success, _future))
+        _work.add_done_callback(self._drain)
+        return _future
+    #/_submit
+    
+    
+    def _drain(self, _done=None):
+        """
+        Logs finished parallel calls in the order they were submitted, or, 
+        while a task graph runs, as soon as each finishes.  A call that 
+        raised an unexpected error is logged as a failure, and its `Future` 
+        raises that error.
+        """
+        with self._lock:
+            for _pending in list(self._pending):
+                if not _pending[0].done():
+                    if self._in_order:
+                        break
+                    continue
+                self._pending.remove(_pending)
+                _work, _caller, _on_success, _future = _pending
+                try:
+                    _key, _result, _duration = _work.result()
+                except Exception as error:
+                    self.log(_caller, FAILURE, describe_fault(error))
+                    _future.set_exception(error)
+                    continue
+                _future.set_result(self._record(_caller,
+                                                _key,
+                                                _result,
+                                                _on_success,
+                                                _duration))
+    #/_drain
+    
+    
+    @contextmanager
+    def batch(self, batch_size=None):
+        """
+        Queues every `try_api_call` made within the block, from any resource 
+        class, and sends them as `system.multicall` requests of at most 
+        `batch_size` calls each.  Nested blocks join the outermost batch.
+        """
+        if self._batch is not None: #Already batching.
+            yield self
+            return
+        
+        self._batch = [batch_size or self._batch_size, []]
+        try:
+            yield self
+        finally:
+            self.flush_batch()
+            self._batch = None
+    #/batch
+    
+    
+    def flush_batch(self):
+        """
+        Sends the calls queued by `batch()` and logs each result individually.
+        Falls back to sequential calls if the endpoint rejects multicall.
+        """
+        if self._batch is None:
+            return
+        
+        _queued, self._batch[1] = self._batch[1], []
+        
+        if self._multicall_supported and len(_queued) > 1 and not self._expired():
+            _session_id = self._session_id
+            _multicall = _xmlrpc.MultiCall(self._server)
+            #A multicall is one request, so takes one rate limiter token.
+            _throttled = self._throttle() / len(_queued)
+            for _caller, _api_call, _args, _on_success, _future in _queued:
+                getattr(_multicall, get_method_name(_api_call))(
+                                                    _session_id, *_args)
+                if self._hooks[HOOK_BEFORE]:
+                    self._run_hooks(HOOK_BEFORE, get_method_name(_api_call), _args)
+            _start = _perf_counter()
+            try:
+                _results = _multicall()
+            except _xmlrpc.Fault: #Endpoint has no `system.multicall`.
+                self._multicall_supported = False
+            except _xmlrpc.ProtocolError as error:
+                #The server may have run the chunk before failing, so it is 
+                #only sent again, one call at a time, if that is safe.
+                _resend = all(self._retry_policy.applies_to(
+                                            get_method_name(_call[1]))
+                              for _call in _queued)
+                self._fail_batch(_queued, error, _start, _throttled,
+                                 _log=not _resend)
+                if not _resend:
+                    return
+            except CONNECTION_ERRORS as error: #Outcome unknown, so not resent.
+                self._fail_batch(_queued, error, _start, _throttled)
+                return
+            else: #multicall succeeded
+                #Each call is charged an equal share of the round trip.
+                _duration = (_perf_counter() - _start) / len(_queued)
+                _exchange = [_size // len(_queued)
+                             for _size in self._take_exchange()]
+                _retries = []
+                for _index, _call in enumerate(_queued):
+                    _caller, _api_call, _args, _on_success, _future = _call
+                    _method_name = get_method_name(_api_call)
+                    try:
+                        _key, _result = SUCCESS, _results[_index]
+                    except (_xmlrpc.Fault, ValueError) as error:
+                        _key = FAILURE
+                        _result = (describe_fault(error)
+                                   if isinstance(error, _xmlrpc.Fault)
+                                   else text_type(error))
+                        if self._hooks[HOOK_FAULT]:
+                            self._run_hooks(HOOK_FAULT, _method_name, _args,
+                                            _duration, None, error)
+                        if (session_expired(error) and
+                            self._renew_session(_session_id)):
+                            _delay = 0.0
+                        else:
+                            _delay = self._retry_delay(_method_name, error, 1,
+                                                       _duration)
+                    else: #call succeeded
+                        _delay = None
+                        if self._hooks[HOOK_AFTER]:
+                            self._run_hooks(HOOK_AFTER, _method_name, _args,
+                                            _duration, _result)
+                    self._measure(_method_name, _key, _duration, _exchange,
+                                  _throttled=_throttled)
+                    if _delay is not None: #Resent once the batch is logged.
+                        _retries.append((time.time() + _delay, _index, _call))
+                        continue
+                    resolve_future(_future, self._record(_caller,
+                                                         _key,
+                                                         _result,
+                                                         _on_success,
+                                                         _duration))
+                
+                for _due, _index, _call in sorted(_retries):
+                    _caller, _api_call, _args, _on_success, _future = _call
+                    time.sleep(max(0, _due - time.time()))
+                    _key, _result, _duration = self._call(_api_call, _args, 2)
+                    resolve_future(_future, self._record(_caller,
+                                                         _key,
+                                                         _result,
+                                                         _on_success,
+                                                         _duration))
+                return
+        
+        _batch, self._batch = self._batch, None
+        try:
+            for _caller, _api_call, _args, _on_success, _future in _queued:
+                resolve_future(_future, self.try_api_call(_caller,
+                                                          _api_call,
+                                                          _args,
+                                                          _on_success))
+        finally:
+            self._batch = _batch
+    #/flush_batch
+    
+    
+    def _fail_batch(self, _queued, _error, _start, _throttled, _log=True):
+        """
+        Counts a `system.multicall` round trip begun at `_start` that failed 
+        with `_error` against each of the `_queued` calls it carried, running 
+        their fault hooks, and, if `_log` is set, logs each as a failure.
+        """
+        _duration = (_perf_counter() - _start) / len(_queued)
+        _exchange = [_size // len(_queued) for _size in self._take_exchange()]
+        for _caller, _api_call, _args, _on_success, _future in _queued:
+            _method_name = get_method_name(_api_call)
+            self._measure(_method_name, FAILURE, _duration, _exchange,
+                          _throttled=_throttled)
+            if self._hooks[HOOK_FAULT]:
+                self._run_hooks(HOOK_FAULT, _method_name, _args, _duration,
+                                None, _error)
+            if _log:
+                self.log(_caller, FAILURE, describe_fault(_error),
+                         _duration=_duration)
+                resolve_future(_future, None)
+    #/_fail_batch
+    
+    
+    def inventory(self, _list_call):
+        """
+        Returns the cached `InventoryIndex` of the `_list_call` inventory 
+        method, calling it on first use or once the cached copy is older than 
+        the inventory TTL.  A TTL of `None` never expires the cache; a TTL of 0 
+        disables it.  The call is made without holding the runner's lock, so 
+        parallel calls carry on meanwhile; threads needing the same inventory 
+        wait for that one fetch rather than make their own.  A fetch that 
+        overlaps a change to the cached inventory is made again.
+        """
+        _list_name = _list_call.__name__
+        
+        while True:
+            with self._lock:
+                _cached = self._cached_inventory(_list_name)
+                if _cached is not None:
+                    return _cached
+                _fetching = self._fetches.get(_list_name)
+                if _fetching is None:
+                    _fetching = self._fetches[_list_name] = threading.Event()
+                    break
+            _fetching.wait() #Another thread's fetch, then check again.
+        
+        try:
+            while True:
+                _version = self._inventory_version(_list_name)
+                _cached = self._store_inventory(_list_name, _version, _list_call())
+                if _cached is not None:
+                    return _cached
+        finally:
+            with self._lock:
+                del self._fetches[_list_name]
+            _fetching.set()
+    #/inventory
+    
+    
+    def _cached_inventory(self, _list_name):
+        """
+        Returns the cached `_list_name` inventory, or `None` if it is missing 
+        or older than the inventory TTL.
+        """
+        with self._lock:
+            _cached = self._inventories.get(_list_name)
+            if (_cached is None or
+                (self._inventory_ttl is not None and
+                 time.time() - _cached[0] >= self._inventory_ttl)):
+                return None
+            return _cached[1]
+    #/_cached_inventory
+    
+    
+    def _store_inventory(self, _list_name, _version, _entries):
+        """
+        Caches and returns an `InventoryIndex` of the `_entries` a fetch of 
+        the `_list_name` inventory returned, or returns `None` if the cached 
+        inventory changed after `_version` was taken, as the fetch may 
+        predate that change.
+        """
+        _index = InventoryIndex(_entries, inventory_key(_list_name))
+        with self._lock:
+            if self._inventory_version(_list_name) != _version:
+                return None
+            self._inventories[_list_name] = [time.time(), _index]
+        return _index
+    #/_store_inventory
+    
+    
+    def _inventory_version(self, _list_name):
+        """
+        Returns a token that changes whenever the cached `_list_name` 
+        inventory does.
+        """
+        with self._lock:
+            return (self._inventory_epoch,
+                    self._inventory_versions.get(_list_name, 0))
+    #/_inventory_version
+    
+    
+    def _touch_inventory(self, _list_name):
+        """
+        Notes a change to the cached `_list_name` inventory, or to every 
+        inventory if no name is given.  Callers hold the lock.
+        """
+        if _list_name is None:
+            self._inventory_epoch += 1
+        else:
+            self._inventory_versions[_list_name] = \
+                                self._inventory_versions.get(_list_name, 0) + 1
+    #/_touch_inventory
+    
+    
+    def invalidate_inventory(self, _list_name=None, _result=None):
+        """
+        Discards the cached `_list_name` inventory, or every cached inventory 
+        if no name is given, so that the next guarded call re-fetches it.
+        """
+        with self._lock:
+            self._touch_inventory(_list_name)
+            if _list_name is None:
+                self._inventories.clear()
+            else:
+                self._inventories.pop(_list_name, None)
+    #/invalidate_inventory
+    
+    
+    def add_to_inventory(self, _list_name, _value, _result=None):
+        """
+        Records the created entity identified by `_value` in the cached 
+        `_list_name` inventory, using the API `_result` when it describes it.
+        """
+        with self._lock:
+            self._touch_inventory(_list_name)
+            _cached = self._inventories.get(_list_name)
+            if _cached is not None and _value not in _cached[1]:
+                _cached[1].add(_cached[1].describe(_value, _result))
+    #/add_to_inventory
+    
+    
+    def remove_from_inventory(self, _list_name, _value, _result=None):
+        """
+        Drops the deleted entity identified by `_value` from the cached 
+        `_list_name` inventory.
+        """
+        with self._lock:
+            self._touch_inventory(_list_name)
+            _cached = self._inventories.get(_list_name)
+            if _cached is not None:
+                _cached[1].remove(_value)
+    #/remove_from_inventory
+    
+    
+    def update_inventory(self, _list_name, _value, _result=None):
+        """
+        Replaces the updated entity identified by `_value` in the cached 
+        `_list_name` inventory with the API `_result` when it describes it.  
+        Otherwise the cached entry is kept, as updates never change the 
+        identifying field the guards check.
+        """
+        with self._lock:
+            self._touch_inventory(_list_name)
+            _cached = self._inventories.get(_list_name)
+            if (_cached is not None and
+                _cached[1].describe(_value, _result) is _result):
+                _cached[1].remove(_value)
+                _cached[1].add(_result)
+    #/update_inventory
+    
+    
+    def apply_inventory_effect(self, _api_method, _value, _result=None):
+        """
+        Brings the cached inventories in step with a successful `_api_method` 
+        call on the entity identified by `_value`.
+        """
+        for _list_name in _api_method.invalidates:
+            self.invalidate_inventory(_list_name)
+        for _list_name in _api_method.adds:
+            self.add_to_inventory(_list_name, _value)
+        
+        if _api_method.effect == INVENTORY_ADD:
+            self.add_to_inventory(_api_method.inventory, _value, _result)
+        elif _api_method.effect == INVENTORY_REMOVE:
+            self.remove_from_inventory(_api_method.inventory, _value, _result)
+        elif _api_method.effect == INVENTORY_UPDATE:
+            self.update_inventory(_api_method.inventory, _value, _result)
+    #/apply_inventory_effect
+    
+    
+    def process_results(self):
+        """
+        Processes a dictionary of execution result lists into string 
+        representations wrapped in the HTML needed to create <li> nodes.
+        """
+        _html = [u("      ")]
+        for result_type, results_list in self._run_results.items():
+            for result_list in results_list:
+                _html.append(format_result(result_type, result_list))
+        return BLANK_STR.join(_html)
+    #/process_results
+    
+    
+    def result_counts(self):
+        """
+        Returns the number of results logged with each result type.
+        """
+        return OrderedDict((_key, len(_results))
+                           for _key, _results in self._run_results.items())
+    #/result_counts
+    
+    
+    def format_metrics(self):
+        """
+        Renders the per-method call metrics as an HTML table, if any calls 
+        have been made.
+        """
+        _metrics = self.metrics()
+        return format_metrics(_metrics) if _metrics else BLANK_STR
+    #/format_metrics
+    
+    
+    def report(self):
+        """
+        Constructs an HTML report of execution results.
+        """
+        global HTML_START, HTML_RESULTS_END, HTML_DOCUMENT_END
+        
+        html_report = self.process_results()
+        return (HTML_START + html_report + HTML_RESULTS_END +
+                self.format_metrics() + HTML_DOCUMENT_END)
+    #/report
+    
+    
+    def read_script_from_file(self, _script_file):
+        try:
+            with open(_script_file, u('r')) as _script_source:
+                _script_code = compile(_script_source.read(),
+                                       _script_file,
+                                       u('exec'))
+                exec(_script_code)
+        except (OSError, IOError) as e:
+            print(u("Error opening script file."))
+    #/read_script_from_file
+    
+    
+    def stream_report_to_file(self, _report_file, keep_results=False):
+        """
+        Streams each result to `_report_file`, a path or file-like object, as 
+        it is logged, instead of assembling the report at the end of the run.  
+        Results are then only kept in memory for `report()` if `keep_results` 
+        is set.  Call `close_report()` to finish the report.
+        """
+        try:
+            _report_writer = ReportWriter(_report_file)
+        except (OSError, IOError) as e:
+            print(u("Error opening report file."))
+            return
+        
+        with self._lock:
+            self.close_report()
+            self._report_writer = _report_writer
+            self._keep_results = keep_results
+    #/stream_report_to_file
+    
+    
+    def close_report(self):
+        """
+        Writes the footer of a streamed report and stops streaming.
+        """
+        with self._lock:
+            _report_writer, self._report_writer = self._report_writer, None
+            self._keep_results = True
+            if _report_writer is not None:
+                _report_writer.close(self.format_metrics())
+    #/close_report
+    
+    
+    def write_report_to_file(self, _report_file):
+        try:
+            with open(_report_file, u('a')) as _report_target:
+                _report_target.write(self.report())
+        except (OSError, IOError) as e:
+            print(u("Error writing report file."))
+    #/write_report_to_file
+    
+#/Runner
+
+
+
+def read_credentials(credentials_file):
+    """
+    Reads a JSON list of accounts, each an object with a `username`, a 
+    `password`, and optionally an `api_url`.
+    """
+    with open(credentials_file, u('r')) as _credentials_source:
+        _credentials = json.load(_credentials_source)
+    for _account in _credentials:
+        if u('username') not in _account or u('password') not in _account:
+            raise ValueError(u("Each account needs a username and password."))
+    return _credentials
+#/read_credentials
+
+
+
+class FleetRunner(object):
+    """
+    Drives many WebFaction accounts at once, each through its own `Runner` 
+    made with `runner_options`, at most `max_accounts` at a time.  A failed 
+    login or a job that raises is logged to that account's runner only, and 
+    the report groups every account's results under it.
+    """
+    
+    def __init__(self, credentials, max_accounts=FLEET_WORKERS, **runner_options):
+        self._credentials = list(credentials)
+        self._max_accounts = max_accounts
+        self._runner_options = runner_options
+        self.runners = OrderedDict()
+        self._logged_in = set()
+    #/__init__
+    
+    
+    def _map(self, _job, _usernames):
+        """
+        Calls `_job` with each of `_usernames` from a pool of threads.
+        """
+        if ThreadPoolExecutor is None:
+            raise RuntimeError(u("Fleet execution requires "
+                                 "`concurrent.futures` (`futures` on python2)."))
+        
+        _executor = ThreadPoolExecutor(self._max_accounts)
+        try:
+            for _future in [_executor.submit(_job, _username)
+                            for _username in _usernames]:
+                _future.result()
+        finally:
+            _executor.shutdown(wait=True)
+    #/_map
+    
+    
+    def login(self):
+        """
+        Logs in to every account, returning the usernames that failed.
+        """
+        _accounts = OrderedDict()
+        for _account in self._credentials:
+            if _account[u('username')] in _accounts:
+                raise ValueError(u("Account '{0}' is listed twice.").format(
+                                                        _account[u('username')]))
+            _options = dict(self._runner_options)
+            if _account.get(u('api_url')):
+                _options[u('api_url')] = _account[u('api_url')]
+            self.runners[_account[u('username')]] = Runner(**_options)
+            _accounts[_account[u('username')]] = _account[u('password')]
+        
+        def _login(_username):
+            try:
+                self.runners[_username].login_to_server(_username,
+                                                        _accounts[_username])
+                self._logged_in.add(_username)
+            except Exception as e:
+                self.runners[_username].log(u("LOGIN_TO_SERVER"),
+                                            FAILURE,
+                                            describe_fault(e))
+        
+        self._map(_login, _accounts)
+        return [_username for _username in _accounts
+                if _username not in self._logged_in]
+    #/login
+    
+    
+    def run(self, job):
+        """
+        Calls `job` with the `Runner` of every logged-in account.  An 
+        exception raised by `job` is logged as a failure for its account.
+        """
+        _name = getattr(job, u('__name__'), u('job')).upper()
+        
+        def _run(_username):
+            try:
+                job(self.runners[_username])
+            except Exception as e:
+                self.runners[_username].log(_name, FAILURE, describe_fault(e))
+        
+        self._map(_run, [_username for _username in self.runners
+                         if _username in self._logged_in])
+    #/run
+    
+    
+    def run_script(self, script_file):
+        """
+        Runs the script in `script_file` against every logged-in account.
+        """
+        self.run(lambda _runner: _runner.read_script_from_file(script_file))
+    #/run_script
+    
+    
+    def report(self):
+        """
+        Constructs an HTML report listing each account's totals, then each 
+        account's results.
+        """
+        _summary = [u("      ")]
+        _sections = []
+        for _username, _runner in self.runners.items():
+            _counts = _runner.result_counts()
+            _summary.append(format_result(
+                    FAILURE if _counts[FAILURE] else SUCCESS,
+                    [u("{0} | {1} succeeded, {2} failed, {3} retried.").format(
+                            _username,
+                            _counts[SUCCESS],
+                            _counts[FAILURE],
+                            _counts[RETRY])]))
+            _sections.append(HTML_ACCOUNT_START.format(_username) +
+                             _runner.process_results() + HTML_RESULTS_END)
+        return (HTML_START + BLANK_STR.join(_summary) + HTML_RESULTS_END +
+                BLANK_STR.join(_sections) + HTML_DOCUMENT_END)
+    #/report
+    
+    
+    def write_report_to_file(self, _report_file):
+        try:
+            with open(_report_file, u('a')) as _report_target:
+                _report_target.write(self.report())
+        except (OSError, IOError) as e:
+            print(u("Error writing report file."))
+    #/write_report_to_file
+    
+    
+    def close(self):
+        """
+        Closes every account's connections.
+        """
+        for _runner in self.runners.values():
+            _runner.pool.close()
+    #/close
+
+#/FleetRunner
+
+
+def main():
+    """
+    Parses arguments and handles file IO if specified.
+    """
+    
+    parser = argparse.ArgumentParser(description=u("A robust client to the WebFaction server API."))
+    
+    parser.add_argument(u("username"), nargs=u("?"), help=u("The WebFaction server control panel username."))
+    parser.add_argument(u("password"), nargs=u("?"), help=u("The WebFaction server control panel password."))
+    parser.add_argument(u("--credentialsfile"), help=u("JSON list of accounts to run the script against instead."))
+    parser.add_argument(u("--maxaccounts"), type=int, default=FLEET_WORKERS, help=u("Accounts driven at once with --credentialsfile."))
+    parser.add_argument(u("--scriptfile"), help=u("File of scripted commands to execute."))
+    parser.add_argument(u("--reportfile"), help=u("File into which to write run results."))
+    parser.add_argument(u("--apiurl"), help=u("API endpoint to use instead of WebFaction's."))
+    parser.add_argument(u("--retries"), type=int, default=RETRY_ATTEMPTS, help=u("Attempts given to a call failing transiently."))
+    parser.add_argument(u("--retrymutating"), action=u("store_true"), help=u("Retry calls that change state, not just idempotent ones."))
+    parser.add_argument(u("--ratelimit"), type=float, help=u("Most API requests sent per second."))
+    parser.add_argument(u("--burst"), type=int, help=u("Requests that may be sent at once within the rate limit."))
+    parser.add_argument(u("--connecttimeout"), type=float, default=CONNECT_TIMEOUT, help=u("Seconds allowed to connect to the API."))
+    parser.add_argument(u("--readtimeout"), type=float, default=READ_TIMEOUT, help=u("Seconds allowed for the API to answer a call."))
+    parser.add_argument(u("--deadline"), type=float, help=u("Seconds the whole run may take; later calls are not sent."))
+    parser.add_argument(u("--planfile"), help=u("Plan the script's calls into this file instead of making them."))
+    parser.add_argument(u("--sessionfile"), nargs=u("?"), const=SESSION_FILE, help=u("Reuse sessions cached in this file, ~/.wfapiclient-sessions if none is given."))
+    
+    args = parser.parse_args()
+    
+    if args.credentialsfile and args.planfile:
+        parser.error(u("--planfile plans one account; drop --credentialsfile."))
+    if not args.credentialsfile and not (args.username and args.password):
+        parser.error(u("username and password are required without --credentialsfile."))
+    
+    _runner_options = dict(api_url=args.apiurl,
+                           retry_policy=RetryPolicy(max_attempts=args.retries,
+                                                    mutating=args.retrymutating),
+                           rate_limiter=(RateLimiter(args.ratelimit, args.burst)
+                                         if args.ratelimit else None),
+                           connect_timeout=args.connecttimeout,
+                           read_timeout=args.readtimeout,
+                           session_cache=(SessionCache(os.path.normpath(args.sessionfile))
+                                          if args.sessionfile else None))
+    
+    if args.credentialsfile:
+        fleet = FleetRunner(read_credentials(os.path.normpath(args.credentialsfile)),
+                            args.maxaccounts,
+                            **_runner_options)
+        _started = time.time()
+        try:
+            fleet.login()
+            if args.scriptfile:
+                _script_file = os.path.normpath(args.scriptfile)
+                def run_script(runner):
+                    with runner.deadline(None if args.deadline is None else
+                                         args.deadline - (time.time() - _started)):
+                        runner.read_script_from_file(_script_file)
+                fleet.run(run_script)
+        finally:
+            if args.reportfile:
+                fleet.write_report_to_file(os.path.normpath(args.reportfile))
+            fleet.close()
+        return
+    
+    runner = Runner(**_runner_options)
     
     if args.reportfile:
         _report_file = os.path.normpath(args.reportfile)
-        runner.write_report_to_file(_report_file)
+        runner.stream_report_to_file(_report_file)
+    
+    try:
+        with runner.deadline(args.deadline):
+            runner.login_to_server(args.username, args.password)
+            
+            if args.scriptfile and args.planfile:
+                _script_file = os.path.normpath(args.scriptfile)
+                with runner.plan() as _plan:
+                    runner.read_script_from_file(_script_file)
+                _plan.write(os.path.normpath(args.planfile))
+                print(u(" Planned {0}.").format(COMMA_SEP.join(
+                                u("{0} {1}").format(_count, _outcome)
+                                for _outcome, _count in _plan.counts().items())))
+            elif args.scriptfile:
+                _script_file = os.path.normpath(args.scriptfile)
+                runner.read_script_from_file(_script_file)
+    finally:
+        runner.close_report()
 #/main
 
 
@@ -0,0 +1,826 @@
+""" wfapiclientasync - WebFaction API Client asyncio module
+    
+    An asyncio-native counterpart to the `wfapiclient` module.  It provides an
+    `AsyncRunner` and `async` versions of every resource class, built on a
+    non-blocking XML-RPC transport, so that many accounts and thousands of
+    in-flight calls can share one event loop.
+    
+    Requires python 3.5 or later.  Logging, inventory caching, and HTML
+    reporting are shared with `wfapiclient.Runner`.
+"""
+
+import ssl
+import time
+import asyncio
+import functools
+import xmlrpc.client as _xmlrpc
+from urllib.parse import urlsplit
+
+import wfapiclient as wf
+from wfapiclient import u, BLANK_STR, FAILURE, describe_fault
+
+
+MAX_CONCURRENCY = 20 #In-flight calls allowed per account.
+
+USER_AGENT = u("wf-api-client (asyncio)")
+
+#`Runner` features that would never await an `AsyncRunner`'s coroutines.
+SYNC_ONLY = u("`AsyncRunner` has no `{0}`; schedule its coroutines as asyncio "
+              "tasks, such as with `asyncio.gather()`, instead.")
+
+
+
+class AsyncTransport(object):
+    """
+    Non-blocking XML-RPC transport over asyncio streams.  Requests are
+    serialized and parsed locally and sent over a pool of keep-alive HTTP/1.1
+    connections, at most `max_connections` of which are in use at a time.  An
+    `observer` is told the request and response sizes, in bytes, of each
+    exchange, and `timeouts`, if given, is asked for the connect and read
+    timeouts of each request as it gets a connection.
+    """
+    
+    def __init__(self,
+                 url,
+                 max_connections=MAX_CONCURRENCY,
+                 ssl_context=None,
+                 observer=None,
+                 timeouts=None):
+        _url = urlsplit(url)
+        self._url = url
+        self._https = _url.scheme == u('https')
+        self._host = _url.hostname
+        self._port = _url.port or (443 if self._https else 80)
+        self._path = _url.path or u('/')
+        self._ssl = ((ssl_context or ssl.create_default_context())
+                     if self._https else None)
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self._idle = []
+        self._observer = observer
+        self._timeouts = timeouts
+    #/__init__
+    
+    
+    async def request(self, _method_name, _params):
+        """
+        Sends one XML-RPC call and returns its unmarshalled result.  Raises
+        `Fault`, `ProtocolError`, `ConnectTimeout` or `ReadTimeout` just as
+        `PooledTransport` does.
+        """
+        _body = _xmlrpc.dumps(tuple(_params),
+                              _method_name,
+                              encoding=u('utf-8')).encode(u('utf-8'))
+        
+        async with self._semaphore:
+            _timeouts = self._timeouts() if self._timeouts else (None, None)
+            _status, _reason, _headers, _data = await self._post(_body,
+                                                                 *_timeouts)
+        
+        if self._observer is not None:
+            self._observer(len(_body), len(_data))
+        
+        if _status != 200:
+            raise _xmlrpc.ProtocolError(self._url, _status, _reason, _headers)
+        
+        return _xmlrpc.loads(_data)[0][0]
+    #/request
+    
+    
+    async def _post(self, _body, _connect_timeout=None, _read_timeout=None):
+        """
+        Posts `_body` on a pooled connection, reconnecting once if a reused
+        keep-alive connection turns out to have been closed by the server.
+        """
+        while True:
+            _reused = bool(self._idle)
+            if _reused:
+                _reader, _writer = self._idle.pop()
+            else:
+                try:
+                    _reader, _writer = await asyncio.wait_for(
+                                        asyncio.open_connection(self._host,
+                                                                self._port,
+                                                                ssl=self._ssl),
+                                        _connect_timeout)
+                except asyncio.TimeoutError:
+                    raise wf.ConnectTimeout(u("Connecting to {0} timed "
+                                              "out.").format(self._host))
+            try:
+                _response = await asyncio.wait_for(
+                                        self._exchange(_reader, _writer, _body),
+                                        _read_timeout)
+            except asyncio.TimeoutError:
+                _writer.close()
+                raise wf.ReadTimeout(u("No response from {0} in "
+                                       "time.").format(self._host))
+            except (ConnectionError, asyncio.IncompleteReadError) as error:
+                _writer.close()
+                if _reused:
+                    continue #Stale keep-alive connection.
+                if isinstance(error, asyncio.IncompleteReadError):
+                    raise ConnectionResetError(u("Response cut short."))
+                raise
+            except BaseException:
+                _writer.close()
+                raise
+            
+            _status, _reason, _headers, _data = _response
+            if _headers.get(u('connection'), BLANK_STR).lower() == u('close'):
+                _writer.close()
+            else:
+                self._idle.append((_reader, _writer))
+            return _response
+    #/_post
+    
+    
+    async def _exchange(self, _reader, _writer, _body):
+        """
+        Writes one HTTP/1.1 POST and reads back its status, headers, and body.
+        """
+        _request = (u("POST {0} HTTP/1.1\r\n"
+                      "Host: {1}\r\n"
+                      "User-Agent: {2}\r\n"
+                      "Content-Type: text/xml\r\n"
+                      "Content-Length: {3}\r\n"
+                      "Connection: keep-alive\r\n\r\n").format(self._path,
+                                                               self._host,
+                                                               USER_AGENT,
+                                                               len(_body)))
+        _writer.write(_request.encode(u('latin-1')) + _body)
+        await _writer.drain()
+        
+        _status_line = await _reader.readline()
+        if not _status_line:
+            raise ConnectionResetError(u("Connection closed by server."))
+        _status_parts = _status_line.decode(u('latin-1')).split(None, 2)
+        _status = int(_status_parts[1])
+        _reason = _status_parts[2].strip() if len(_status_parts) > 2 else BLANK_STR
+        
+        _headers = {}
+        if _status_parts[0] == u('HTTP/1.0'): #No keep-alive unless asked for.
+            _headers[u('connection')] = u('close')
+        while True:
+            _line = await _reader.readline()
+            if _line in (b'\r\n', b'\n', b''):
+                break
+            _name, _value = _line.decode(u('latin-1')).split(u(':'), 1)
+            _headers[_name.strip().lower()] = _value.strip()
+        
+        if _headers.get(u('transfer-encoding'), BLANK_STR).lower() == u('chunked'):
+            _chunks = []
+            while True:
+                _size = int((await _reader.readline()).split(b';')[0], 16)
+                if _size == 0:
+                    await _reader.readline()
+                    break
+                _chunks.append(await _reader.readexactly(_size))
+                await _reader.readexactly(2)
+            _data = b''.join(_chunks)
+        elif u('content-length') in _headers:
+            _data = await _reader.readexactly(int(_headers[u('content-length')]))
+        else:
+            _data = await _reader.read()
+            _headers[u('connection')] = u('close')
+        
+        return _status, _reason, _headers, _data
+    #/_exchange
+    
+    
+    def close(self):
+        """
+        Closes every idle pooled connection.
+        """
+        while self._idle:
+            self._idle.pop()[1].close()
+    #/close
+
+#/AsyncTransport
+
+
+
+class _AsyncMethod(object):
+    """
+    Awaitable remote method of an `AsyncServerProxy`, mirroring the method
+    objects of `xmlrpc.client.ServerProxy`, dotted names included.
+    """
+    
+    def __init__(self, transport, name):
+        self._transport = transport
+        self._Method__name = name
+        self.__name__ = name
+    #/__init__
+    
+    
+    def __getattr__(self, name):
+        return _AsyncMethod(self._transport, self._Method__name + u('.') + name)
+    
+    
+    def __call__(self, *args):
+        return self._transport.request(self._Method__name, args)
+
+#/_AsyncMethod
+
+
+
+class AsyncServerProxy(object):
+    """
+    `ServerProxy` whose remote methods are coroutines.
+    """
+    
+    def __init__(self,
+                 url,
+                 max_connections=MAX_CONCURRENCY,
+                 ssl_context=None,
+                 observer=None,
+                 timeouts=None):
+        self._transport = AsyncTransport(url,
+                                         max_connections,
+                                         ssl_context,
+                                         observer,
+                                         timeouts)
+    #/__init__
+    
+    
+    def __getattr__(self, name):
+        return _AsyncMethod(self._transport, name)
+    
+    
+    def close(self):
+        self._transport.close()
+
+#/AsyncServerProxy
+
+
+
+def async_resource(resource_class):
+    """
+    Builds the asyncio counterpart of a `wfapiclient` resource class.  Each 
+    `list_*` method becomes a coroutine and each `api_method` becomes a 
+    coroutine making the same declared call through an `AsyncRunner`.
+    Helper methods built on top of these need hand-written versions.
+    """
+    _namespace = {u('__init__'): resource_class.__init__,
+                  u('__doc__'): resource_class.__doc__}
+    
+    for _name, _member in vars(resource_class).items():
+        _api_method = getattr(_member, u('api_method'), None)
+        if _api_method is not None:
+            _namespace[_name] = _async_api_method(_member, _api_method)
+        elif _name.startswith(u('list_')):
+            _namespace[_name] = _async_list_method(_name)
+    
+    return type(resource_class.__name__, (object,), _namespace)
+#/async_resource
+
+
+def _async_api_method(function, api_method):
+    @functools.wraps(function)
+    async def _call(self, *args, **kwargs):
+        return await self._runner.call_api_method(api_method,
+                                                  self,
+                                                  api_method.marshal(args,
+                                                                     kwargs))
+    _call.api_method = api_method
+    return _call
+#/_async_api_method
+
+
+def _async_list_method(name):
+    async def _list(self):
+        return await self._runner.list_api_call(getattr(self._server, name))
+    _list.__name__ = name
+    return _list
+#/_async_list_method
+
+
+
+class Mailbox(async_resource(wf.Mailbox)):
+    
+    async def create_mailbox_records(self,
+                                     records,
+                                     concurrency=None,
+                                     batch_size=None,
+                                     progress=None):
+        return await self._runner.bulk(self.create_mailbox,
+                                       records,
+                                       concurrency,
+                                       batch_size,
+                                       progress)
+    #/create_mailbox_records
+    
+    
+    async def delete_mailbox_records(self,
+                                     records,
+                                     concurrency=None,
+                                     batch_size=None,
+                                     progress=None):
+        return await self._runner.bulk(self.delete_mailbox,
+                                       records,
+                                       concurrency,
+                                       batch_size,
+                                       progress)
+    #/delete_mailbox_records
+    
+    
+    async def update_mailbox_records(self,
+                                     records,
+                                     concurrency=None,
+                                     batch_size=None,
+                                     progress=None):
+        return await self._runner.bulk(self.update_mailbox,
+                                       records,
+                                       concurrency,
+                                       batch_size,
+                                       progress)
+    #/update_mailbox_records
+    
+    
+    async def change_mailbox_password_records(self,
+                                              records,
+                                              concurrency=None,
+                                              batch_size=None,
+                                              progress=None):
+        return await self._runner.bulk(self.change_mailbox_password,
+                                       records,
+                                       concurrency,
+                                       batch_size,
+                                       progress)
+    #/change_mailbox_password_records
+
+#/Mailbox
+
+
+
+class Email(async_resource(wf.Email)):
+    
+    async def create_emails(self,
+                            domain=BLANK_STR,
+                            prefixes=None,
+                            targets=BLANK_STR,
+                            concurrency=None,
+                            batch_size=None,
+                            progress=None):
+        
+        return await self.create_email_records(
+                            [(_address, targets)
+                             for _address in wf.email_addresses(domain, prefixes)],
+                            concurrency,
+                            batch_size,
+                            progress)
+    #/create_emails
+    
+    
+    async def create_email_records(self,
+                                   records,
+                                   concurrency=None,
+                                   batch_size=None,
+                                   progress=None):
+        return await self._runner.bulk(self.create_email,
+                                       records,
+                                       concurrency,
+                                       batch_size,
+                                       progress)
+    #/create_email_records
+    
+    
+    async def delete_emails(self,
+                            domain=BLANK_STR,
+                            prefixes=None,
+                            concurrency=None,
+                            batch_size=None,
+                            progress=None):
+        
+        return await self.delete_email_records(wf.email_addresses(domain, prefixes),
+                                               concurrency,
+                                               batch_size,
+                                               progress)
+    #/delete_emails
+    
+    
+    async def delete_email_records(self,
+                                   records,
+                                   concurrency=None,
+                                   batch_size=None,
+                                   progress=None):
+        return await self._runner.bulk(self.delete_email,
+                                       records,
+                                       concurrency,
+                                       batch_size,
+                                       progress)
+    #/delete_email_records
+
+#/Email
+
+
+
+class DNS(async_resource(wf.DNS)):
+    
+    async def sync_dns_overrides(self,
+                                 records,
+                                 domains=(),
+                                 concurrency=None,
+                                 batch_size=None,
+                                 progress=None):
+        try:
+            _existing = await self._runner.inventory(self.list_dns_overrides)
+        except wf.DeadlineExceeded: #Every call fails unsent.
+            _existing = ()
+        _removes, _adds = wf.dns_override_calls(self, records, _existing, domains)
+        return await self._runner.run_bulk_steps(_removes,
+                                                 _adds,
+                                                 concurrency,
+                                                 batch_size,
+                                                 progress)
+    #/sync_dns_overrides
+
+#/DNS
+
+
+
+class Database(async_resource(wf.Database)):
+    
+    async def provision_dbs(self,
+                            manifest,
+                            concurrency=None,
+                            batch_size=None,
+                            progress=None):
+        try:
+            _dbs = await self._runner.inventory(self.list_dbs)
+            _users = await self._runner.inventory(self.list_db_users)
+        except wf.DeadlineExceeded: #Every call fails unsent.
+            _dbs = _users = ()
+        _first, _second = wf.db_manifest_calls(self, manifest, _dbs, _users)
+        return await self._runner.run_bulk_steps(_first,
+                                                 _second,
+                                                 concurrency,
+                                                 batch_size,
+                                                 progress)
+    #/provision_dbs
+
+#/Database
+
+
+
+class ShellUser(async_resource(wf.ShellUser)):
+    
+    async def sync_users(self,
+                         roster,
+                         prune=False,
+                         concurrency=None,
+                         batch_size=None,
+                         progress=None):
+        try:
+            _users = await self._runner.inventory(self.list_users)
+        except wf.DeadlineExceeded: #Every call fails unsent.
+            _users = wf.InventoryIndex(key=u('username'))
+        _first, _second = wf.shell_user_calls(self,
+                                              roster,
+                                              _users,
+                                              prune,
+                                              [self._runner.account[u('username')]])
+        return await self._runner.run_bulk_steps(_first,
+                                                 _second,
+                                                 concurrency,
+                                                 batch_size,
+                                                 progress)
+    #/sync_users
+
+#/ShellUser
+
+
+
+Domain = async_resource(wf.Domain)
+Website = async_resource(wf.Website)
+Application = async_resource(wf.Application)
+Cron = async_resource(wf.Cron)
+File = async_resource(wf.File)
+Server = async_resource(wf.Server)
+System = async_resource(wf.System)
+
+
+
+class AsyncRunner(wf.Runner):
+    """
+    `Runner` whose server calls are coroutines sent over an `AsyncTransport`,
+    with at most `max_concurrency` calls in flight for its account.  Logging,
+    inventory bookkeeping, and reporting are inherited unchanged; concurrency
+    comes from scheduling calls as asyncio tasks, so `batch()`, `parallel()`
+    and `graph()` raise `TypeError`.
+    """
+    
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, **kwargs):
+        super(AsyncRunner, self).__init__(**kwargs)
+        self._max_concurrency = max_concurrency
+        self._renewing = None
+    #/__init__
+    
+    
+    async def __aenter__(self):
+        return self
+    
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+    
+    
+    async def login_to_server(self, _username, _password):
+        """
+        Logs in to server using `_username` and `_password` and sets session
+        variables, or resumes a cached session, as `Runner.login_to_server`
+        does.
+        """
+        
+        self._server = AsyncServerProxy(self._api_url,
+                                        self._max_concurrency,
+                                        observer=self._note_exchange,
+                                        timeouts=self._timeouts)
+        self._credentials = (_username, _password)
+        _resumed = self._resume_session(_username)
+        if not _resumed:
+            await self._throttle(_username)
+            self._session_id, self._account = await self._server.login(_username,
+                                                                        _password)
+            self._store_session()
+        self._announce_login(_resumed)
+    #/login_to_server
+    
+    
+    async def _renew_session(self, _stale_session_id):
+        """
+        Logs in again after a call made with `_stale_session_id` found it
+        expired, as `Runner._renew_session` does.  Concurrent callers wait for
+        one login.
+        """
+        if self._credentials is None:
+            return False
+        if self._renewing is None:
+            self._renewing = asyncio.Lock()
+        async with self._renewing:
+            if self._session_id == _stale_session_id:
+                await self._throttle(self._credentials[0])
+                try:
+                    self._session_id, self._account = \
+                            await self._server.login(*self._credentials)
+                except Exception as error:
+                    self.log(u("LOGIN_TO_SERVER"), FAILURE, describe_fault(error))
+                    return False
+                self._store_session()
+        return True
+    #/_renew_session
+    
+    
+    async def call_api_method(self, _api_method, _resource, _arguments):
+        """
+        Awaits the call declared by `_api_method` on `_resource` with the
+        marshalled `_arguments`, applying its inventory guard and bookkeeping
+        just as `Runner.call_api_method` does.
+        """
+        if self._refuse_expired(_api_method):
+            return None
+        
+        _existing = (None if _api_method.inventory is None else
+                     await self.inventory(getattr(_resource,
+                                                  _api_method.inventory)))
+        if self._plan is not None:
+            return self._plan_call(_api_method, _existing, _arguments)
+        if self._refuse_guarded(_api_method, _existing, _arguments):
+            return None
+        
+        return await self.try_api_call(_api_method.caller,
+                                       getattr(_resource._server,
+                                               _api_method.name),
+                                       _arguments,
+                                       self._inventory_effect(_api_method,
+                                                              _arguments))
+    #/call_api_method
+    
+    
+    async def try_api_call(self, _caller, _api_call, _args, _on_success=None):
+        """
+        Awaits passed API signature with passed arguments and logs results.  A
+        successful result is also handed to `_on_success`, if supplied, and
+        returned.  Inside a `plan()` block it is only planned, unchecked.
+        """
+        if self._plan is not None:
+            self._plan.add(wf.PLAN_UNCHECKED, wf.get_method_name(_api_call), _args)
+            return None
+        
+        _error, _result, _duration = await self._invoke(_api_call, _args)
+        _key, _result = self._outcome(_error, _result)
+        return self._record(_caller, _key, _result, _on_success, _duration)
+    #/try_api_call
+    
+    
+    async def list_api_call(self, _api_call):
+        """
+        Awaits passed `list_*` API signature and returns its result, timing it
+        and running hooks like any other call.  Faults are raised rather than
+        logged.
+        """
+        _error, _result, _duration = await self._invoke(_api_call, ())
+        if _error is not None:
+            raise _error
+        return _result
+    #/list_api_call
+    
+    
+    async def _invoke(self, _api_call, _args):
+        """
+        Awaits one API call, timing it, adding it to the metrics, running the
+        registered hooks, and retrying a transient failure, just as
+        `Runner._invoke` does, or failing it unsent once the deadline has
+        passed.  Rate limiting and backoff delays only suspend this call.
+        """
+        _method_name = wf.get_method_name(_api_call)
+        _attempt = 1
+        _renewed = False
+        while True:
+            _throttled = await self._throttle()
+            _error = self._begin_attempt(_method_name, _args, _attempt)
+            if _error is not None:
+                return _error, None, None
+            
+            _result = None
+            _session_id = self._session_id
+            _start = time.perf_counter()
+            try:
+                _result = await _api_call(_session_id, *_args)
+            except Exception as error:
+                _error = error
+            _duration = time.perf_counter() - _start
+            #The transport noted this call's exchange just before it returned.
+            self._end_attempt(_method_name, _args, _attempt, _error, _result,
+                              _duration, _throttled)
+            
+            if (wf.session_expired(_error) and not _renewed and
+                await self._renew_session(_session_id)):
+                _renewed = True
+                continue
+            
+            _delay = self._retry_delay(_method_name, _error, _attempt, _duration)
+            if _delay is None:
+                return _error, _result, _duration
+            await asyncio.sleep(_delay)
+            _attempt += 1
+    #/_invoke
+    
+    
+    async def bulk(self,
+                   call,
+                   records,
+                   concurrency=None,
+                   batch_size=None,
+                   progress=None):
+        """
+        Awaits `call` for each of `records` against one inventory fetch, as
+        `Runner.bulk` makes it.  Returns a `BulkReport`.
+        """
+        _existing = (None if self._expired() else
+                     await self.inventory(getattr(call.__self__,
+                                                  call.api_method.inventory)))
+        return await self.run_bulk(self._bulk_records(call, records, _existing),
+                                   concurrency,
+                                   batch_size,
+                                   progress)
+    #/bulk
+    
+    
+    async def run_bulk(self,
+                       _records,
+                       concurrency=None,
+                       batch_size=None,
+                       progress=None):
+        """
+        Awaits the `BulkCall`s among `_records` concurrently, at most
+        `concurrency` at a time if given, and returns a `BulkReport`, as
+        `Runner.run_bulk` does.  `batch_size` is ignored, as calls are not
+        batched.
+        """
+        del batch_size #Accepted for `Runner.run_bulk`'s signature.
+        _slots = asyncio.Semaphore(concurrency) if concurrency else None
+        
+        async def _run(_index, _record, _settle):
+            if isinstance(_record, wf.BulkOutcome):
+                _settle(_index)
+                return
+            if _slots is None:
+                _result = await _record.call(*_record.args, **_record.kwargs)
+            else:
+                async with _slots:
+                    _result = await _record.call(*_record.args, **_record.kwargs)
+            _settle(_index, _result)
+        
+        with self._bulk_run(_records, progress) as (_report, _settle):
+            await asyncio.gather(*[_run(_index, _record, _settle)
+                                   for _index, _record in enumerate(_records)])
+        return _report
+    #/run_bulk
+    
+    
+    async def run_bulk_steps(self,
+                             _records,
+                             _dependents,
+                             concurrency=None,
+                             batch_size=None,
+                             progress=None):
+        """
+        Awaits `_records`, then the `_dependents` whose dependencies 
+        succeeded, as `Runner.run_bulk_steps` makes them.  Returns one 
+        `BulkReport` of both steps.
+        """
+        _total = len(_records) + len(_dependents)
+        _report = await self.run_bulk(_records,
+                                      concurrency,
+                                      batch_size,
+                                      wf.offset_progress(progress, 0, _total))
+        _report.rows.extend((await self.run_bulk(
+                                wf.unblocked_records(_dependents, _report),
+                                concurrency,
+                                batch_size,
+                                wf.offset_progress(progress,
+                                                   len(_records),
+                                                   _total))).rows)
+        return _report
+    #/run_bulk_steps
+    
+    
+    async def _throttle(self, _account=None):
+        """
+        Awaits the rate limiter, if any, as `Runner._throttle` waits for it.
+        """
+        if self._rate_limiter is None:
+            return 0.0
+        _delay = self._rate_limiter.reserve(self._limited_account(_account))
+        if _delay:
+            await asyncio.sleep(_delay)
+        return _delay
+    #/_throttle
+    
+    
+    async def inventory(self, _list_call):
+        """
+        Returns the cached `InventoryIndex` of the `_list_call` coroutine, as
+        `Runner.inventory` does.  Concurrent callers share one fetch of a
+        missing or expired inventory, made as a task of its own, so that
+        cancelling any of them leaves it running for the others.  A fetch
+        that overlaps a change to the cached inventory is made again.
+        """
+        _list_name = _list_call.__name__
+        _cached = self._cached_inventory(_list_name)
+        if _cached is not None:
+            return _cached
+        
+        _fetch = self._fetches.get(_list_name)
+        if _fetch is None:
+            _fetch = asyncio.ensure_future(self._fetch_inventory(_list_call))
+            self._fetches[_list_name] = _fetch
+        return await asyncio.shield(_fetch)
+    #/inventory
+    
+    
+    async def _fetch_inventory(self, _list_call):
+        """
+        Fetches and caches the `_list_call` inventory until no change to the
+        cached one overlaps the fetch.
+        """
+        _list_name = _list_call.__name__
+        try:
+            while True:
+                _version = self._inventory_version(_list_name)
+                _cached = self._store_inventory(_list_name,
+                                                _version,
+                                                await _list_call())
+                if _cached is not None:
+                    return _cached
+        finally:
+            del self._fetches[_list_name]
+    #/_fetch_inventory
+    
+    
+    def parallel(self, max_workers=None):
+        raise TypeError(SYNC_ONLY.format(u("parallel()")))
+    
+    
+    def graph(self, max_workers=None):
+        raise TypeError(SYNC_ONLY.format(u("graph()")))
+    
+    
+    def run_graph(self, _graph, max_workers=None):
+        raise TypeError(SYNC_ONLY.format(u("run_graph()")))
+    
+    
+    def batch(self, batch_size=None):
+        raise TypeError(SYNC_ONLY.format(u("batch()")))
+    
+    
+    def close(self):
+        """
+        Closes the pooled connections of this runner's transport.
+        """
+        if self._server is not None:
+            self._server.close()
+    #/close
+
+#/AsyncRunner
+
+#/EOF - wfapiclientasync
@@ -0,0 +1,421 @@
+""" wfapiclientbench - WebFaction API Client benchmark module
+    
+    Benchmarks of the client's hot paths: micro-benchmarks of its helpers and
+    per-call overhead, and end-to-end scenarios run against a local
+    `wfapiclientserver` stand-in, so no network or account is needed.
+    
+    Results are printed and can be written as JSON with `--output`.  Passing a
+    previous run's JSON as `--compare` reports the change in each benchmark and
+    exits non-zero if any got slower by more than `--threshold`.
+    
+    Usage:  python wfapiclientbench.py [--output results.json]
+            python wfapiclientbench.py --compare baseline.json --threshold 0.25
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import sys
+import json
+import timeit
+import inspect
+import platform
+import argparse
+from datetime import datetime
+
+import wfapiclient as wf
+import wfapiclientserver as fake
+from wfapiclient import u, text_type, BLANK_STR
+
+
+NUMBER = 20000 #Calls timed per call-signature benchmark.
+REPEAT = 3 #Runs of each benchmark; the fastest is reported.
+THRESHOLD = 0.25 #Slowdown, as a fraction, that `--compare` fails on.
+
+INVENTORY_SIZE = 1000 #Entities in inventories searched by micro-benchmarks.
+LOOKUPS = 200 #Existence checks made against those inventories.
+REPORT_ENTRIES = 100000 #Logged results rendered by the report benchmarks.
+DOMAINS = 20 #Domains given the RFC 2142 addresses by `bulk_email`.
+ENTITIES = 25 #Entities of each kind provisioned for `teardown`.
+
+TARGETS = [u('user1'), u('user2')]
+
+BENCHMARKS = [] #(name, function) of each registered benchmark, in run order.
+
+
+
+def benchmark(name):
+    """
+    Registers the decorated function as benchmark `name`.  It is called with
+    no arguments and returns `(operations, seconds)` for one run, timing only
+    the work being measured.
+    """
+    def _register(function):
+        BENCHMARKS.append((name, function))
+        return function
+    return _register
+#/benchmark
+
+
+def stopwatch(function):
+    """
+    Returns the seconds taken by one call of `function`.
+    """
+    _start = timeit.default_timer()
+    function()
+    return timeit.default_timer() - _start
+#/stopwatch
+
+
+def logged_in_runner(latency=0.0, **options):
+    """
+    Returns a `Runner` logged in to a fresh stand-in server, and the server.
+    """
+    _server = fake.serve_in_background(latency=latency, **options)
+    _runner = wf.Runner(api_url=_server.url)
+    _stdout, sys.stdout = sys.stdout, io.StringIO()
+    try:
+        _runner.login_to_server(u('user'), u('password'))
+    finally:
+        sys.stdout = _stdout
+    return _runner, _server
+#/logged_in_runner
+
+
+def inventory_entries(size=INVENTORY_SIZE):
+    """
+    Returns `size` entries shaped like a `list_emails` result.
+    """
+    return [{u('id'): _index,
+             u('email_address'): u("user{}@example.com").format(_index),
+             u('targets'): u("mailbox{}").format(_index),
+             u('autoresponder_on'): False}
+            for _index in range(size)]
+#/inventory_entries
+
+
+
+#The client's helpers from before `ApiMethod` and `InventoryIndex`, kept as 
+#baselines to benchmark those against.
+
+def get_frame_name(_frame):
+    """
+    Returns the upper-cased name of the function running in `_frame`.
+    """
+    return inspect.getframeinfo(_frame).function.upper()
+#/get_frame_name
+
+
+def get_arguments(_frame, inspect=inspect):
+    """
+    Inspects the calling signature of the passed `function` and retrieves the 
+    corresponding `argument` for each parameter in its `parameters`.
+    """
+    _arguments = []
+    
+    _frame_information = inspect.getargvalues(_frame)
+    _parameters = _frame_information[0][1:]
+    _signature = _frame_information[3]
+    
+    for _parameter in _parameters:
+        _argument = _signature[_parameter]
+        if isinstance(_argument, text_type):
+            _arguments.append(u(_argument))
+        else:
+            _arguments.append(_argument)
+    
+    return _arguments
+#/get_arguments
+
+
+def already_exists(candidate, returned_api_collection):
+    """
+    Checks for existence of one `candidate` set of key, value pairs within one 
+    and only one `_dictionary` within a `returned_api_collection` list of 
+    dictionaries returned by an API list call.
+    """
+    _exists = []
+    
+    for _dictionary in returned_api_collection:
+        _subgroup = set(wf.flatten_iterable(candidate))
+        _group = set(wf.flatten_iterable(_dictionary))
+        if _subgroup.issubset(_group):
+            _exists.append(True)
+    
+    return _exists.count(True) == 1
+#/already_exists
+
+
+
+def introspected_create_email(self,
+                              email_address=BLANK_STR,
+                              targets=[],
+                              autoresponder_on=False,
+                              autoresponder_subject = BLANK_STR,
+                              autoresponder_message=BLANK_STR,
+                              autoresponder_from=BLANK_STR,
+                              script_machine=BLANK_STR,
+                              script_path=BLANK_STR):
+    """
+    Marshals `Email.create_email` arguments the way resource methods did
+    before `ApiMethod`, by inspecting the current frame.
+    """
+    _current_frame = inspect.currentframe()
+    _caller = get_frame_name(_current_frame)
+    _arguments = get_arguments(_current_frame)
+    _arguments[1] = u(", ").join(_arguments[1])
+    return _caller, _arguments
+#/introspected_create_email
+
+
+def compiled_create_email(self, *args, **kwargs):
+    """
+    Marshals `Email.create_email` arguments through its compiled `ApiMethod`.
+    """
+    _api_method = wf.Email.create_email.api_method
+    return _api_method.caller, _api_method.marshal(args, kwargs)
+#/compiled_create_email
+
+
+def marshal_create_email(marshal, number=NUMBER):
+    _call = lambda: marshal(None,
+                            u('info@example.com'),
+                            TARGETS,
+                            autoresponder_on=True)
+    return number, stopwatch(lambda: [_call() for _ in range(number)])
+
+
+@benchmark(u('micro.get_arguments'))
+def bench_get_arguments():
+    return marshal_create_email(introspected_create_email)
+
+
+@benchmark(u('micro.api_method_marshal'))
+def bench_api_method_marshal():
+    return marshal_create_email(compiled_create_email)
+
+
+@benchmark(u('micro.already_exists'))
+def bench_already_exists():
+    _entries = inventory_entries()
+    _candidates = [{u('email_address'): u("user{}@example.com").format(_index)}
+                   for _index in range(0, INVENTORY_SIZE, INVENTORY_SIZE // LOOKUPS)]
+    return len(_candidates), stopwatch(
+                lambda: [already_exists(_candidate, _entries)
+                         for _candidate in _candidates])
+
+
+@benchmark(u('micro.inventory_index'))
+def bench_inventory_index():
+    _entries = inventory_entries()
+    _values = [u("user{}@example.com").format(_index)
+               for _index in range(0, INVENTORY_SIZE, INVENTORY_SIZE // LOOKUPS)]
+    
+    def _run():
+        _index = wf.InventoryIndex(_entries, u('email_address'))
+        return [_value in _index for _value in _values]
+    
+    return len(_values), stopwatch(_run)
+
+
+@benchmark(u('micro.flatten_iterable'))
+def bench_flatten_iterable():
+    _entries = inventory_entries()
+    return len(_entries), stopwatch(lambda: list(wf.flatten_iterable(_entries)))
+
+
+@benchmark(u('micro.process_results'))
+def bench_process_results():
+    _runner = wf.Runner()
+    for _entry in inventory_entries(INVENTORY_SIZE * 10):
+        _runner.log(u('CREATE_EMAIL'), wf.SUCCESS, _entry)
+    return INVENTORY_SIZE * 10, stopwatch(_runner.process_results)
+
+
+@benchmark(u('cycle.guarded_create'))
+def bench_guarded_create():
+    _runner, _server = logged_in_runner(inventory_size=INVENTORY_SIZE)
+    _mailbox = wf.Mailbox(_runner)
+    _mailbox.list_mailboxes() #Warm the connection.
+    try:
+        return LOOKUPS, stopwatch(
+                    lambda: [_mailbox.create_mailbox(u("bench_{}").format(_index))
+                             for _index in range(LOOKUPS)])
+    finally:
+        _server.shutdown()
+        _server.server_close()
+
+
+@benchmark(u('scenario.bulk_email'))
+def bench_bulk_email():
+    _runner, _server = logged_in_runner(inventory_size=INVENTORY_SIZE)
+    _email = wf.Email(_runner)
+    try:
+        return DOMAINS * len(wf.RFC_2142_PREFIXES), stopwatch(
+                    lambda: [_email.create_emails(u("d{}.example.com").format(_index),
+                                                  targets=TARGETS)
+                             for _index in range(DOMAINS)])
+    finally:
+        _server.shutdown()
+        _server.server_close()
+
+
+@benchmark(u('scenario.teardown'))
+def bench_teardown():
+    _runner, _server = logged_in_runner()
+    _names = [u("wf_test_{}").format(_index) for _index in range(ENTITIES)]
+    _application = wf.Application(_runner)
+    _website = wf.Website(_runner)
+    _mailbox = wf.Mailbox(_runner)
+    _email = wf.Email(_runner)
+    _database = wf.Database(_runner)
+    _shelluser = wf.ShellUser(_runner)
+    
+    for _name in _names:
+        _application.create_app(_name, u("static"))
+        _website.create_website(_name, fake.WEB_SERVER_IP, False, [], [_name, u("/")])
+        _mailbox.create_mailbox(_name)
+        _email.create_email(_name + u("@example.com"), [_name])
+        _database.create_db(_name, u("postgresql"), _name)
+        _shelluser.create_user(_name, u("bash"), [])
+    
+    def _teardown():
+        for _name in _names:
+            _website.delete_website(_name, fake.WEB_SERVER_IP, False)
+            _application.delete_app(_name)
+            _email.delete_email(_name + u("@example.com"))
+            _mailbox.delete_mailbox(_name)
+            _database.delete_db(_name, u("postgresql"))
+            _database.delete_db_user(_name, u("postgresql"))
+            _shelluser.delete_user(_name)
+    
+    try:
+        return ENTITIES * 7, stopwatch(_teardown)
+    finally:
+        _server.shutdown()
+        _server.server_close()
+
+
+def logged_runner(entries=REPORT_ENTRIES):
+    _runner = wf.Runner()
+    _entry = inventory_entries(1)[0]
+    for _index in range(entries):
+        _runner.log(u('CREATE_EMAIL'), wf.SUCCESS, _entry)
+    return _runner
+
+
+@benchmark(u('scenario.report_100k'))
+def bench_report():
+    _runner = logged_runner()
+    return REPORT_ENTRIES, stopwatch(_runner.report)
+
+
+@benchmark(u('scenario.streamed_report_100k'))
+def bench_streamed_report():
+    _runner = wf.Runner()
+    _entry = inventory_entries(1)[0]
+    
+    def _stream():
+        _runner.stream_report_to_file(io.StringIO())
+        for _index in range(REPORT_ENTRIES):
+            _runner.log(u('CREATE_EMAIL'), wf.SUCCESS, _entry)
+        _runner.close_report()
+    
+    return REPORT_ENTRIES, stopwatch(_stream)
+
+
+
+def run_benchmarks(select=None, repeat=REPEAT):
+    """
+    Runs every registered benchmark whose name contains `select`, keeping the
+    fastest of `repeat` runs, and returns their results by name.
+    """
+    _results = {}
+    for _name, _function in BENCHMARKS:
+        if select and select not in _name:
+            continue
+        _runs = [_function() for _ in range(repeat)]
+        _operations, _seconds = min(_runs, key=lambda _run: _run[1])
+        _results[_name] = {u('operations'): _operations,
+                           u('seconds'): _seconds,
+                           u('seconds_per_op'): _seconds / _operations}
+    return _results
+#/run_benchmarks
+
+
+def compare_results(baseline, results, threshold=THRESHOLD):
+    """
+    Returns the relative change in `seconds_per_op` of each benchmark present
+    in both runs, and the names of those slower by more than `threshold`.
+    """
+    _changes = {}
+    _regressions = []
+    for _name, _result in results.items():
+        _before = baseline.get(_name)
+        if _before is None:
+            continue
+        _change = (_result[u('seconds_per_op')] /
+                   _before[u('seconds_per_op')]) - 1.0
+        _changes[_name] = _change
+        if _change > threshold:
+            _regressions.append(_name)
+    return _changes, sorted(_regressions)
+#/compare_results
+
+
+def main():
+    """
+    Runs the benchmarks, prints their timings, and handles JSON file IO.
+    """
+    
+    parser = argparse.ArgumentParser(description=u("Benchmarks of the WebFaction API client."))
+    
+    parser.add_argument(u("--select"), help=u("Only run benchmarks whose name contains this."))
+    parser.add_argument(u("--repeat"), type=int, default=REPEAT, help=u("Runs of each benchmark."))
+    parser.add_argument(u("--label"), default=BLANK_STR, help=u("Label, such as a commit id, stored with the results."))
+    parser.add_argument(u("--output"), help=u("File into which to write JSON results."))
+    parser.add_argument(u("--compare"), help=u("JSON results of an earlier run to compare against."))
+    parser.add_argument(u("--threshold"), type=float, default=THRESHOLD, help=u("Slowdown fraction that fails the comparison."))
+    
+    args = parser.parse_args()
+    
+    _results = run_benchmarks(args.select, args.repeat)
+    _report = {u('label'): args.label,
+               u('date'): datetime.now().isoformat(),
+               u('python'): platform.python_version(),
+               u('platform'): platform.platform(),
+               u('results'): _results}
+    
+    _changes = {}
+    _regressions = []
+    if args.compare:
+        with io.open(args.compare, u('r'), encoding=u('utf-8')) as _baseline:
+            _changes, _regressions = compare_results(
+                                            json.load(_baseline)[u('results')],
+                                            _results,
+                                            args.threshold)
+    
+    for _name, _result in sorted(_results.items()):
+        _line = u(" {0:<32} {1:12.2f} us/op").format(_name,
+                                                      _result[u('seconds_per_op')] * 1e6)
+        if _name in _changes:
+            _line += u("  {0:+7.1%}").format(_changes[_name])
+        print(_line)
+    
+    if args.output:
+        with io.open(args.output, u('w'), encoding=u('utf-8')) as _target:
+            _target.write(text_type(json.dumps(_report, indent=2, sort_keys=True)))
+    
+    if _regressions:
+        print(u(" Slower than baseline by more than {0:.0%}: {1}").format(
+                                args.threshold, wf.COMMA_SEP.join(_regressions)))
+        sys.exit(1)
+#/main
+
+
+if __name__ == u("__main__"):
+    main()
+
+#/EOF - wfapiclientbench
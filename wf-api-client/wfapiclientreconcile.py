@@ -0,0 +1,488 @@
+""" wfapiclientreconcile - WebFaction API Client desired-state module
+    
+    Reconciles a WebFaction account with a desired-state document, in JSON or
+    YAML, listing the domains, applications, websites, mailboxes, email
+    addresses, DNS overrides, databases, database users and shell users it
+    should have.  Each inventory is fetched once, the smallest set of creates,
+    updates and, optionally, deletes is worked out from it, and they are made
+    in dependency order, independent ones in parallel.
+    
+    Usage:  python wfapiclientreconcile.py user pass state.yaml [--prune]
+            python wfapiclientreconcile.py user pass state.json --planfile plan.json
+"""
+
+from __future__ import with_statement
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import json
+import os.path
+import argparse
+from io import open
+from collections import OrderedDict, namedtuple
+
+import wfapiclient as wf
+from wfapiclient import u, text_type, BLANK_STR, COMMA_SEP
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+CHANGE_CREATE = u("create")
+CHANGE_UPDATE = u("update")
+CHANGE_DELETE = u("delete")
+CHANGE_GRANT = u("grant")
+
+
+#One mutation worked out by `diff_state`: the `kind` of entity it changes,
+#the `action` taken, the entity's `key`, and the resource class `method`
+#called with keyword `arguments`, in dependency `tier` order.
+Change = namedtuple(u('Change'), [u('kind'),
+                                  u('action'),
+                                  u('key'),
+                                  u('resource'),
+                                  u('method'),
+                                  u('arguments'),
+                                  u('tier')])
+
+
+
+def normalize(value, listed=False):
+    """
+    Returns `value` in a form comparable between the desired state and an
+    inventory: a `listed` string is split on commas, as the API joins lists,
+    and tuples become lists.
+    """
+    if listed and isinstance(value, text_type):
+        return [_part.strip() for _part in value.split(u(',')) if _part.strip()]
+    if isinstance(value, (list, tuple)):
+        return [normalize(_item) for _item in value]
+    return value
+#/normalize
+
+
+
+class Kind(object):
+    """
+    One kind of entity in the desired state: the resource class managing it,
+    its inventory method, the methods creating, updating and deleting one,
+    and the dependency `tier` it is created in, after the kinds in lower
+    tiers and deleted before them.  Desired entries are keyword arguments of
+    the create method; `aliases` names inventory fields that differ from
+    them, and `wrapped` fields the inventory reports as a list of the
+    desired value.
+    """
+    
+    def __init__(self,
+                 resource,
+                 list_name,
+                 create,
+                 delete,
+                 update=None,
+                 tier=0,
+                 aliases=None,
+                 wrapped=()):
+        self.resource = resource
+        self.list_name = list_name
+        self.create = create
+        self.delete = delete
+        self.update = update
+        self.tier = tier
+        self.aliases = aliases or {}
+        self.wrapped = wrapped
+        self._create_method = getattr(resource, create).api_method
+        self._delete_method = getattr(resource, delete).api_method
+    #/__init__
+    
+    
+    @property
+    def key(self):
+        return self._create_method.parameters[0]
+    
+    
+    def entries(self, desired):
+        """
+        Returns the desired entries, as keyword arguments of the create
+        method, by key.
+        """
+        _entries = OrderedDict()
+        for _entry in desired:
+            _entry = dict(_entry)
+            for _name in _entry:
+                if _name not in self._create_method.parameters:
+                    raise ValueError(u("Unknown field '{0}' for {1}.").format(
+                                                            _name, self.create))
+            _entries[_entry[self.key]] = _entry
+        return _entries
+    #/entries
+    
+    
+    def differs(self, entry, existing):
+        """
+        Checks whether a desired `entry` differs from the `existing`
+        inventory entry in any field the inventory reports.
+        """
+        for _name, _value in entry.items():
+            _field = self.aliases.get(_name, _name)
+            if _field not in existing:
+                continue
+            _value = normalize([_value] if _name in self.wrapped else _value)
+            if (normalize(existing[_field], isinstance(_value, list)) !=
+                _value):
+                return True
+        return False
+    #/differs
+    
+    
+    def changes(self, name, desired, existing, prune=False, keep=()):
+        """
+        Yields the changes bringing the `existing` inventory in line with the
+        `desired` entries of kind `name`.  Pruning never deletes the entries
+        whose keys are in `keep`.
+        """
+        _entries = self.entries(desired)
+        for _key, _entry in _entries.items():
+            _existing = existing.get(_key)
+            if _existing is None:
+                yield Change(name, CHANGE_CREATE, _key, self.resource,
+                             self.create, _entry, self.tier)
+            elif self.update is not None and self.differs(_entry, _existing):
+                yield Change(name, CHANGE_UPDATE, _key, self.resource,
+                             self.update, _entry, self.tier)
+        
+        if prune:
+            for _existing in existing:
+                _key = _existing.get(existing.key)
+                if _key not in _entries and _key not in keep:
+                    yield Change(name, CHANGE_DELETE, _key, self.resource,
+                                 self.delete, self.deletion(_key, _existing),
+                                 self.tier)
+    #/changes
+    
+    
+    def deletion(self, key, existing):
+        """
+        Returns the keyword arguments deleting the `existing` entry `key`,
+        taking any arguments after the key from the entry.
+        """
+        _arguments = {self._delete_method.parameters[0]: key}
+        for _name in self._delete_method.parameters[1:]:
+            _field = self.aliases.get(_name, _name)
+            if _field in existing:
+                _arguments[_name] = existing[_field]
+        return _arguments
+    #/deletion
+
+#/Kind
+
+
+
+class DomainKind(Kind):
+    """
+    Domains, whose desired entries list the `subdomain`s each should have.
+    Missing subdomains are added to an existing domain rather than it being
+    recreated, and pruning removes only the subdomains not desired.
+    """
+    
+    def changes(self, name, desired, existing, prune=False, keep=()):
+        for _key, _entry in self.entries(desired).items():
+            _wanted = normalize(_entry.get(u('subdomain'), []), True)
+            _existing = existing.get(_key)
+            _have = ([] if _existing is None else
+                     normalize(_existing.get(u('subdomains'), []), True))
+            _missing = [_sub for _sub in _wanted if _sub not in _have]
+            if _existing is None or _missing:
+                yield Change(name,
+                             CHANGE_CREATE if _existing is None else CHANGE_UPDATE,
+                             _key, self.resource, self.create,
+                             {u('domain'): _key, u('subdomain'): _missing},
+                             self.tier)
+            _extra = [_sub for _sub in _have if _sub not in _wanted]
+            if prune and _existing is not None and _extra:
+                yield Change(name, CHANGE_DELETE, _key, self.resource,
+                             self.delete,
+                             {u('domain'): _key, u('subdomain'): _extra},
+                             self.tier)
+        
+        if prune:
+            _desired = set(self.entries(desired))
+            for _existing in existing:
+                if (_existing[u('domain')] not in _desired and
+                    _existing[u('domain')] not in keep):
+                    yield Change(name, CHANGE_DELETE, _existing[u('domain')],
+                                 self.resource, self.delete,
+                                 {u('domain'): _existing[u('domain')],
+                                  u('subdomain'): []},
+                                 self.tier)
+    #/changes
+
+#/DomainKind
+
+
+
+class DnsOverrideKind(Kind):
+    """
+    DNS overrides, which have no name of their own and are identified by all
+    of their record fields.
+    """
+    
+    def _record(self, entry):
+        return tuple(text_type(entry.get(_name) or BLANK_STR)
+                     for _name in self._create_method.parameters)
+    
+    
+    def changes(self, name, desired, existing, prune=False, keep=()):
+        _have = set(self._record(_existing) for _existing in existing)
+        _wanted = set()
+        for _entry in desired:
+            _record = self._record(_entry)
+            _wanted.add(_record)
+            if _record not in _have:
+                yield Change(name, CHANGE_CREATE, _entry[u('domain')],
+                             self.resource, self.create, dict(_entry), self.tier)
+        
+        if prune:
+            for _existing in existing:
+                if self._record(_existing) not in _wanted:
+                    yield Change(name, CHANGE_DELETE, _existing[u('domain')],
+                                 self.resource, self.delete,
+                                 dict((_name, _existing[_name])
+                                      for _name in self._delete_method.parameters
+                                      if _existing.get(_name)),
+                                 self.tier)
+    #/changes
+
+#/DnsOverrideKind
+
+
+
+#Kinds of entity in a desired-state document, by section name.  Websites
+#need their domains and applications; email addresses their mailboxes; DNS
+#overrides their domains.
+KINDS = OrderedDict([
+    (u('domains'), DomainKind(wf.Domain, u('list_domains'),
+                              u('create_domain'), u('delete_domain'))),
+    (u('apps'), Kind(wf.Application, u('list_apps'),
+                     u('create_app'), u('delete_app'))),
+    (u('dbs'), Kind(wf.Database, u('list_dbs'),
+                    u('create_db'), u('delete_db'))),
+    (u('db_users'), Kind(wf.Database, u('list_db_users'),
+                         u('create_db_user'), u('delete_db_user'))),
+    (u('mailboxes'), Kind(wf.Mailbox, u('list_mailboxes'),
+                          u('create_mailbox'), u('delete_mailbox'),
+                          u('update_mailbox'))),
+    (u('users'), Kind(wf.ShellUser, u('list_users'),
+                      u('create_user'), u('delete_user'))),
+    (u('websites'), Kind(wf.Website, u('list_websites'),
+                         u('create_website'), u('delete_website'),
+                         u('update_website'),
+                         tier=1,
+                         aliases={u('website_name'): u('name'),
+                                  u('site_apps'): u('website_apps')},
+                         wrapped=(u('site_apps'),))),
+    (u('emails'), Kind(wf.Email, u('list_emails'),
+                       u('create_email'), u('delete_email'),
+                       u('update_email'),
+                       tier=1)),
+    (u('dns_overrides'), DnsOverrideKind(wf.DNS, u('list_dns_overrides'),
+                                         u('create_dns_override'),
+                                         u('delete_dns_override'),
+                                         tier=1)),
+])
+
+GRANTS = u('grants') #Database permissions, `{username, database, db_type}`.
+GRANTS_TIER = 2
+
+
+
+def load_state(state_file):
+    """
+    Reads a desired-state document from a JSON, or, with PyYAML installed,
+    YAML file.
+    """
+    with open(state_file, u('r')) as _state_source:
+        if os.path.splitext(state_file)[1].lower() in (u('.yaml'), u('.yml')):
+            if yaml is None:
+                raise RuntimeError(u("YAML desired-state files require PyYAML."))
+            return yaml.safe_load(_state_source) or {}
+        return json.load(_state_source)
+#/load_state
+
+
+def kept_databases(runner, state):
+    """
+    Returns the names of the databases pruning leaves in place, whose default
+    users, of the same name, stay with them: the desired ones, or every
+    existing one if the `state` has no `dbs` section.
+    """
+    _kind = KINDS[u('dbs')]
+    if u('dbs') in state:
+        return list(_kind.entries(state[u('dbs')]))
+    return [_entry[u('name')]
+            for _entry in runner.inventory(getattr(_kind.resource(runner),
+                                                   _kind.list_name))]
+#/kept_databases
+
+
+def diff_state(runner, state, prune=False):
+    """
+    Returns the changes bringing the account of a logged-in `runner` in line
+    with the desired `state`, fetching each inventory it covers once.  With
+    `prune`, entities of a kind the state covers but doesn't list are
+    deleted, though never the account's own shell user or the default user of
+    a database left in place; the inventories are then fetched afresh, as
+    deletes take arguments from entries the cache may hold only the names
+    of.  Database permissions are granted for database users or
+    databases created by the changes.
+    """
+    for _name in state:
+        if _name not in KINDS and _name != GRANTS:
+            raise ValueError(u("Unknown kind '{0}' in desired state.").format(_name))
+    
+    _keep = {u('users'): [runner.account[u('username')]]}
+    if prune and u('db_users') in state:
+        _keep[u('db_users')] = kept_databases(runner, state)
+    
+    _changes = []
+    for _name, _kind in KINDS.items():
+        if _name in state:
+            if prune:
+                runner.invalidate_inventory(_kind.list_name)
+            _existing = runner.inventory(getattr(_kind.resource(runner),
+                                                 _kind.list_name))
+            _changes.extend(_kind.changes(_name, state[_name], _existing, prune,
+                                          _keep.get(_name, ())))
+    
+    _created = set((_change.kind, _change.key) for _change in _changes
+                   if _change.action == CHANGE_CREATE)
+    for _grant in state.get(GRANTS, ()):
+        if ((u('db_users'), _grant[u('username')]) in _created or
+            (u('dbs'), _grant[u('database')]) in _created):
+            _changes.append(Change(GRANTS, CHANGE_GRANT, _grant[u('username')],
+                                   wf.Database, u('grant_db_permissions'),
+                                   dict(_grant), GRANTS_TIER))
+    return _changes
+#/diff_state
+
+
+def apply_changes(runner, changes, max_workers=None):
+    """
+    Makes the `changes` through `runner`: deletes first, from the highest
+    tier down, then creates, updates and grants from the lowest tier up.
+    The changes within a step are independent and made in parallel.
+    """
+    _tiers = sorted(set(_change.tier for _change in changes))
+    _steps = ([(True, _tier) for _tier in reversed(_tiers)] +
+              [(False, _tier) for _tier in _tiers])
+    
+    for _deleting, _tier in _steps:
+        _step = [_change for _change in changes
+                 if _change.tier == _tier and
+                 (_change.action == CHANGE_DELETE) == _deleting]
+        if not _step:
+            continue
+        with runner.parallel(max_workers):
+            for _change in _step:
+                getattr(_change.resource(runner), _change.method)(
+                                                        **_change.arguments)
+#/apply_changes
+
+
+def reconcile(runner, state, prune=False, max_workers=None):
+    """
+    Brings the account of a logged-in `runner` in line with the desired
+    `state` and returns the changes made.  Within `runner.plan()` the
+    changes are planned instead.
+    """
+    _changes = diff_state(runner, state, prune)
+    apply_changes(runner, _changes, max_workers)
+    return _changes
+#/reconcile
+
+
+def summarize(changes):
+    """
+    Returns the number of `changes` of each action, as text.
+    """
+    _counts = OrderedDict()
+    for _change in changes:
+        _counts[_change.action] = _counts.get(_change.action, 0) + 1
+    return (COMMA_SEP.join(u("{0} {1}").format(_count, _action)
+                           for _action, _count in _counts.items())
+            or u("no changes"))
+#/summarize
+
+
+def main():
+    """
+    Parses arguments, reconciles the account, or every account listed in a 
+    credentials file, and reports.
+    """
+    
+    parser = argparse.ArgumentParser(description=u("Reconciles a WebFaction account with a desired-state document."))
+    
+    parser.add_argument(u("username"), nargs=u("?"), help=u("The WebFaction server control panel username."))
+    parser.add_argument(u("password"), nargs=u("?"), help=u("The WebFaction server control panel password."))
+    parser.add_argument(u("statefile"), help=u("JSON or YAML desired-state document."))
+    parser.add_argument(u("--credentialsfile"), help=u("JSON list of accounts to reconcile instead."))
+    parser.add_argument(u("--maxaccounts"), type=int, default=wf.FLEET_WORKERS, help=u("Accounts reconciled at once with --credentialsfile."))
+    parser.add_argument(u("--prune"), action=u("store_true"), help=u("Delete entities the document's sections don't list."))
+    parser.add_argument(u("--maxworkers"), type=int, default=wf.MAX_WORKERS, help=u("Changes made at once."))
+    parser.add_argument(u("--planfile"), help=u("Plan the changes into this file instead of making them."))
+    parser.add_argument(u("--reportfile"), help=u("File into which to write run results."))
+    parser.add_argument(u("--apiurl"), help=u("API endpoint to use instead of WebFaction's."))
+    
+    args = parser.parse_args()
+    
+    if args.credentialsfile and args.planfile:
+        parser.error(u("--planfile plans one account; drop --credentialsfile."))
+    if not args.credentialsfile and not (args.username and args.password):
+        parser.error(u("username and password are required without --credentialsfile."))
+    
+    _state = load_state(os.path.normpath(args.statefile))
+    
+    if args.credentialsfile:
+        fleet = wf.FleetRunner(wf.read_credentials(os.path.normpath(args.credentialsfile)),
+                               args.maxaccounts,
+                               api_url=args.apiurl)
+        def reconcile_state(runner):
+            _changes = reconcile(runner, _state, args.prune, args.maxworkers)
+            print(u(" {0}: Made {1}.").format(runner.account[u('username')],
+                                              summarize(_changes)))
+        try:
+            fleet.login()
+            fleet.run(reconcile_state)
+        finally:
+            if args.reportfile:
+                fleet.write_report_to_file(os.path.normpath(args.reportfile))
+            fleet.close()
+        return
+    
+    runner = wf.Runner(api_url=args.apiurl)
+    
+    if args.reportfile:
+        runner.stream_report_to_file(os.path.normpath(args.reportfile))
+    
+    try:
+        runner.login_to_server(args.username, args.password)
+        
+        if args.planfile:
+            with runner.plan() as _plan:
+                _changes = reconcile(runner, _state, args.prune, args.maxworkers)
+            _plan.write(os.path.normpath(args.planfile))
+            print(u(" Planned {0}.").format(summarize(_changes)))
+        else:
+            _changes = reconcile(runner, _state, args.prune, args.maxworkers)
+            print(u(" Made {0}.").format(summarize(_changes)))
+    finally:
+        runner.close_report()
+#/main
+
+
+if __name__ == u("__main__"):
+    main()
+
+#/EOF - wfapiclientreconcile
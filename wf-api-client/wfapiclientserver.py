@@ -0,0 +1,716 @@
+""" wfapiclientserver - WebFaction API Client stand-in server module
+    
+    A local XML-RPC server emulating the WebFaction API, for running the
+    client, its tests, and its benchmarks offline.  It implements `login` and
+    every API method the resource classes call, keeping accounts' entities in
+    memory.  Latency, fault injection, transient HTTP errors, and the size of
+    the initial inventories are configurable.
+    
+    Usage:  python wfapiclientserver.py [--port 8765] [--latency 0.05] ...
+            python wfapiclienttests.py user pass report.html \
+                                       --apiurl=http://127.0.0.1:8765/
+"""
+
+from __future__ import with_statement
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import sys
+import time
+import uuid
+import random
+import threading
+import argparse
+from collections import OrderedDict
+
+from wfapiclient import u, BLANK_STR, DNS_RECORD_TYPES
+
+if sys.version_info < (3,):
+    #Import compatible xmlrpc server libraries.
+    import xmlrpclib as _xmlrpc
+    from SimpleXMLRPCServer import (SimpleXMLRPCServer,
+                                    SimpleXMLRPCRequestHandler)
+    from SocketServer import ThreadingMixIn
+else:
+    #Import python3-compatible xmlrpc server libraries.
+    import xmlrpc.client as _xmlrpc
+    from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+    from socketserver import ThreadingMixIn
+#/python version checks
+
+
+HOST = u("127.0.0.1")
+PORT = 8765
+
+WEB_SERVER = u("Web1")
+WEB_SERVER_IP = u("192.0.2.1")
+
+FAULT_CODE = 1 #WebFaction reports every API error with this fault code.
+
+NOT_API_METHODS = (u('expire_sessions'),)
+
+INVENTORY_KEYS = {u('mailboxes'): u('mailbox'),
+                  u('emails'): u('email_address'),
+                  u('domains'): u('domain'),
+                  u('websites'): u('name'),
+                  u('apps'): u('name'),
+                  u('dbs'): u('name'),
+                  u('db_users'): u('username'),
+                  u('users'): u('username'),
+                  u('dns_overrides'): u('id')}
+
+
+
+class FakeWebFaction(object):
+    """
+    In-memory WebFaction account behind the stand-in server.  Each public
+    method is an API method; faults mirror the ones the real API raises for
+    unknown sessions, duplicate entities, and missing entities.
+    
+    As on WebFaction, the account's own shell user is listed among its users.
+    `inventory_size` entities of every listed kind exist from the start.  A
+    call fails with an injected `Fault` with probability `fault_rate`, or
+    always if its name is in `fault_methods`.
+    """
+    
+    def __init__(self,
+                 username=u("user"),
+                 password=u("password"),
+                 inventory_size=0,
+                 fault_rate=0.0,
+                 fault_methods=(),
+                 seed=None):
+        self._username = username
+        self._password = password
+        self._fault_rate = fault_rate
+        self._fault_methods = set(fault_methods)
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._sessions = set()
+        self._next_id = 0
+        self._state = dict((_name, OrderedDict()) for _name in INVENTORY_KEYS)
+        self._cronjobs = []
+        self._files = {}
+        self.create_user(username, u("bash"), [])
+        self._populate(inventory_size)
+    #/__init__
+    
+    
+    @property
+    def state(self):
+        """
+        Every inventory, as a dictionary of entries by identifying field.
+        """
+        return self._state
+    
+    
+    def _dispatch(self, method, params):
+        """
+        Routes one call, authenticating its session and injecting faults.
+        """
+        _function = getattr(self, method, None)
+        if (method.startswith(u('_')) or method in NOT_API_METHODS or
+            not callable(_function)):
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u('method "{}" is not supported').format(method))
+        
+        if method != u('login'):
+            if not params or params[0] not in self._sessions:
+                raise _xmlrpc.Fault(FAULT_CODE,
+                                    u("SessionExpired: invalid or expired session id"))
+            params = params[1:]
+            if (method in self._fault_methods or
+                (self._fault_rate and self._random.random() < self._fault_rate)):
+                raise _xmlrpc.Fault(FAULT_CODE,
+                                    u("InjectedFault: {} failed").format(method))
+        
+        with self._lock:
+            return _function(*params)
+    #/_dispatch
+    
+    
+    def _populate(self, size):
+        """
+        Fills every inventory with `size` generated entities.
+        """
+        for _index in range(size):
+            _name = u("fake_{}").format(_index)
+            self.create_mailbox(_name)
+            self.create_email(_name + u("@fake.example.com"), _name)
+            self.create_domain(_name + u(".example.com"))
+            self.create_app(_name, u("static"))
+            self.create_website(_name, WEB_SERVER_IP, False, [])
+            self.create_db(_name, u("postgresql"), _name)
+            self.create_user(_name, u("bash"), [])
+            self.create_dns_override(_name + u(".example.com"), WEB_SERVER_IP)
+    #/_populate
+    
+    
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+    
+    
+    def _find(self, inventory, value):
+        return self._state[inventory].get(value)
+    
+    
+    def _create(self, inventory, entry):
+        _value = entry[INVENTORY_KEYS[inventory]]
+        if _value in self._state[inventory]:
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u("DataError: '{}' already exists").format(_value))
+        entry.setdefault(u('id'), self._new_id())
+        self._state[inventory][_value] = entry
+        return entry
+    
+    
+    def _get(self, inventory, value):
+        _entry = self._find(inventory, value)
+        if _entry is None:
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u("DataError: '{}' does not exist").format(value))
+        return _entry
+    
+    
+    def _delete(self, inventory, value):
+        _entry = self._get(inventory, value)
+        del self._state[inventory][value]
+        return _entry
+    
+    
+    def _delete_typed(self, inventory, value, db_type):
+        if self._get(inventory, value)[u('db_type')] != db_type:
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u("DataError: '{}' is not a {} one").format(value,
+                                                                        db_type))
+        return self._delete(inventory, value)
+    
+    
+    def _list(self, inventory):
+        return list(self._state[inventory].values())
+    
+    
+    #Account
+    def login(self, username, password, machine=None, api_version=None):
+        if (username, password) != (self._username, self._password):
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u("LoginError: invalid username or password"))
+        _session_id = uuid.uuid4().hex
+        self._sessions.add(_session_id)
+        return [_session_id, {u('id'): 1,
+                              u('username'): username,
+                              u('home'): u("/home"),
+                              u('web_server'): WEB_SERVER,
+                              u('mail_server'): u("Mailbox1")}]
+    
+    
+    def expire_sessions(self):
+        """
+        Invalidates every session id handed out so far.  Not an API method.
+        """
+        self._sessions.clear()
+    #/Account
+    
+    
+    #Mailbox
+    def list_mailboxes(self):
+        return self._list(u('mailboxes'))
+    
+    def create_mailbox(self,
+                       mailbox,
+                       enable_spam_protection=True,
+                       discard_spam=False,
+                       spam_redirect_folder=BLANK_STR,
+                       use_manual_procmailrc=False,
+                       manual_procmailrc=BLANK_STR):
+        _entry = self._create(u('mailboxes'),
+                              {u('mailbox'): mailbox,
+                               u('enable_spam_protection'): enable_spam_protection,
+                               u('discard_spam'): discard_spam,
+                               u('spam_redirect_folder'): spam_redirect_folder,
+                               u('use_manual_procmailrc'): use_manual_procmailrc,
+                               u('manual_procmailrc'): manual_procmailrc})
+        #Like the real API, return the password generated for the mailbox.
+        return dict(_entry, password=uuid.uuid4().hex)
+    
+    def delete_mailbox(self, mailbox):
+        return self._delete(u('mailboxes'), mailbox)
+    
+    def update_mailbox(self,
+                       mailbox,
+                       enable_spam_protection=True,
+                       discard_spam=False,
+                       spam_redirect_folder=BLANK_STR,
+                       use_manual_procmailrc=False,
+                       manual_procmailrc=BLANK_STR):
+        _entry = self._get(u('mailboxes'), mailbox)
+        _entry.update({u('enable_spam_protection'): enable_spam_protection,
+                       u('discard_spam'): discard_spam,
+                       u('spam_redirect_folder'): spam_redirect_folder,
+                       u('use_manual_procmailrc'): use_manual_procmailrc,
+                       u('manual_procmailrc'): manual_procmailrc})
+        return _entry
+    
+    def change_mailbox_password(self, mailbox, password):
+        return self._get(u('mailboxes'), mailbox)
+    #/Mailbox
+    
+    
+    #Email
+    def list_emails(self):
+        return self._list(u('emails'))
+    
+    def create_email(self,
+                     email_address,
+                     targets,
+                     autoresponder_on=False,
+                     autoresponder_subject=BLANK_STR,
+                     autoresponder_message=BLANK_STR,
+                     autoresponder_from=BLANK_STR,
+                     script_machine=BLANK_STR,
+                     script_path=BLANK_STR):
+        return self._create(u('emails'),
+                            {u('email_address'): email_address,
+                             u('targets'): targets,
+                             u('autoresponder_on'): autoresponder_on,
+                             u('autoresponder_subject'): autoresponder_subject,
+                             u('autoresponder_message'): autoresponder_message,
+                             u('autoresponder_from'): autoresponder_from,
+                             u('script_machine'): script_machine,
+                             u('script_path'): script_path})
+    
+    def delete_email(self, email_address):
+        return self._delete(u('emails'), email_address)
+    
+    def update_email(self,
+                     email_address,
+                     targets,
+                     autoresponder_on=False,
+                     autoresponder_subject=BLANK_STR,
+                     autoresponder_message=BLANK_STR,
+                     autoresponder_from=BLANK_STR,
+                     script_machine=BLANK_STR,
+                     script_path=BLANK_STR):
+        _entry = self._get(u('emails'), email_address)
+        _entry.update({u('targets'): targets,
+                       u('autoresponder_on'): autoresponder_on,
+                       u('autoresponder_subject'): autoresponder_subject,
+                       u('autoresponder_message'): autoresponder_message,
+                       u('autoresponder_from'): autoresponder_from,
+                       u('script_machine'): script_machine,
+                       u('script_path'): script_path})
+        return _entry
+    #/Email
+    
+    
+    #Domain
+    def list_domains(self):
+        return self._list(u('domains'))
+    
+    def create_domain(self, domain, *subdomains):
+        _entry = self._find(u('domains'), domain)
+        if _entry is None:
+            _entry = self._create(u('domains'),
+                                  {u('domain'): domain, u('subdomains'): []})
+        for _subdomain in subdomains:
+            if _subdomain not in _entry[u('subdomains')]:
+                _entry[u('subdomains')].append(_subdomain)
+        return _entry
+    
+    def delete_domain(self, domain, *subdomains):
+        if not subdomains:
+            return self._delete(u('domains'), domain)
+        _entry = self._get(u('domains'), domain)
+        _entry[u('subdomains')] = [_subdomain
+                                   for _subdomain in _entry[u('subdomains')]
+                                   if _subdomain not in subdomains]
+        return _entry
+    #/Domain
+    
+    
+    #Website
+    def list_websites(self):
+        return self._list(u('websites'))
+    
+    def list_bandwidth_usage(self):
+        return {u('daily'): {}, u('monthly'): {}}
+    
+    def create_website(self, website_name, ip, https, subdomains, *site_apps):
+        return self._create(u('websites'),
+                            {u('name'): website_name,
+                             u('ip'): ip,
+                             u('https'): https,
+                             u('subdomains'): subdomains,
+                             u('website_apps'): list(site_apps)})
+    
+    def delete_website(self, website_name, ip, https=False):
+        return self._delete(u('websites'), website_name)
+    
+    def update_website(self, website_name, ip, https, subdomains, *site_apps):
+        _entry = self._get(u('websites'), website_name)
+        _entry.update({u('ip'): ip,
+                       u('https'): https,
+                       u('subdomains'): subdomains,
+                       u('website_apps'): list(site_apps)})
+        return _entry
+    #/Website
+    
+    
+    #Application
+    def list_apps(self):
+        return self._list(u('apps'))
+    
+    def list_app_types(self):
+        return [{u('name'): u('static'), u('label'): u('Static only')}]
+    
+    def create_app(self,
+                   name,
+                   type,
+                   autostart=False,
+                   extra_info=BLANK_STR,
+                   open_port=False):
+        return self._create(u('apps'),
+                            {u('name'): name,
+                             u('type'): type,
+                             u('autostart'): autostart,
+                             u('extra_info'): extra_info,
+                             u('port'): 0,
+                             u('machine'): WEB_SERVER})
+    
+    def delete_app(self, name):
+        return self._delete(u('apps'), name)
+    #/Application
+    
+    
+    #Cron
+    def create_cronjob(self, line):
+        self._cronjobs.append(line)
+        return True
+    
+    def delete_cronjob(self, line):
+        if line not in self._cronjobs:
+            raise _xmlrpc.Fault(FAULT_CODE, u("DataError: no such cron job"))
+        self._cronjobs.remove(line)
+        return True
+    #/Cron
+    
+    
+    #DNS
+    def list_dns_overrides(self):
+        return self._list(u('dns_overrides'))
+    
+    def create_dns_override(self,
+                            domain,
+                            a_ip=BLANK_STR,
+                            cname=BLANK_STR,
+                            mx_name=BLANK_STR,
+                            mx_priority=BLANK_STR,
+                            spf_record=BLANK_STR,
+                            aaaa_ip=BLANK_STR):
+        return self._create(u('dns_overrides'),
+                            {u('id'): self._new_id(),
+                             u('domain'): domain,
+                             u('a_ip'): a_ip,
+                             u('cname'): cname,
+                             u('mx_name'): mx_name,
+                             u('mx_priority'): mx_priority,
+                             u('spf_record'): spf_record,
+                             u('aaaa_ip'): aaaa_ip})
+    
+    def delete_dns_override(self,
+                            domain,
+                            a_ip=BLANK_STR,
+                            cname=BLANK_STR,
+                            mx_name=BLANK_STR,
+                            mx_priority=BLANK_STR,
+                            spf_record=BLANK_STR,
+                            aaaa_ip=BLANK_STR):
+        #Only the records given are deleted.
+        _records = dict((_field, _value) for _field, _value in
+                        ((u('a_ip'), a_ip),
+                         (u('cname'), cname),
+                         (u('mx_name'), mx_name),
+                         (u('mx_priority'), mx_priority),
+                         (u('spf_record'), spf_record),
+                         (u('aaaa_ip'), aaaa_ip)) if _value)
+        _removed = [_entry for _entry in self._list(u('dns_overrides'))
+                    if _entry[u('domain')] == domain and
+                    all(_entry[_field] == _value
+                        for _field, _value in _records.items())]
+        if not _removed:
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u("DataError: no overrides for '{}'").format(domain))
+        #Other records of an override stay until none are left.
+        for _entry in _removed:
+            for _field in _records:
+                _entry[_field] = BLANK_STR
+            if not (_records and any(_entry[_type] for _type in DNS_RECORD_TYPES)):
+                self._delete(u('dns_overrides'), _entry[u('id')])
+        return _removed[0]
+    #/DNS
+    
+    
+    #Database
+    def list_dbs(self):
+        return self._list(u('dbs'))
+    
+    def list_db_users(self):
+        return self._list(u('db_users'))
+    
+    def create_db(self, name, db_type, password=BLANK_STR):
+        _entry = self._create(u('dbs'),
+                              {u('name'): name,
+                               u('db_type'): db_type,
+                               u('machine'): WEB_SERVER})
+        if self._find(u('db_users'), name) is None:
+            self.create_db_user(name, password, db_type)
+        return _entry
+    
+    def delete_db(self, name, db_type):
+        return self._delete_typed(u('dbs'), name, db_type)
+    
+    def create_db_user(self, username, password, db_type):
+        return self._create(u('db_users'),
+                            {u('username'): username,
+                             u('db_type'): db_type,
+                             u('machine'): WEB_SERVER})
+    
+    def delete_db_user(self, username, db_type):
+        return self._delete_typed(u('db_users'), username, db_type)
+    
+    def change_db_user_password(self, username, password, db_type):
+        return self._get(u('db_users'), username)
+    
+    def make_user_owner_of_db(self, username, database, db_type):
+        self._get(u('db_users'), username)
+        return self._get(u('dbs'), database)
+    
+    def grant_db_permissions(self, username, database, db_type):
+        self._get(u('db_users'), username)
+        return self._get(u('dbs'), database)
+    
+    def revoke_db_permissions(self, username, database, db_type):
+        self._get(u('db_users'), username)
+        return self._get(u('dbs'), database)
+    
+    def enable_addon(self, database, db_type, addon):
+        return self._get(u('dbs'), database)
+    #/Database
+    
+    
+    #File
+    def write_file(self, filename, str, mode=u('wb')):
+        if mode.startswith(u('a')):
+            self._files[filename] = self._files.get(filename, BLANK_STR) + str
+        else:
+            self._files[filename] = str
+        return True
+    
+    def replace_in_file(self, filename, *changes):
+        if filename not in self._files:
+            raise _xmlrpc.Fault(FAULT_CODE,
+                                u("DataError: no such file '{}'").format(filename))
+        for _old, _new in changes:
+            self._files[filename] = self._files[filename].replace(_old, _new)
+        return True
+    #/File
+    
+    
+    #ShellUser
+    def list_users(self):
+        return self._list(u('users'))
+    
+    def create_user(self, username, shell, groups):
+        return self._create(u('users'),
+                            {u('username'): username,
+                             u('shell'): shell,
+                             u('groups'): groups,
+                             u('machine'): WEB_SERVER})
+    
+    def delete_user(self, username):
+        return self._delete(u('users'), username)
+    
+    def change_user_password(self, username, password):
+        return self._get(u('users'), username)
+    #/ShellUser
+    
+    
+    #Server
+    def list_ips(self):
+        return [{u('machine'): WEB_SERVER, u('ip'): WEB_SERVER_IP, u('is_main'): True}]
+    
+    def list_machines(self):
+        return [{u('name'): WEB_SERVER, u('operating_system'): u("Centos7")}]
+    #/Server
+    
+    
+    #System
+    def system(self, cmd):
+        return BLANK_STR
+    #/System
+
+#/FakeWebFaction
+
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    #Keep connections alive, as the WebFaction endpoint does.
+    protocol_version = u("HTTP/1.1")
+    
+    def log_message(self, format, *args):
+        pass
+    
+    
+    def do_POST(self):
+        if not self.server.fails_transiently():
+            return SimpleXMLRPCRequestHandler.do_POST(self)
+        
+        #Answer as an overloaded gateway in front of the API would.
+        self.rfile.read(int(self.headers[u('content-length')]))
+        self.send_response(502, u("Bad Gateway"))
+        self.send_header(u('Content-Length'), u('0'))
+        self.end_headers()
+    #/do_POST
+#/_RequestHandler
+
+
+
+class FakeServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    Threaded XML-RPC server exposing a `FakeWebFaction` account, including
+    `system.multicall` unless `multicall` is unset.  Every request is
+    delayed by `latency` seconds, plus up to `jitter` more, to stand in for
+    the round trip to WebFaction, and is answered with a transient HTTP 502
+    error with probability `error_rate`.
+    """
+    
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+    
+    def __init__(self,
+                 address=(HOST, PORT),
+                 api=None,
+                 latency=0.0,
+                 jitter=0.0,
+                 error_rate=0.0,
+                 multicall=True):
+        SimpleXMLRPCServer.__init__(self,
+                                    address,
+                                    requestHandler=_RequestHandler,
+                                    logRequests=False,
+                                    allow_none=True)
+        self._api = api if api is not None else FakeWebFaction()
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self.register_instance(self._api)
+        if multicall:
+            self.register_multicall_functions()
+    #/__init__
+    
+    
+    @property
+    def api(self):
+        return self._api
+    
+    @property
+    def url(self):
+        return u("http://{0}:{1}/").format(*self.server_address[:2])
+    
+    
+    def fails_transiently(self):
+        """
+        Decides whether the next request gets a transient HTTP error.
+        """
+        return bool(self._error_rate) and random.random() < self._error_rate
+    #/fails_transiently
+    
+    
+    def _marshaled_dispatch(self, data, dispatch_method=None, path=None):
+        if self._latency or self._jitter:
+            time.sleep(self._latency + random.random() * self._jitter)
+        return SimpleXMLRPCServer._marshaled_dispatch(self,
+                                                      data,
+                                                      dispatch_method,
+                                                      path)
+    #/_marshaled_dispatch
+
+#/FakeServer
+
+
+
+def serve_in_background(host=HOST,
+                        port=0,
+                        latency=0.0,
+                        jitter=0.0,
+                        error_rate=0.0,
+                        multicall=True,
+                        **options):
+    """
+    Starts a `FakeServer` on a daemon thread and returns it.  Pass its `url`
+    as a `Runner`'s `api_url`; a `port` of 0 picks a free port.  Other
+    `options` configure the `FakeWebFaction` account.
+    """
+    _server = FakeServer((host, port),
+                         FakeWebFaction(**options),
+                         latency,
+                         jitter,
+                         error_rate,
+                         multicall)
+    _thread = threading.Thread(target=_server.serve_forever)
+    _thread.daemon = True
+    _thread.start()
+    return _server
+#/serve_in_background
+
+
+def main():
+    """
+    Parses arguments and serves until interrupted.
+    """
+    
+    parser = argparse.ArgumentParser(description=u("A local stand-in for the WebFaction server API."))
+    
+    parser.add_argument(u("--host"), default=HOST, help=u("Address to listen on."))
+    parser.add_argument(u("--port"), type=int, default=PORT, help=u("Port to listen on."))
+    parser.add_argument(u("--username"), default=u("user"), help=u("Username accepted by `login`."))
+    parser.add_argument(u("--password"), default=u("password"), help=u("Password accepted by `login`."))
+    parser.add_argument(u("--latency"), type=float, default=0.0, help=u("Seconds each request is delayed."))
+    parser.add_argument(u("--jitter"), type=float, default=0.0, help=u("Extra random delay of up to this many seconds."))
+    parser.add_argument(u("--inventorysize"), type=int, default=0, help=u("Entities of each kind the account starts with."))
+    parser.add_argument(u("--faultrate"), type=float, default=0.0, help=u("Probability that any call faults."))
+    parser.add_argument(u("--faultmethod"), action=u("append"), default=[], help=u("API method that always faults; repeatable."))
+    parser.add_argument(u("--errorrate"), type=float, default=0.0, help=u("Probability that any request gets an HTTP 502 error."))
+    parser.add_argument(u("--nomulticall"), action=u("store_true"), help=u("Don't offer `system.multicall`."))
+    
+    args = parser.parse_args()
+    
+    _api = FakeWebFaction(args.username,
+                          args.password,
+                          args.inventorysize,
+                          args.faultrate,
+                          args.faultmethod)
+    _server = FakeServer((args.host, args.port),
+                         _api,
+                         args.latency,
+                         args.jitter,
+                         args.errorrate,
+                         not args.nomulticall)
+    
+    print(u(" Serving the WebFaction API stand-in on {0}").format(_server.url))
+    try:
+        _server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _server.server_close()
+#/main
+
+
+if __name__ == u("__main__"):
+    main()
+
+#/EOF - wfapiclientserver
@@ -1,14 +1,42 @@
-"""wf-api-client tests"""
+"""wf-api-client tests
+    
+    Live tests against a WebFaction account, or any stand-in endpoint:
+        python wfapiclienttests.py user pass report.html [--apiurl=URL]
+    
+    Offline tests against a `wfapiclientserver` stand-in started per test:
+        python -m unittest wfapiclienttests
+"""
 
 from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import io
+import os
+import json
 import sys
-import inspect
+import time
+import shutil
+import socket
+import tempfile
+import threading
 import argparse
+import unittest
+
+if sys.version_info < (3,):
+    import xmlrpclib as _xmlrpc
+else:
+    import xmlrpc.client as _xmlrpc
 
 import wfapiclient as wf
+import wfapiclientserver
+import wfapiclientreconcile
+
+try:
+    import asyncio
+    import wfapiclientasync as wfa
+except (ImportError, SyntaxError): #Python before 3.5.
+    wfa = None
 
 
 
@@ -55,10 +83,11 @@ def run_tests():
     parser.add_argument("username", help="The WebFaction server control panel username.")
     parser.add_argument("password", help="The WebFaction server control panel password.")
     parser.add_argument("reportfile", help="File into which to write test results.")
+    parser.add_argument("--apiurl", help="API endpoint, such as a `wfapiclientserver` stand-in, to test against instead of WebFaction's.")
     
     args = parser.parse_args()
     
-    runner1 = wf.Runner()
+    runner1 = wf.Runner(api_url=args.apiurl)
     
     runner1.login_to_server(args.username, args.password)
     
@@ -342,6 +371,1558 @@ def run_tests():
 #/run_tests
 
 
+class OfflineTestCase(unittest.TestCase):
+    """
+    Runs the client against a fresh `wfapiclientserver` stand-in, configured 
+    by `server_options`, logged in through a `Runner` configured by 
+    `runner_options`.  Every API method sent is noted in `self.sent`, and 
+    `proxy()` gives a plain `ServerProxy` on the stand-in.
+    """
+    
+    server_options = {}
+    runner_options = {}
+    
+    def setUp(self):
+        self.server = wfapiclientserver.serve_in_background(**self.server_options)
+        self.runner = wf.Runner(api_url=self.server.url, **self.runner_options)
+        self.runner.login_to_server("user", "password")
+        self.sent = []
+        self.runner.add_hook(wf.HOOK_BEFORE,
+                             lambda event: self.sent.append(event.method))
+    
+    
+    def tearDown(self):
+        self.runner.close_report()
+        self.runner.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+    
+    
+    def state(self, inventory):
+        return self.server.api.state[inventory]
+    
+    
+    def proxy(self):
+        return _xmlrpc.ServerProxy(self.server.url,
+                                   transport=wf.PooledTransport(self.runner.pool,
+                                                                False),
+                                   allow_none=True)
+
+#/OfflineTestCase
+
+
+
+class StandInTests(OfflineTestCase):
+    
+    server_options = {"inventory_size": 3}
+    
+    def test_account_starts_with_inventory(self):
+        self.assertEqual(len(wf.Mailbox(self.runner).list_mailboxes()), 3)
+        self.assertEqual(sorted(self.state("users")),
+                         ["fake_0", "fake_1", "fake_2", "user"])
+    
+    
+    def test_faults_mirror_the_api(self):
+        proxy = self.proxy()
+        for call, message in [(lambda: proxy.login("user", "wrong"), "LoginError"),
+                              (lambda: proxy.list_mailboxes("stale"), "SessionExpired"),
+                              (lambda: proxy.expire_sessions(), "not supported"),
+                              (lambda: proxy.create_mailbox(self.runner.session_id,
+                                                            "fake_0"), "DataError")]:
+            with self.assertRaises(_xmlrpc.Fault) as caught:
+                call()
+            self.assertIn(message, caught.exception.faultString)
+    
+    
+    def test_expired_sessions_are_refused(self):
+        proxy = self.proxy()
+        session_id = self.runner.session_id
+        proxy.list_mailboxes(session_id)
+        self.server.api.expire_sessions()
+        
+        self.assertRaises(_xmlrpc.Fault, proxy.list_mailboxes, session_id)
+    
+    
+    def test_transient_errors_are_bad_gateways(self):
+        self.server._error_rate = 1.0
+        with self.assertRaises(_xmlrpc.ProtocolError) as caught:
+            self.proxy().list_mailboxes(self.runner.session_id)
+        self.assertEqual(caught.exception.errcode, 502)
+
+#/StandInTests
+
+
+
+class InventoryTests(OfflineTestCase):
+    
+    def test_guarded_calls_share_one_inventory_fetch(self):
+        mailbox = wf.Mailbox(self.runner)
+        for name in ["box1", "box2", "box3"]:
+            mailbox.create_mailbox(mailbox=name)
+        
+        self.assertEqual(self.sent.count("list_mailboxes"), 1)
+        self.assertEqual(self.sent.count("create_mailbox"), 3)
+        self.assertEqual(sorted(self.state("mailboxes")), ["box1", "box2", "box3"])
+    
+    
+    def test_guard_turns_back_call_unsent(self):
+        mailbox = wf.Mailbox(self.runner)
+        self.assertIsNotNone(mailbox.create_mailbox(mailbox="box"))
+        self.assertIsNone(mailbox.create_mailbox(mailbox="box"))
+        self.assertIsNone(mailbox.delete_mailbox(mailbox="missing"))
+        
+        self.assertEqual(self.sent, ["list_mailboxes", "create_mailbox"])
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 2)
+    
+    
+    def test_invalidated_inventory_is_fetched_again(self):
+        domain = wf.Domain(self.runner)
+        self.runner.inventory(domain.list_domains)
+        domain.create_domain("example.com")
+        self.runner.inventory(domain.list_domains)
+        
+        self.assertEqual(self.sent.count("list_domains"), 2)
+    
+    
+    def test_zero_ttl_disables_cache(self):
+        self.runner._inventory_ttl = 0
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="box1")
+        mailbox.create_mailbox(mailbox="box2")
+        
+        self.assertEqual(self.sent.count("list_mailboxes"), 2)
+    
+    
+    def test_values_of_other_fields_dont_match(self):
+        email = wf.Email(self.runner)
+        email.create_email("info@example.com", "sales@example.com")
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox("box", spam_redirect_folder="archive")
+        
+        self.assertIsNotNone(email.create_email("sales@example.com", "box"))
+        self.assertIsNotNone(mailbox.create_mailbox("archive"))
+        self.assertEqual(sorted(self.state("emails")),
+                         ["info@example.com", "sales@example.com"])
+        self.assertEqual(sorted(self.state("mailboxes")), ["archive", "box"])
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+    
+    
+    def test_index_matches_only_the_identifying_field(self):
+        entries = [{"email_address": "info@example.com", "targets": "sales@example.com"},
+                   {"email_address": "info@example.com", "targets": "box"},
+                   {"email_address": "sales@example.org", "targets": "info"}]
+        index = wf.InventoryIndex(entries, wf.inventory_key("list_emails"))
+        
+        self.assertEqual(index.key, "email_address")
+        self.assertIn("info@example.com", index)
+        for value in ["sales@example.com", "box", "info"]:
+            self.assertNotIn(value, index)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.count("info@example.com"), 2)
+        self.assertEqual(index.duplicates(), ["info@example.com"])
+        self.assertIs(index.get("sales@example.org"), entries[2])
+        
+        index.remove("info@example.com")
+        self.assertEqual(list(index), entries[2:])
+        self.assertEqual(index.duplicates(), [])
+        self.assertEqual(wf.inventory_key("list_websites"), "name")
+        self.assertEqual(wf.inventory_key("list_machines"), "id")
+    
+    
+    def test_delete_domain_sends_no_empty_subdomain(self):
+        domain = wf.Domain(self.runner)
+        domain.create_domain("example.com", ["www", "ftp"])
+        domain.delete_domain("example.com", "www")
+        self.assertEqual(self.state("domains")["example.com"]["subdomains"],
+                         ["ftp"])
+        
+        self.assertEqual(domain.delete_domain.api_method.marshal(
+                                                        ("example.com",), {}),
+                         ["example.com"])
+        domain.delete_domain("example.com")
+        self.assertNotIn("example.com", self.state("domains"))
+
+#/InventoryTests
+
+
+
+class BatchTests(OfflineTestCase):
+    
+    def create_in_batch(self):
+        mailbox = wf.Mailbox(self.runner)
+        with self.runner.batch():
+            futures = [mailbox.create_mailbox(mailbox=name)
+                       for name in ["box1", "box2", "box3"]]
+        return futures
+    
+    
+    @unittest.skipIf(wf.Future is None, "futures are not available")
+    def test_batched_calls_resolve_futures(self):
+        futures = self.create_in_batch()
+        
+        self.assertEqual([future.result()["mailbox"] for future in futures],
+                         ["box1", "box2", "box3"])
+        self.assertEqual(sorted(self.state("mailboxes")), ["box1", "box2", "box3"])
+
+#/BatchTests
+
+
+
+class MulticallFallbackTests(BatchTests):
+    
+    server_options = {"multicall": False}
+    
+    def test_falls_back_to_single_calls(self):
+        self.create_in_batch()
+        
+        self.assertEqual(sorted(self.state("mailboxes")), ["box1", "box2", "box3"])
+        self.assertEqual(self.runner.result_counts()[wf.SUCCESS], 3)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+
+#/MulticallFallbackTests
+
+
+
+class MulticallErrorTests(OfflineTestCase):
+    
+    def fail_next_request(self):
+        _failures = [True]
+        self.server.fails_transiently = lambda: bool(_failures and _failures.pop())
+    
+    
+    def test_mutating_calls_are_not_resent(self):
+        mailbox = wf.Mailbox(self.runner)
+        self.runner.inventory(mailbox.list_mailboxes)
+        faults = []
+        self.runner.add_hook(wf.HOOK_FAULT, lambda event: faults.append(event.method))
+        self.fail_next_request()
+        with self.runner.batch():
+            for name in ["box1", "box2"]:
+                mailbox.create_mailbox(mailbox=name)
+        
+        self.assertEqual(self.sent.count("create_mailbox"), 2)
+        self.assertEqual(faults, ["create_mailbox"] * 2)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 2)
+        self.assertEqual(self.runner.metrics()["create_mailbox"]["error_rate"], 1.0)
+        self.assertEqual(list(self.state("mailboxes")), [])
+    
+    
+    def test_idempotent_calls_are_resent(self):
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="box")
+        self.fail_next_request()
+        with self.runner.batch():
+            mailbox.update_mailbox(mailbox="box")
+            mailbox.change_mailbox_password(mailbox="box", password="secret")
+        
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+        self.assertEqual(self.runner.result_counts()[wf.SUCCESS], 3)
+        self.assertEqual(self.runner.metrics()["update_mailbox"]["count"], 2)
+
+#/MulticallErrorTests
+
+
+
+@unittest.skipIf(wf.ThreadPoolExecutor is None, "futures are not available")
+class ParallelTests(OfflineTestCase):
+    
+    server_options = {"jitter": 0.05}
+    
+    def test_results_are_logged_in_submission_order(self):
+        names = ["box{0:02d}".format(index) for index in range(16)]
+        mailbox = wf.Mailbox(self.runner)
+        self.runner.inventory(mailbox.list_mailboxes)
+        with self.runner.parallel(8):
+            for name in names:
+                mailbox.create_mailbox(mailbox=name)
+        
+        report = self.runner.report()
+        positions = [report.index("| " + name + ",") for name in names]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(len(self.state("mailboxes")), len(names))
+    
+    
+    def test_inventory_fetch_doesnt_hold_up_parallel_calls(self):
+        mailbox = wf.Mailbox(self.runner)
+        email = wf.Email(self.runner)
+        self.runner.inventory(mailbox.list_mailboxes)
+        dispatch = self.server.api._dispatch
+        settled = []
+        
+        def slow_dispatch(method, params):
+            if method == "list_emails":
+                settled.append(len(self.runner.wait(futures, timeout=2)[0]))
+            return dispatch(method, params)
+        
+        self.server.api._dispatch = slow_dispatch
+        with self.runner.parallel(4):
+            futures = [mailbox.create_mailbox(mailbox="box{0}".format(index))
+                       for index in range(4)]
+            email.create_email("box@example.com", ["box0"])
+        
+        self.assertEqual(settled, [4])
+        self.assertEqual(self.sent.count("list_emails"), 1)
+    
+    
+    def break_invoke(self, name):
+        invoke = self.runner._invoke
+        def broken_invoke(api_call, args, attempt=1):
+            if args and args[0] == name:
+                raise ValueError("malformed response")
+            return invoke(api_call, args, attempt)
+        self.runner._invoke = broken_invoke
+    
+    
+    def test_unexpected_errors_settle_futures(self):
+        mailbox = wf.Mailbox(self.runner)
+        self.runner.inventory(mailbox.list_mailboxes)
+        self.break_invoke("box1")
+        with self.runner.parallel(2):
+            futures = [mailbox.create_mailbox(mailbox=name)
+                       for name in ["box1", "box2"]]
+        
+        self.assertRaises(ValueError, futures[0].result, 3)
+        self.assertEqual(futures[1].result(3)["mailbox"], "box2")
+        self.assertIn("ValueError, malformed response", self.runner.report())
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 1)
+    
+    
+    def test_unexpected_errors_fail_graph_tasks(self):
+        mailbox = wf.Mailbox(self.runner)
+        self.runner.inventory(mailbox.list_mailboxes)
+        self.break_invoke("box1")
+        with self.runner.graph() as graph:
+            broken = graph.add(mailbox.create_mailbox, "box1")
+            password = graph.add(mailbox.change_mailbox_password, "box1", "secret")
+            other = graph.add(mailbox.create_mailbox, "box2")
+        
+        self.assertEqual([broken.status, password.status, other.status],
+                         [wf.FAILURE, wf.SKIPPED, wf.SUCCESS])
+    
+    
+    def test_concurrent_callers_share_one_fetch(self):
+        mailbox = wf.Mailbox(self.runner)
+        list_mailboxes = self.server.api.list_mailboxes
+        self.server.api.list_mailboxes = lambda: (time.sleep(0.2), 
+                                                  list_mailboxes())[1]
+        threads = [threading.Thread(target=self.runner.inventory,
+                                    args=(mailbox.list_mailboxes,))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(self.sent.count("list_mailboxes"), 1)
+    
+    
+    def test_dns_sync_removes_before_adding(self):
+        dns = wf.DNS(self.runner)
+        dns.sync_dns_overrides([("example.com", "a_ip", "192.0.2.{0}".format(index))
+                                for index in range(4)])
+        events = []
+        self.runner.add_hook(wf.HOOK_AFTER,
+                             lambda event: events.append((wf.HOOK_AFTER,
+                                                          event.method)))
+        self.runner.add_hook(wf.HOOK_BEFORE,
+                             lambda event: events.append((wf.HOOK_BEFORE,
+                                                          event.method)))
+        
+        dns.sync_dns_overrides([("example.com", "a_ip", "198.51.100.{0}".format(index))
+                                for index in range(4)],
+                               concurrency=8)
+        writes = [method for event, method in events
+                  if not method.startswith("list_")]
+        self.assertEqual(writes, ["delete_dns_override"] * 8 +
+                                 ["create_dns_override"] * 8)
+
+#/ParallelTests
+
+
+
+class PoolTests(OfflineTestCase):
+    
+    def test_stats_count_reuse(self):
+        for _ in range(5):
+            wf.Mailbox(self.runner).list_mailboxes()
+        
+        stats = self.runner.pool.stats()
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["hits"], 5)
+        self.assertEqual(stats["reconnects"], 0)
+        self.assertEqual(stats["idle"], 1)
+        self.assertGreater(stats["handshake_time"], 0)
+    
+    
+    def test_faults_keep_connection(self):
+        self.server.api._fault_methods.add("create_domain")
+        for index in range(5):
+            wf.Domain(self.runner).create_domain("{0}.example.com".format(index))
+        
+        stats = self.runner.pool.stats()
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 5)
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["idle"], 1)
+    
+    
+    def test_stale_connection_is_replaced(self):
+        host = self.server.url.split("/")[2]
+        connection = self.runner.pool.acquire(host, False)[0]
+        connection.sock.shutdown(socket.SHUT_RDWR) #As if the server timed out.
+        self.runner.pool.release(host, False, connection)
+        
+        self.assertEqual(wf.Mailbox(self.runner).list_mailboxes(), [])
+        stats = self.runner.pool.stats()
+        self.assertEqual(stats["reconnects"], 1)
+        self.assertEqual(stats["new_connections"], 2)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+
+#/PoolTests
+
+
+
+class MetricsTests(OfflineTestCase):
+    
+    def test_percentiles_and_totals(self):
+        metrics = wf.CallMetrics()
+        for index in range(1, 101):
+            metrics.add(index / 1000.0, index % 10 == 0, 100, 1000, 0, 0.5)
+        summary = metrics.summary()
+        
+        for field, seconds in [("p50", 0.050), ("p95", 0.095), ("p99", 0.099)]:
+            self.assertGreaterEqual(summary[field], seconds)
+            self.assertLessEqual(summary[field], seconds * wf.HISTOGRAM_GROWTH)
+        self.assertEqual(summary["max"], 0.1)
+        self.assertAlmostEqual(summary["mean"], 0.0505)
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["error_rate"], 0.1)
+        self.assertEqual(summary["request_bytes"], 10000)
+        self.assertEqual(summary["response_bytes"], 100000)
+        self.assertEqual(summary["throttled"], 50.0)
+    
+    
+    def test_unsized_responses_are_measured(self):
+        mailbox = wf.Mailbox(self.runner)
+        self.server.api.create_mailbox("box")
+        mailbox.list_mailboxes()
+        sized = self.runner.metrics()["list_mailboxes"]["response_bytes"]
+        
+        class UnsizedHandler(wfapiclientserver._RequestHandler):
+            def send_header(self, keyword, value):
+                if keyword.lower() == "content-length": #Read until closed.
+                    keyword, value = "Connection", "close"
+                wfapiclientserver._RequestHandler.send_header(self, keyword, value)
+        
+        self.server.RequestHandlerClass = UnsizedHandler
+        self.runner.pool.close()
+        self.assertEqual(len(mailbox.list_mailboxes()), 1)
+        
+        self.assertGreater(sized, 0)
+        self.assertEqual(self.runner.metrics()["list_mailboxes"]["response_bytes"],
+                         sized * 2)
+
+#/MetricsTests
+
+
+
+class HookTests(OfflineTestCase):
+    
+    runner_options = {"retry_policy": wf.RetryPolicy(max_attempts=3,
+                                                     base=0,
+                                                     fault_codes=[1])}
+    
+    def record_events(self, *events):
+        recorded = []
+        for event in events:
+            self.runner.add_hook(event,
+                                 lambda call, event=event: recorded.append((event,
+                                                                            call)))
+        return recorded
+    
+    
+    def test_secrets_are_redacted(self):
+        recorded = self.record_events(wf.HOOK_BEFORE, wf.HOOK_AFTER)
+        mailbox = wf.Mailbox(self.runner)
+        password = mailbox.create_mailbox(mailbox="box")["password"]
+        mailbox.change_mailbox_password("box", "s3cret-password")
+        
+        calls = dict(((event, call.method), call) for event, call in recorded)
+        self.assertEqual(calls[(wf.HOOK_AFTER, "create_mailbox")].result["password"],
+                         wf.REDACTED)
+        self.assertEqual(calls[(wf.HOOK_BEFORE, "change_mailbox_password")].arguments,
+                         ["box", wf.REDACTED])
+        self.assertNotIn(password, repr(recorded))
+        self.assertNotIn("s3cret-password", repr(recorded))
+    
+    
+    def test_events_carry_duration_and_attempt(self):
+        dispatch = self.server.api._dispatch
+        faults = ["list_mailboxes"]
+        def flaky_dispatch(method, params):
+            if method in faults:
+                faults.remove(method)
+                raise _xmlrpc.Fault(1, "InjectedFault: busy")
+            return dispatch(method, params)
+        self.server.api._dispatch = flaky_dispatch
+        recorded = self.record_events(wf.HOOK_BEFORE, wf.HOOK_AFTER, wf.HOOK_FAULT)
+        
+        self.assertEqual(wf.Mailbox(self.runner).list_mailboxes(), [])
+        self.assertEqual([(event, call.attempt) for event, call in recorded],
+                         [(wf.HOOK_BEFORE, 1), (wf.HOOK_FAULT, 1),
+                          (wf.HOOK_BEFORE, 2), (wf.HOOK_AFTER, 2)])
+        before, fault, _, after = [call for _, call in recorded]
+        self.assertIsNone(before.duration)
+        self.assertIsInstance(fault.error, _xmlrpc.Fault)
+        self.assertGreater(fault.duration, 0)
+        self.assertGreater(after.duration, 0)
+        self.assertEqual(after.result, [])
+    
+    
+    def test_raising_hook_is_ignored(self):
+        def broken_hook(call):
+            raise RuntimeError("hook broke")
+        self.runner.add_hook(wf.HOOK_AFTER, broken_hook)
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+        try:
+            self.assertIsNotNone(wf.Mailbox(self.runner).create_mailbox(mailbox="box"))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        
+        self.assertIn("hook broke", output)
+        self.assertEqual(list(self.state("mailboxes")), ["box"])
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+    
+    
+    def test_no_events_without_hooks(self):
+        for hook in list(self.runner._hooks[wf.HOOK_BEFORE]):
+            self.runner.remove_hook(wf.HOOK_BEFORE, hook)
+        built = []
+        call_event = wf.CallEvent
+        wf.CallEvent = lambda *fields: built.append(fields)
+        self.addCleanup(setattr, wf, "CallEvent", call_event)
+        self.server.api._fault_methods.add("delete_mailbox")
+        
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="box")
+        mailbox.delete_mailbox("box")
+        with self.runner.batch():
+            mailbox.create_mailbox(mailbox="box1")
+            mailbox.create_mailbox(mailbox="box2")
+        
+        self.assertEqual(sorted(self.state("mailboxes")), ["box", "box1", "box2"])
+        self.assertEqual(built, [])
+
+#/HookTests
+
+
+
+class RateLimiterTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.now = 0.0
+    
+    
+    def clock(self):
+        return self.now
+    
+    
+    def test_burst_then_steady_rate(self):
+        limiter = wf.RateLimiter(rate=10, burst=5, clock=self.clock)
+        self.assertEqual([limiter.reserve() for _ in range(5)], [0.0] * 5)
+        self.assertEqual([round(limiter.reserve(), 6) for _ in range(3)],
+                         [0.1, 0.2, 0.3])
+        
+        self.now = 10.0 #Refilled, but only up to the burst.
+        self.assertEqual([limiter.reserve() for _ in range(5)], [0.0] * 5)
+        self.assertAlmostEqual(limiter.reserve(), 0.1)
+    
+    
+    def test_accounts_are_limited_separately(self):
+        limiter = wf.RateLimiter(account_rate=2, account_burst=1, clock=self.clock)
+        self.assertEqual(limiter.reserve("alice"), 0.0)
+        self.assertEqual(limiter.reserve("bob"), 0.0)
+        self.assertAlmostEqual(limiter.reserve("alice"), 0.5)
+        
+        self.now = 0.5
+        self.assertEqual(limiter.reserve("bob"), 0.0)
+    
+    
+    def test_global_limit_holds_across_accounts(self):
+        limiter = wf.RateLimiter(rate=1, account_rate=100, clock=self.clock)
+        self.assertEqual(limiter.reserve("alice"), 0.0)
+        self.assertAlmostEqual(limiter.reserve("bob"), 1.0)
+    
+    
+    def test_throttled_time_is_counted(self):
+        limiter = wf.RateLimiter(rate=4, burst=1, account_rate=4, clock=self.clock)
+        for account in ["alice", "alice", "bob"]:
+            limiter.reserve(account)
+        stats = limiter.stats()
+        
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["throttled_calls"], 2)
+        self.assertAlmostEqual(stats["throttled_time"], 0.75)
+        self.assertEqual(stats["accounts"]["alice"]["calls"], 2)
+        self.assertAlmostEqual(stats["accounts"]["alice"]["throttled_time"], 0.25)
+        self.assertAlmostEqual(stats["accounts"]["bob"]["throttled_time"], 0.5)
+
+#/RateLimiterTests
+
+
+
+class ReportTests(OfflineTestCase):
+    
+    def test_results_are_streamed_as_logged(self):
+        target = io.StringIO()
+        self.runner.stream_report_to_file(target)
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="box1")
+        self.assertIn("box1", target.getvalue())
+        self.assertNotIn("box2", target.getvalue())
+        
+        mailbox.create_mailbox(mailbox="box2")
+        self.assertIn("box2", target.getvalue())
+        self.assertEqual(sum(self.runner.result_counts().values()), 0)
+        
+        self.runner.close_report()
+        self.assertTrue(target.getvalue().startswith(wf.HTML_START))
+        self.assertIn("create_mailbox", target.getvalue()) #Metrics table.
+        self.assertTrue(target.getvalue().endswith(wf.HTML_DOCUMENT_END))
+    
+    
+    def test_kept_results_are_reported_too(self):
+        self.runner.stream_report_to_file(io.StringIO(), keep_results=True)
+        wf.Mailbox(self.runner).create_mailbox(mailbox="box")
+        
+        self.assertEqual(self.runner.result_counts()[wf.SUCCESS], 1)
+        self.assertIn("box", self.runner.report())
+    
+    
+    def test_partial_report_is_readable(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "report.html")
+        writer = wf.ReportWriter(path, flush_interval=0)
+        writer.write(wf.SUCCESS, ["first | ", "result"])
+        writer.write(wf.FAILURE, ["second | ", "result"])
+        
+        with io.open(path) as report: #Run stopped before `close()`.
+            partial = report.read()
+        self.assertTrue(partial.startswith(wf.HTML_START))
+        self.assertIn("first", partial)
+        self.assertIn("second", partial)
+        self.assertNotIn(wf.HTML_DOCUMENT_END, partial)
+        
+        writer.close()
+        with io.open(path) as report:
+            self.assertTrue(report.read().endswith(wf.HTML_DOCUMENT_END))
+
+#/ReportTests
+
+
+
+@unittest.skipIf(wf.ThreadPoolExecutor is None, "futures are not available")
+class GraphTests(OfflineTestCase):
+    
+    def test_dependencies_follow_referenced_kinds(self):
+        self.server.api._fault_methods.add("create_app")
+        with self.runner.graph() as graph:
+            domain = graph.add(wf.Domain(self.runner).create_domain,
+                               "shop.example.com", ["www"])
+            app = graph.add(wf.Application(self.runner).create_app,
+                            "shop", "static_php70")
+            db = graph.add(wf.Database(self.runner).create_db,
+                           "shop", "mysql", "secret")
+            website = graph.add(wf.Website(self.runner).create_website,
+                                "shop", "192.0.2.1", False,
+                                ["www.shop.example.com"], [["shop", "/"]])
+        
+        self.assertEqual(db.depends_on, [])
+        self.assertEqual(website.depends_on, [domain, app])
+        self.assertEqual([task.status for task in graph.tasks],
+                         [wf.SUCCESS, wf.FAILURE, wf.SUCCESS, wf.SKIPPED])
+        self.assertEqual(list(self.state("dbs")), ["shop"])
+    
+    
+    def test_explicit_dependencies(self):
+        self.server.api._fault_methods.add("create_mailbox")
+        with self.runner.graph() as graph:
+            db = graph.add(wf.Database(self.runner).create_db,
+                           "shop", "mysql", "secret")
+            mailbox = graph.add(wf.Mailbox(self.runner).create_mailbox, "box")
+            domain = graph.add(wf.Domain(self.runner).create_domain,
+                               "example.com", after=[db])
+            email = graph.add(wf.Email(self.runner).create_email,
+                              "info@example.org", "info", after=[mailbox])
+        
+        self.assertEqual(domain.depends_on, [db])
+        self.assertEqual(email.depends_on, [mailbox])
+        self.assertEqual([task.status for task in graph.tasks],
+                         [wf.SUCCESS, wf.FAILURE, wf.SUCCESS, wf.SKIPPED])
+        self.assertLess(self.sent.index("create_db"), self.sent.index("create_domain"))
+        self.assertNotIn("create_email", self.sent)
+    
+    
+    def test_dependencies_outside_the_graph_are_refused(self):
+        outside = wf.TaskGraph().add(wf.Database(self.runner).create_db,
+                                     "shop", "mysql", "secret")
+        graph = wf.TaskGraph()
+        graph.add(wf.Domain(self.runner).create_domain, "example.com")
+        graph.add(wf.Mailbox(self.runner).create_mailbox, "box", after=[outside])
+        
+        self.assertRaises(ValueError, self.runner.run_graph, graph)
+        self.assertEqual([task.status for task in graph.tasks], [wf.SUCCESS, None])
+        self.assertNotIn("create_mailbox", self.sent)
+    
+    
+    def test_rerun_runs_only_new_tasks(self):
+        domain = wf.Domain(self.runner)
+        graph = wf.TaskGraph()
+        created = graph.add(domain.create_domain, "example.com")
+        self.runner.run_graph(graph)
+        
+        subdomain = graph.add(domain.create_domain, "example.com", "www")
+        del self.sent[:]
+        self.runner.run_graph(graph)
+        
+        self.assertEqual(subdomain.depends_on, [created])
+        self.assertEqual([task.status for task in graph.tasks],
+                         [wf.SUCCESS, wf.SUCCESS])
+        self.assertEqual(self.sent, ["create_domain"])
+        self.assertEqual(self.state("domains")["example.com"]["subdomains"], ["www"])
+
+#/GraphTests
+
+
+
+class RetryTests(OfflineTestCase):
+    
+    server_options = {"fault_rate": 0.5, "seed": 1}
+    runner_options = {"retry_policy": wf.RetryPolicy(max_attempts=20,
+                                                     base=0,
+                                                     fault_codes=[1])}
+    
+    def test_transient_faults_are_retried(self):
+        for _ in range(5):
+            self.assertEqual(wf.Mailbox(self.runner).list_mailboxes(), [])
+        
+        self.assertGreater(self.runner.result_counts()[wf.RETRY], 0)
+
+#/RetryTests
+
+
+
+class NoMutatingRetryTests(OfflineTestCase):
+    
+    server_options = {"fault_methods": ["create_mailbox"]}
+    runner_options = RetryTests.runner_options
+    
+    def test_mutating_calls_are_not_retried(self):
+        self.assertIsNone(wf.Mailbox(self.runner).create_mailbox(mailbox="box"))
+        
+        self.assertEqual(self.sent.count("create_mailbox"), 1)
+        self.assertEqual(self.runner.result_counts()[wf.RETRY], 0)
+
+
+#/NoMutatingRetryTests
+
+
+
+class TimeoutTests(OfflineTestCase):
+    
+    runner_options = {"read_timeout": 0.2}
+    
+    def setUp(self):
+        OfflineTestCase.setUp(self)
+        self.errors = []
+        self.runner.add_hook(wf.HOOK_FAULT,
+                             lambda event: self.errors.append(type(event.error)))
+    
+    
+    def test_slow_response_is_read_timeout(self):
+        self.server._latency = 0.5
+        self.assertIsNone(wf.Domain(self.runner).create_domain("example.com"))
+        
+        self.assertEqual(self.errors, [wf.ReadTimeout])
+        self.assertIn("ReadTimeout", self.runner.report())
+        self.assertEqual(self.runner.pool.stats()["idle"], 0)
+    
+    
+    def test_calls_after_deadline_are_not_sent(self):
+        mailbox = wf.Mailbox(self.runner)
+        with self.runner.deadline(0):
+            self.assertIsNone(mailbox.update_mailbox(mailbox="box"))
+            self.assertRaises(wf.DeadlineExceeded, mailbox.list_mailboxes)
+        
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 1)
+    
+    
+    @unittest.skipIf(wf.ThreadPoolExecutor is None, "futures are not available")
+    def test_deadline_expires_during_parallel(self):
+        self.runner._read_timeout = None
+        self.server._latency = 0.3
+        domain = wf.Domain(self.runner)
+        with self.runner.deadline(0.45):
+            with self.runner.parallel(2):
+                for index in range(6):
+                    domain.create_domain("{0}.example.com".format(index))
+        
+        self.assertEqual(self.runner.result_counts()[wf.SUCCESS], 2)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 4)
+        self.assertIn(wf.DeadlineExceeded, self.errors)
+        self.assertLess(self.sent.count("create_domain"), 6)
+        self.assertIsNone(self.runner.remaining())
+
+#/TimeoutTests
+
+
+
+class PlanTests(OfflineTestCase):
+    
+    def test_plan_checks_guards_without_writing(self):
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="existing")
+        del self.sent[:]
+        
+        with self.runner.plan() as plan:
+            mailbox.create_mailbox(mailbox="existing")
+            mailbox.create_mailbox(mailbox="new")
+            mailbox.update_mailbox(mailbox="new")
+            mailbox.delete_mailbox(mailbox="missing")
+            mailbox.change_mailbox_password(mailbox="existing", password="secret")
+        
+        self.assertEqual([(call.outcome, call.method) for call in plan.calls],
+                         [(wf.PLAN_SKIP_EXISTS, "create_mailbox"),
+                          (wf.PLAN_CREATE, "create_mailbox"),
+                          (wf.PLAN_UPDATE, "update_mailbox"),
+                          (wf.PLAN_FAIL_MISSING, "delete_mailbox"),
+                          (wf.PLAN_UPDATE, "change_mailbox_password")])
+        self.assertEqual(plan.calls[-1].arguments, ["existing", wf.REDACTED])
+        self.assertEqual(self.sent, [])
+        self.assertEqual(list(self.state("mailboxes")), ["existing"])
+    
+    
+    def plan_script(self, directory):
+        path = os.path.join(directory, "script.py")
+        with io.open(path, "w") as script:
+            script.write('Domain(self).create_domain("example.com", ["www"])\n'
+                         'Mailbox(self).create_mailbox(mailbox="box")\n'
+                         'Mailbox(self).create_mailbox(mailbox="box")\n'
+                         'Email(self).create_email("info@example.com", "box")\n'
+                         'Email(self).delete_email("sales@example.com")\n')
+        return path
+    
+    
+    def assert_planned(self, document):
+        self.assertEqual(document["counts"], {wf.PLAN_UNCHECKED: 1,
+                                              wf.PLAN_CREATE: 2,
+                                              wf.PLAN_SKIP_EXISTS: 1,
+                                              wf.PLAN_FAIL_MISSING: 1})
+        self.assertEqual([(call["outcome"], call["method"])
+                          for call in document["calls"]],
+                         [(wf.PLAN_UNCHECKED, "create_domain"),
+                          (wf.PLAN_CREATE, "create_mailbox"),
+                          (wf.PLAN_SKIP_EXISTS, "create_mailbox"),
+                          (wf.PLAN_CREATE, "create_email"),
+                          (wf.PLAN_FAIL_MISSING, "delete_email")])
+    
+    
+    def test_written_plan_lists_each_inventory_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "plan.json")
+        
+        with self.runner.plan() as plan:
+            self.runner.read_script_from_file(self.plan_script(directory))
+        plan.write(path)
+        
+        with io.open(path) as plan_file:
+            self.assert_planned(json.load(plan_file))
+        self.assertEqual(sorted(self.sent), ["list_emails", "list_mailboxes"])
+    
+    
+    def test_planfile_option(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "plan.json")
+        dispatch = self.server.api._dispatch
+        received = []
+        def counted_dispatch(method, params):
+            received.append(method)
+            return dispatch(method, params)
+        self.server.api._dispatch = counted_dispatch
+        
+        argv, sys.argv = sys.argv, ["wfapiclient.py", "user", "password",
+                                    "--apiurl", self.server.url,
+                                    "--scriptfile", self.plan_script(directory),
+                                    "--planfile", path]
+        try:
+            wf.main()
+        finally:
+            sys.argv = argv
+        
+        with io.open(path) as plan_file:
+            self.assert_planned(json.load(plan_file))
+        self.assertEqual(sorted(received), ["list_emails", "list_mailboxes", "login"])
+        self.assertEqual(list(self.state("mailboxes")), [])
+
+#/PlanTests
+
+
+
+class BulkTests(OfflineTestCase):
+    
+    def test_bulk_checks_one_inventory_and_skips_needless_calls(self):
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="existing")
+        del self.sent[:]
+        progress = []
+        
+        report = mailbox.create_mailbox_records(
+                    ["existing", "box1", {"mailbox": "box2"}, "box1"],
+                    progress=lambda settled, total: progress.append((settled, total)))
+        
+        self.assertEqual([(row.key, row.outcome) for row in report.rows],
+                         [("existing", wf.SKIPPED),
+                          ("box1", wf.SUCCESS),
+                          ("box2", wf.SUCCESS),
+                          ("box1", wf.SKIPPED)])
+        self.assertEqual(self.sent.count("create_mailbox"), 2)
+        self.assertNotIn("list_mailboxes", self.sent)
+        self.assertEqual(progress[-1], (4, 4))
+    
+    
+    def test_bulk_reports_faults(self):
+        self.server.api._fault_methods.add("create_mailbox")
+        report = wf.Mailbox(self.runner).create_mailbox_records(["box"])
+        
+        self.assertEqual(len(report.failures()), 1)
+        self.assertIn("InjectedFault", report.failures()[0].message)
+    
+    
+    def test_bulk_reports_unguarded_failures(self):
+        self.server.api.create_cronjob = lambda line: None
+        cron = wf.Cron(self.runner)
+        report = self.runner.run_bulk([wf.BulkCall("job", "create_cronjob",
+                                                   cron.create_cronjob,
+                                                   ("0 * * * * true",), {})])
+        
+        self.assertEqual(report.failures()[0].message,
+                         "Failed; see the run report.")
+    
+    
+    @unittest.skipIf(wf.ThreadPoolExecutor is None, "futures are not available")
+    def test_bulk_in_parallel(self):
+        names = ["box{0}".format(index) for index in range(10)]
+        report = wf.Mailbox(self.runner).create_mailbox_records(names,
+                                                                concurrency=4)
+        
+        self.assertEqual([row.key for row in report.rows], names)
+        self.assertEqual(report.counts(), {wf.SUCCESS: 10})
+    
+    
+    def test_secrets_never_reach_the_report(self):
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox_records(["box"])
+        mailbox.change_mailbox_password_records([("box", "s3cret-password")])
+        
+        report = self.runner.report()
+        self.assertNotIn("s3cret-password", report)
+        self.assertIn(wf.REDACTED, report)
+
+#/BulkTests
+
+
+
+class SyncTests(OfflineTestCase):
+    
+    def writes(self):
+        return [method for method in self.sent
+                if not method.startswith("list_")]
+    
+    
+    def test_dns_sync_sends_only_changes(self):
+        dns = wf.DNS(self.runner)
+        zone = [{"domain": "example.com", "a_ip": "192.0.2.1", "cname": "www.example.com"},
+                ("example.com", "mx_name", ("mail.example.com", "10"))]
+        dns.sync_dns_overrides(zone)
+        self.assertEqual(len(self.writes()), 3)
+        
+        del self.sent[:]
+        report = dns.sync_dns_overrides(zone)
+        self.assertEqual(self.writes(), [])
+        self.assertEqual(report.counts(), {wf.SKIPPED: 3})
+        
+        report = dns.sync_dns_overrides(zone[1:])
+        self.assertEqual(sorted(row.key for row in report.rows
+                                if row.outcome == wf.SUCCESS),
+                         ["example.com a_ip 192.0.2.1",
+                          "example.com cname www.example.com"])
+        self.assertEqual([override["mx_name"]
+                          for override in dns.list_dns_overrides()],
+                         ["mail.example.com"])
+    
+    
+    def test_provision_dbs_fetches_inventories_once(self):
+        manifest = {"users": [{"username": "reader", "password": "secret",
+                               "db_type": "postgresql"}],
+                    "dbs": [{"name": "db{0}".format(index), "db_type": "postgresql",
+                             "owner": "db{0}".format(index), "grants": ["reader"],
+                             "addons": ["postgis"]} for index in range(5)]}
+        database = wf.Database(self.runner)
+        report = database.provision_dbs(manifest)
+        
+        self.assertEqual(report.counts(), {wf.SUCCESS: 21})
+        self.assertEqual(self.sent.count("list_dbs"), 1)
+        self.assertEqual(self.sent.count("list_db_users"), 1)
+        
+        del self.sent[:]
+        report = database.provision_dbs(manifest)
+        self.assertEqual(self.writes(), [])
+        self.assertEqual(report.counts(), {wf.SKIPPED: 21})
+    
+    
+    def test_provision_dbs_skips_setup_of_failed_creates(self):
+        self.server.api._fault_methods.add("create_db_user")
+        report = wf.Database(self.runner).provision_dbs(
+                    {"users": [{"username": "reader", "db_type": "postgresql"}],
+                     "dbs": [{"name": "db", "grants": ["reader"]}]})
+        
+        self.assertEqual([(row.action, row.outcome) for row in report.rows],
+                         [("create_db", wf.SUCCESS),
+                          ("create_db_user", wf.FAILURE),
+                          ("grant_db_permissions", wf.SKIPPED)])
+    
+    
+    def test_sync_users_rotates_passwords_and_prunes(self):
+        shell_user = wf.ShellUser(self.runner)
+        roster = [("alice", "bash", ["devs"], "pw1"), ("bob", "bash", ["devs"], None)]
+        shell_user.sync_users(roster)
+        self.assertEqual(self.writes(), ["create_user", "create_user",
+                                         "change_user_password"])
+        
+        del self.sent[:]
+        report = shell_user.sync_users([("alice", "bash", ["ops"], "pw2")],
+                                       prune=True)
+        self.assertEqual(sorted(self.writes()), ["change_user_password",
+                                                 "delete_user"])
+        self.assertIn("can't change", report.rows[0].message)
+        self.assertEqual(sorted(self.state("users")), ["alice", "user"])
+
+#/SyncTests
+
+
+
+@unittest.skipIf(wf.ThreadPoolExecutor is None, "futures are not available")
+class FleetTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.servers = dict((username,
+                             wfapiclientserver.serve_in_background(username=username))
+                            for username in ["alice", "bob"])
+        self.pool = wf.ConnectionPool()
+        self.limiter = wf.RateLimiter(rate=1000, account_rate=1000)
+        self.fleet = wf.FleetRunner(
+                        [{"username": "alice", "password": "password",
+                          "api_url": self.servers["alice"].url},
+                         {"username": "bob", "password": "password",
+                          "api_url": self.servers["bob"].url},
+                         {"username": "carol", "password": "password",
+                          "api_url": self.servers["alice"].url}],
+                        max_accounts=3,
+                        pool=self.pool,
+                        rate_limiter=self.limiter)
+    
+    
+    def tearDown(self):
+        self.fleet.close()
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+    
+    
+    def test_accounts_are_driven_separately(self):
+        self.assertEqual(self.fleet.login(), ["carol"])
+        
+        def provision(runner):
+            mailbox = wf.Mailbox(runner)
+            mailbox.create_mailbox(mailbox=runner.account["username"] + "_box")
+            if runner.account["username"] == "bob":
+                raise RuntimeError("bob's job broke")
+            mailbox.create_mailbox(mailbox="second_box")
+        
+        self.fleet.run(provision)
+        
+        self.assertEqual(list(self.servers["alice"].api.state["mailboxes"]),
+                         ["alice_box", "second_box"])
+        self.assertEqual(list(self.servers["bob"].api.state["mailboxes"]),
+                         ["bob_box"])
+        counts = dict((username, dict(runner.result_counts()))
+                      for username, runner in self.fleet.runners.items())
+        self.assertEqual(counts["alice"], {wf.SUCCESS: 2, wf.FAILURE: 0, wf.RETRY: 0})
+        self.assertEqual(counts["bob"], {wf.SUCCESS: 1, wf.FAILURE: 1, wf.RETRY: 0})
+        self.assertEqual(counts["carol"], {wf.SUCCESS: 0, wf.FAILURE: 1, wf.RETRY: 0})
+        self.assertNotIn("bob_box", self.fleet.runners["alice"].report())
+        self.assertIn("PROVISION | RuntimeError, bob's job broke", self.fleet.report())
+        self.assertIn("carol | 0 succeeded, 1 failed", self.fleet.report())
+    
+    
+    def test_pool_and_rate_limiter_are_shared(self):
+        self.fleet.login()
+        self.fleet.run(lambda runner: wf.Mailbox(runner).list_mailboxes())
+        
+        for runner in self.fleet.runners.values():
+            self.assertIs(runner.pool, self.pool)
+            self.assertIs(runner.rate_limiter, self.limiter)
+        pool_stats = self.pool.stats()
+        self.assertEqual(pool_stats["hits"] + pool_stats["new_connections"], 5)
+        self.assertLessEqual(pool_stats["new_connections"], 3) #One per login.
+        stats = self.limiter.stats()
+        self.assertEqual(stats["calls"], 5)
+        self.assertEqual(stats["accounts"]["alice"]["calls"], 2)
+        self.assertEqual(stats["accounts"]["bob"]["calls"], 2)
+        self.assertEqual(stats["accounts"]["carol"]["calls"], 1)
+
+#/FleetTests
+
+
+
+class SessionTests(OfflineTestCase):
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = wf.SessionCache(os.path.join(directory, "sessions"))
+        self.runner_options = {"session_cache": self.cache}
+        OfflineTestCase.setUp(self)
+    
+    
+    def login(self, api_url=None):
+        runner = wf.Runner(api_url=api_url or self.server.url,
+                           session_cache=self.cache)
+        self.addCleanup(runner.pool.close)
+        runner.login_to_server("user", "password")
+        return runner
+    
+    
+    @unittest.skipIf(os.name != "posix", "file modes are POSIX only")
+    def test_file_is_private(self):
+        self.assertEqual(os.stat(self.cache.path).st_mode & 0o777, 0o600)
+    
+    
+    def test_session_is_resumed_on_same_endpoint(self):
+        runner = self.login()
+        
+        self.assertEqual(runner.session_id, self.runner.session_id)
+        self.assertEqual(len(self.server.api._sessions), 1)
+        self.assertEqual(wf.Mailbox(runner).list_mailboxes(), [])
+    
+    
+    def test_session_is_not_resumed_on_other_endpoint(self):
+        other = wfapiclientserver.serve_in_background()
+        self.addCleanup(other.server_close)
+        self.addCleanup(other.shutdown)
+        runner = self.login(other.url)
+        
+        self.assertNotEqual(runner.session_id, self.runner.session_id)
+        self.assertEqual(self.cache.get("user", other.url),
+                         (runner.session_id, runner.account))
+        self.assertIsNone(self.cache.get("user", self.server.url))
+    
+    
+    @unittest.skipIf(os.name != "posix", "file modes are POSIX only")
+    def test_readable_file_is_ignored(self):
+        os.chmod(self.cache.path, 0o644)
+        self.assertIsNone(self.cache.get("user", self.server.url))
+        
+        runner = self.login()
+        self.assertNotEqual(runner.session_id, self.runner.session_id)
+        self.assertEqual(os.stat(self.cache.path).st_mode & 0o777, 0o600)
+    
+    
+    def test_expired_session_is_renewed(self):
+        session_id = self.runner.session_id
+        self.server.api.expire_sessions()
+        
+        self.assertEqual(wf.Mailbox(self.runner).list_mailboxes(), [])
+        self.assertNotEqual(self.runner.session_id, session_id)
+        self.assertEqual(self.cache.get("user", self.server.url)[0],
+                         self.runner.session_id)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+
+#/SessionTests
+
+
+
+@unittest.skipIf(wf.ThreadPoolExecutor is None, "futures are not available")
+class ReconcileTests(OfflineTestCase):
+    
+    STATE = {"domains": [{"domain": "example.com", "subdomain": ["www"]}],
+             "apps": [{"name": "shop", "type": "static"}],
+             "websites": [{"website_name": "shop", "ip": "192.0.2.1",
+                           "https": False, "subdomains": ["www.example.com"],
+                           "site_apps": ["shop", "/"]}],
+             "mailboxes": [{"mailbox": "info", "enable_spam_protection": False}],
+             "emails": [{"email_address": "info@example.com", "targets": ["info"]}],
+             "dns_overrides": [{"domain": "example.com", "a_ip": "192.0.2.2"}],
+             "dbs": [{"name": "shop", "db_type": "mysql", "password": "secret"}],
+             "db_users": [{"username": "reader", "password": "secret",
+                           "db_type": "mysql"}],
+             "users": [{"username": "alice", "shell": "bash", "groups": []}],
+             "grants": [{"username": "reader", "database": "shop",
+                         "db_type": "mysql"}]}
+    
+    #Tier of the kind each write changes, see `wfapiclientreconcile.KINDS`.
+    TIERS = {"create_website": 1, "update_website": 1, "delete_website": 1,
+             "create_email": 1, "update_email": 1, "delete_email": 1,
+             "create_dns_override": 1, "delete_dns_override": 1,
+             "grant_db_permissions": 2}
+    
+    def test_changes_are_made_by_tier(self):
+        wfapiclientreconcile.reconcile(self.runner,
+                                       {"mailboxes": [{"mailbox": "old"}],
+                                        "emails": [{"email_address": "old@example.com",
+                                                    "targets": ["old"]}]})
+        del self.sent[:]
+        
+        changes = wfapiclientreconcile.reconcile(self.runner, self.STATE, prune=True)
+        steps = []
+        for method in self.sent:
+            if not method.startswith("list_"):
+                step = (method.startswith("delete_"), self.TIERS.get(method, 0))
+                if not steps or steps[-1] != step:
+                    steps.append(step)
+        
+        self.assertEqual(steps, [(True, 1), (True, 0),
+                                 (False, 0), (False, 1), (False, 2)])
+        self.assertEqual(sorted((change.action, change.key) for change in changes
+                                if change.kind in ("mailboxes", "emails")),
+                         [("create", "info"),
+                          ("create", "info@example.com"),
+                          ("delete", "old"),
+                          ("delete", "old@example.com")])
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+    
+    
+    def test_second_reconcile_plans_no_changes(self):
+        wfapiclientreconcile.reconcile(self.runner, self.STATE)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+        
+        for prune in (False, True):
+            self.runner.invalidate_inventory() #Checked against the stand-in.
+            del self.sent[:]
+            with self.runner.plan() as plan:
+                changes = wfapiclientreconcile.reconcile(self.runner, self.STATE,
+                                                         prune=prune)
+            self.assertEqual(changes, [])
+            self.assertEqual(plan.calls, [])
+            self.assertEqual(sorted(set(self.sent)),
+                             sorted(wfapiclientreconcile.KINDS[name].list_name
+                                    for name in wfapiclientreconcile.KINDS))
+    
+    
+    def test_update_is_made_where_entry_differs(self):
+        mailbox = wf.Mailbox(self.runner)
+        mailbox.create_mailbox(mailbox="info", enable_spam_protection=True)
+        
+        changes = wfapiclientreconcile.reconcile(self.runner,
+                                                 {"mailboxes": self.STATE["mailboxes"]})
+        self.assertEqual([(change.action, change.key) for change in changes],
+                         [(wfapiclientreconcile.CHANGE_UPDATE, "info")])
+        self.assertFalse(self.state("mailboxes")["info"]["enable_spam_protection"])
+    
+    
+    def test_prune_keeps_own_shell_user(self):
+        state = {"users": [{"username": "alice", "shell": "bash", "groups": []}]}
+        wfapiclientreconcile.reconcile(self.runner, state)
+        
+        changes = wfapiclientreconcile.reconcile(self.runner, {"users": []},
+                                                 prune=True)
+        self.assertEqual([(change.action, change.key) for change in changes],
+                         [(wfapiclientreconcile.CHANGE_DELETE, "alice")])
+        self.assertEqual(list(self.state("users")), ["user"])
+    
+    
+    def test_prune_converges_on_databases(self):
+        state = {"dbs": [{"name": "shop", "db_type": "mysql"}],
+                 "db_users": [{"username": "reader", "password": "secret",
+                               "db_type": "mysql"}]}
+        wfapiclientreconcile.reconcile(self.runner, state, prune=True)
+        self.assertEqual(sorted(self.state("db_users")), ["reader", "shop"])
+        
+        del self.sent[:]
+        changes = wfapiclientreconcile.reconcile(self.runner, state, prune=True)
+        self.assertEqual(changes, [])
+        self.assertTrue(all(method.startswith("list_") for method in self.sent))
+    
+    
+    def test_prune_deletes_with_fetched_entries(self):
+        state = {"dbs": [{"name": "shop", "db_type": "mysql"}]}
+        wfapiclientreconcile.reconcile(self.runner, state)
+        
+        wfapiclientreconcile.reconcile(self.runner,
+                                       {"dbs": [], "db_users": []},
+                                       prune=True)
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 0)
+        self.assertEqual(list(self.state("dbs")), [])
+        self.assertEqual(list(self.state("db_users")), [])
+
+#/ReconcileTests
+
+
+
+@unittest.skipIf(wfa is None, "asyncio is not available")
+class AsyncOfflineTestCase(OfflineTestCase):
+    """
+    `OfflineTestCase` logged in through an `AsyncRunner` instead, on an event 
+    loop of its own.  Every connection the stand-in accepts is counted in 
+    `self.connections`.
+    """
+    
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = wfapiclientserver.serve_in_background(**self.server_options)
+        self.connections = []
+        process_request = self.server.process_request
+        def counted_process_request(request, client_address):
+            self.connections.append(client_address)
+            return process_request(request, client_address)
+        self.server.process_request = counted_process_request
+        
+        self.runner = wfa.AsyncRunner(api_url=self.server.url, **self.runner_options)
+        self.run_async(self.runner.login_to_server("user", "password"))
+        self.sent = []
+        self.runner.add_hook(wf.HOOK_BEFORE,
+                             lambda event: self.sent.append(event.method))
+    
+    
+    def tearDown(self):
+        self.runner.close()
+        self.run_async(asyncio.sleep(0)) #Lets the closed transports finish.
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.shutdown()
+        self.server.server_close()
+    
+    
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+    
+    
+    def gather(self, *coroutines):
+        return self.run_async(asyncio.gather(*coroutines))
+
+#/AsyncOfflineTestCase
+
+
+
+class AsyncRunnerTests(AsyncOfflineTestCase):
+    
+    def test_concurrent_guarded_creates_share_one_fetch(self):
+        mailbox = wfa.Mailbox(self.runner)
+        results = self.gather(*[mailbox.create_mailbox(mailbox="box{0}".format(index))
+                                for index in range(5)])
+        
+        self.assertEqual([result["mailbox"] for result in results],
+                         ["box{0}".format(index) for index in range(5)])
+        self.assertEqual(self.sent.count("list_mailboxes"), 1)
+        self.assertEqual(len(self.state("mailboxes")), 5)
+    
+    
+    def test_guard_turns_back_duplicate_unsent(self):
+        mailbox = wfa.Mailbox(self.runner)
+        self.assertIsNotNone(self.run_async(mailbox.create_mailbox(mailbox="box")))
+        self.assertIsNone(self.run_async(mailbox.create_mailbox(mailbox="box")))
+        
+        self.assertEqual(self.sent, ["list_mailboxes", "create_mailbox"])
+        self.assertEqual(self.runner.result_counts()[wf.FAILURE], 1)
+    
+    
+    def test_sync_only_blocks_raise(self):
+        for block in (self.runner.parallel, self.runner.graph, self.runner.batch):
+            self.assertRaises(TypeError, block)
+        self.assertRaises(TypeError, self.runner.run_graph, wf.TaskGraph())
+    
+    
+    def test_connections_are_kept_alive(self):
+        mailbox = wfa.Mailbox(self.runner)
+        for _ in range(5):
+            self.run_async(mailbox.list_mailboxes())
+        
+        self.assertEqual(len(self.connections), 1)
+    
+    
+    def test_expired_session_is_renewed(self):
+        session_id = self.runner.session_id
+        self.server.api.expire_sessions()
+        
+        self.assertEqual(self.run_async(wfa.Mailbox(self.runner).list_mailboxes()), [])
+        self.assertNotEqual(self.runner.session_id, session_id)
+        self.assertEqual(self.sent, ["list_mailboxes"] * 2)
+    
+    
+    def slow_lists(self, delay):
+        dispatch = self.server.api._dispatch
+        def slow_dispatch(method, params):
+            result = dispatch(method, params)
+            if method.startswith("list_"):
+                time.sleep(delay)
+            return result
+        self.server.api._dispatch = slow_dispatch
+    
+    
+    def test_fetch_overlapping_a_change_is_made_again(self):
+        self.server.api.create_mailbox("box")
+        self.slow_lists(0.2)
+        mailbox = wfa.Mailbox(self.runner)
+        
+        async def delete_during_fetch():
+            await asyncio.sleep(0.1)
+            self.server.api.delete_mailbox("box")
+            self.runner.remove_from_inventory("list_mailboxes", "box")
+        
+        inventory = self.gather(self.runner.inventory(mailbox.list_mailboxes),
+                                delete_during_fetch())[0]
+        self.assertNotIn("box", inventory)
+        self.assertEqual(self.sent, ["list_mailboxes"] * 2)
+    
+    
+    def test_cancelled_caller_leaves_fetch_to_others(self):
+        self.server.api.create_mailbox("box")
+        self.slow_lists(0.2)
+        mailbox = wfa.Mailbox(self.runner)
+        
+        async def cancel_first_caller():
+            first = asyncio.ensure_future(self.runner.inventory(mailbox.list_mailboxes))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(self.runner.inventory(mailbox.list_mailboxes))
+            await asyncio.sleep(0.05)
+            first.cancel()
+            return await second
+        
+        self.assertIn("box", self.run_async(cancel_first_caller()))
+        self.assertEqual(self.sent, ["list_mailboxes"])
+        self.assertIn("box", self.run_async(self.runner.inventory(mailbox.list_mailboxes)))
+        self.assertEqual(self.sent, ["list_mailboxes"])
+
+#/AsyncRunnerTests
+
+
+
+class AsyncConcurrencyTests(AsyncOfflineTestCase):
+    
+    runner_options = {"max_concurrency": 2}
+    
+    def test_in_flight_calls_are_limited(self):
+        dispatch = self.server.api._dispatch
+        in_flight = [0]
+        peaks = []
+        lock = threading.Lock()
+        
+        def slow_dispatch(method, params):
+            with lock:
+                in_flight[0] += 1
+                peaks.append(in_flight[0])
+            time.sleep(0.05)
+            with lock:
+                in_flight[0] -= 1
+            return dispatch(method, params)
+        
+        self.server.api._dispatch = slow_dispatch
+        mailbox = wfa.Mailbox(self.runner)
+        self.gather(*[mailbox.list_mailboxes() for _ in range(8)])
+        
+        self.assertEqual(max(peaks), 2)
+        self.assertLessEqual(len(self.connections), 2)
+
+#/AsyncConcurrencyTests
+
+
+
+class AsyncBulkTests(AsyncOfflineTestCase):
+    
+    def writes(self):
+        return [method for method in self.sent
+                if not method.startswith("list_")]
+    
+    
+    def test_mailbox_records(self):
+        mailbox = wfa.Mailbox(self.runner)
+        self.run_async(mailbox.create_mailbox(mailbox="existing"))
+        
+        report = self.run_async(mailbox.create_mailbox_records(
+                                    ["existing", "box1", "box2", "box1"],
+                                    concurrency=2))
+        self.assertEqual([(row.key, row.outcome) for row in report.rows],
+                         [("existing", wf.SKIPPED),
+                          ("box1", wf.SUCCESS),
+                          ("box2", wf.SUCCESS),
+                          ("box1", wf.SKIPPED)])
+        
+        report = self.run_async(mailbox.change_mailbox_password_records(
+                                    [("box1", "s3cret-password")]))
+        self.assertEqual(report.counts(), {wf.SUCCESS: 1})
+        self.assertNotIn("s3cret-password", self.runner.report())
+    
+    
+    def test_bulk_signatures_match_runner(self):
+        progress = []
+        count = lambda settled, total: progress.append((settled, total))
+        report = self.run_async(wfa.Email(self.runner).create_emails(
+                                    "example.com", ["info", "sales"], "postmaster",
+                                    2, 10, count))
+        self.assertEqual(report.counts(), {wf.SUCCESS: 2})
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        
+        report = self.run_async(wfa.Mailbox(self.runner).create_mailbox_records(
+                                    ["box"], None, 10, count))
+        self.assertEqual(report.counts(), {wf.SUCCESS: 1})
+        self.assertEqual(progress[-1], (1, 1))
+    
+    
+    def test_create_and_delete_emails(self):
+        email = wfa.Email(self.runner)
+        report = self.run_async(email.create_emails(domain="example.com",
+                                                    targets="postmaster"))
+        self.assertEqual(report.counts(), {wf.SUCCESS: len(self.state("emails"))})
+        
+        report = self.run_async(email.delete_emails(domain="example.com"))
+        self.assertEqual(report.failures(), [])
+        self.assertEqual(list(self.state("emails")), [])
+    
+    
+    def test_dns_sync_sends_only_changes(self):
+        dns = wfa.DNS(self.runner)
+        zone = [("example.com", "a_ip", "192.0.2.1"),
+                ("www.example.com", "cname", "example.com")]
+        self.run_async(dns.sync_dns_overrides(zone))
+        self.assertEqual(self.writes(), ["create_dns_override"] * 2)
+        
+        del self.sent[:]
+        report = self.run_async(dns.sync_dns_overrides(zone))
+        self.assertEqual(self.writes(), [])
+        self.assertEqual(report.counts(), {wf.SKIPPED: 2})
+    
+    
+    def test_provision_dbs_and_sync_users(self):
+        report = self.run_async(wfa.Database(self.runner).provision_dbs(
+                    {"users": [{"username": "reader", "password": "secret",
+                                "db_type": "postgresql"}],
+                     "dbs": [{"name": "shop", "db_type": "postgresql",
+                              "grants": ["reader"]}]}))
+        self.assertEqual(report.counts(), {wf.SUCCESS: 3})
+        
+        report = self.run_async(wfa.ShellUser(self.runner).sync_users(
+                    [("alice", "bash", [], "pw")]))
+        self.assertEqual(self.writes()[-2:], ["create_user", "change_user_password"])
+        self.assertEqual(report.failures(), [])
+
+#/AsyncBulkTests
+
+
 if __name__ == "__main__":
     run_tests()
 